@@ -23,6 +23,7 @@ import importlib, os
 
 import altered.settings as sts
 import altered.arguments as arguments
+from altered.server_daemon import forward
 from datetime import datetime as dt
 import re
 
@@ -31,7 +32,9 @@ def runable(*args, api, **kwargs):
     """
     imports api as a package
     returns the runable result
+    shell names may use hyphens, i.e. 'profile-imports' runs api_profile_imports.py
     """
+    api = api.replace('-', '_')
     if not api.startswith('api_'):
         api = f"api_{api}"
     if not os.path.exists(os.path.join(sts.package_dir, f"{api}.py")):
@@ -47,14 +50,18 @@ def main(*args, **kwargs):
     """
     to runable from shell these arguments are passed in
     runs api if legidemit and prints outputs
+    a running daemon (alter daemon) runs the api in its warm process, see server_daemon.py
     """
     kwargs = arguments.mk_args()
     # the imported api runable package is executed
     if kwargs.get("api") == "help":
         print(  f"{Fore.YELLOW}__main__:{Fore.RESET} "
                 f"For parameter and package info, run: 'alter info'")
-    else:
-        return runable(*args, **kwargs).main(*args, **kwargs)
+        return
+    served, result = forward(kwargs)
+    if served:
+        return result
+    return runable(*args, **kwargs).main(*args, **kwargs)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,22 @@
+"""
+api_daemon.py
+Starts the resident altered daemon, alter commands are then forwarded to its warm
+process over a Unix socket (server_daemon.py). Stop it with Ctrl+C.
+Set ALTERED_DAEMON=0 to run a single command in-process anyway.
+
+Run like: alter daemon
+"""
+
+import socket
+from colorama import Fore
+
+from altered.server_daemon import Daemon
+
+
+def main(*args, **kwargs) -> dict:
+    if not hasattr(socket, 'AF_UNIX'):
+        print(f"{Fore.RED}api_daemon: this system has no Unix sockets{Fore.RESET}")
+        return {}
+    daemon = Daemon(*args, **kwargs)
+    daemon.serve()
+    return daemon.stats()
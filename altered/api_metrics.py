@@ -0,0 +1,53 @@
+"""
+api_metrics.py
+Prints latency percentiles, throughput and error rates per model and server.
+The numbers live in the process that made the model calls, so the running api_server
+is asked first (GET /metrics), the local process is the fallback.
+
+Run like: alter metrics
+"""
+
+import os
+import httpx
+from colorama import Fore
+from tabulate import tabulate as tb
+
+from altered.model_metrics import metrics
+
+
+def get_metrics(*args, port: int = None, timeout: float = 2, **kwargs) -> dict:
+    port = port or os.environ.get('port')
+    if port:
+        try:
+            r = httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=timeout)
+            r.raise_for_status()
+            return r.json()['models']
+        except httpx.HTTPError as e:
+            print(f"{Fore.YELLOW}api_metrics: api_server not reachable ({e}){Fore.RESET}")
+    return metrics.summary()
+
+
+def mk_table(summary: dict, *args, **kwargs) -> list:
+    rows = []
+    for key, s in summary.items():
+        row = {
+                'model|server': key,
+                'requests': s['requests'],
+                'error_rate': s['error_rate'],
+                'req/s': s['requests_per_sec'],
+                'tok/s': s['tokens_per_sec'],
+        }
+        for col in ('ttft', 'server_time', 'total_time'):
+            for p in ('p50', 'p90', 'p99'):
+                row[f"{col} {p}"] = s.get(col, {}).get(p)
+        rows.append(row)
+    return rows
+
+
+def main(*args, **kwargs) -> dict:
+    summary = get_metrics(*args, **kwargs)
+    if not summary:
+        print(f"{Fore.YELLOW}api_metrics: no model calls recorded yet{Fore.RESET}")
+        return summary
+    print(tb(mk_table(summary), headers='keys', tablefmt='simple'))
+    return summary
@@ -0,0 +1,114 @@
+"""
+api_profile_imports.py
+Reports the import cost of the altered entry points per package and module. Every
+target is imported in a fresh interpreter with python -X importtime, so modules already
+imported by an earlier target do not hide their cost. Heavy dependencies should be
+loaded lazily (hlp_lazy.py) where a command does not need them.
+
+Targets are altered.__main__ and all api modules, -rx filters the api modules.
+
+Run like: alter profile-imports
+          alter profile-imports -rx "quick|thought" -v 1
+"""
+
+import os, re, subprocess, sys, time
+from typing import Any, Dict, List
+from colorama import Fore
+from tabulate import tabulate as tb
+
+import altered.settings as sts
+
+# import time:       self [us] |  cumulative | imported package
+line_regex = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+
+
+def parse_importtime(stderr: str, *args, **kwargs) -> List[Dict[str, Any]]:
+    """
+    Returns one row per imported module with its own and cumulative import seconds
+    and its nesting depth, in import order.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = line_regex.match(line)
+        if match:
+            us_self, us_cum, indent, name = match.groups()
+            rows.append({
+                            'module': name,
+                            'self': int(us_self) / 1e6,
+                            'cumulative': int(us_cum) / 1e6,
+                            'depth': (len(indent) - 1) // 2,
+            })
+    return rows
+
+
+def get_targets(*args, file_match_regex: str = None, **kwargs) -> List[str]:
+    apis = sorted(f[:-3] for f in os.listdir(sts.package_dir)
+                                    if f.startswith('api_') and f.endswith('.py'))
+    if file_match_regex:
+        apis = [api for api in apis if re.search(file_match_regex, api)]
+    return ['altered.__main__'] + [f"altered.{api}" for api in apis]
+
+
+def profile(module: str, *args, timeout: float = 120, **kwargs) -> Dict[str, Any]:
+    """Imports module in a fresh interpreter, returns its import times per package."""
+    start = time.time()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                          capture_output=True, text=True, timeout=timeout,
+                          cwd=sts.project_dir)
+    wall = time.time() - start
+    rows = parse_importtime(proc.stderr)
+    packages = {}
+    for row in rows:
+        package = row['module'].split('.')[0]
+        packages[package] = packages.get(package, 0.0) + row['self']
+    error = None
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ['unknown error'])[-1]
+    return {
+            'module': module,
+            'total': sum(row['self'] for row in rows),
+            'wall': wall,
+            'packages': dict(sorted(packages.items(), key=lambda kv: -kv[1])),
+            'modules': sorted(rows, key=lambda row: -row['self']),
+            'error': error,
+    }
+
+
+def mk_table(results: List[Dict[str, Any]], *args, top: int = 3, **kwargs) -> list:
+    rows = []
+    for r in results:
+        heavy = [f"{p} {s:.2f}" for p, s in r['packages'].items() if p != 'altered'][:top]
+        rows.append({
+                        'target': r['module'],
+                        'import s': round(r['total'], 3),
+                        'altered s': round(r['packages'].get('altered', 0.0), 3),
+                        'wall s': round(r['wall'], 3),
+                        'heaviest packages': ', '.join(heavy),
+                        'error': r['error'] or '',
+        })
+    return rows
+
+
+def mk_details(result: Dict[str, Any], *args, top: int = 15, verbose: int = 0, **kwargs
+                ) -> list:
+    """The costliest packages, with verbose >= 2 the costliest single modules."""
+    if verbose >= 2:
+        return [{'module': row['module'], 'self s': round(row['self'], 4),
+                 'cumulative s': round(row['cumulative'], 4)}
+                                                        for row in result['modules'][:top]]
+    return [{'package': package, 'self s': round(seconds, 4),
+             'share': f"{seconds / result['total']:.0%}" if result['total'] else ''}
+                                    for package, seconds in list(result['packages'].items())[:top]]
+
+
+def main(*args, verbose: int = 0, **kwargs) -> list:
+    results = []
+    for module in get_targets(*args, **kwargs):
+        print(f"{Fore.YELLOW}profiling:{Fore.RESET} {module}", end='\r')
+        results.append(profile(module, *args, **kwargs))
+    print(tb(mk_table(results), headers='keys', tablefmt='simple'))
+    if verbose:
+        for r in results:
+            print(f"\n{Fore.YELLOW}{r['module']}{Fore.RESET} {r['total']:.3f} s")
+            print(tb(mk_details(r, verbose=verbose), headers='keys', tablefmt='simple'))
+    return results
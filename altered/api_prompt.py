@@ -11,16 +11,18 @@ import altered.settings as sts
 import altered.hlp_printing as hlpp
 import altered.contracts as contracts
 from altered.prompt import Prompt
+from altered.pipeline_pool import pipelines
 
 required_args = {'user_prompt',}
 
 def prompt(*args, api:str, **kwargs):
     """
-    Display basic information about the system and configuration
-    Returns a dictionary containing the information
+    Renders the prompt of the api with a warm Prompt of the kwargs_defaults profile
+    Returns the rendered prompt
     """
     kwargs.update(contracts.checks(*args, **kwargs))
-    return Prompt(api, *args, **kwargs)(*args, **kwargs)
+    with pipelines.borrow(Prompt, api, *args, **kwargs) as p:
+        return p(*args, **kwargs).data
     # hlpp.pretty_prompt(prompt.data, *args, verbose=verbose, **kwargs)
 
 
@@ -29,7 +31,7 @@ def main(*args, **kwargs):
     Main entry point for the prompt API
     Returns the result of the prompt function
     """
-    p = json.dumps(prompt(*args, **kwargs).data)
+    p = json.dumps(prompt(*args, **kwargs))
     # print(f"{Fore.RED}{p = }{Fore.RESET}")
     contracts.write_tempfile(*args, content=p, **kwargs)
     # with open("C:/Users/lars/python_venvs/api_prompt.log", "w", encoding='utf-8') as f:
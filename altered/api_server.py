@@ -1,15 +1,21 @@
 # api_server.py
 # for logging set module_logger.setLevel(logging.INFO) to DEBUG
 import uvicorn
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import importlib, json, logging, os, pyttsx3, sys
+import asyncio, importlib, importlib.util, json, logging, os, sys
 from pathlib import Path
 from colorama import Fore, Style
 # --- Pre-load your altered_bytes package components ---
 # These are assumed to be in the python path
 import altered.settings as sts
 from altered.hlp_directories import manage_log_files
+from altered.hlp_lazy import lazy_import
+from altered.server_executor import executor, Saturated
+from altered.server_jobs import jobs
+
+pyttsx3 = lazy_import('pyttsx3')
 
 # Create a logger instance for this module
 module_logger = logging.getLogger(__name__)
@@ -115,13 +121,27 @@ async def startup_event():
     manage_log_files(sts.prompt_logs_dir, age_days=7)
     _speak_message(f"Altered Bytes API server is running on port {port}!")
     # await _preload_on_startup()
+    # loads the most used models in the background (model_residency.py)
+    from altered.model_residency import residency
+    asyncio.get_running_loop().run_in_executor(None, residency.preload)
+    # persisted jobs queued at the last shutdown run again (server_jobs.py)
+    jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stops the api worker pools and the job workers, see server_executor.py"""
+    executor.shutdown()
+    jobs.shutdown()
 
 # --- API Endpoint (Simplified) ---
 @app.post("/call/", response_model=APIResponseData)
-async def handle_api_call(payload: dict = Body(...)):
+async def handle_api_call(payload: dict = Body(...), response: Response = None):
     """
     Receives a request, dynamically imports the specified API module,
     and executes its main function with the request payload.
+    main runs in the worker pools of server_executor.py, so the event loop stays free.
+    Saturated apis answer 429 or 503 with a Retry-After header, the X-Queue-Wait
+    header holds the seconds the request waited for a worker.
     """
     module_logger.debug(f"Received API call with payload: {payload}")
     module_file_name = check_payload(payload)
@@ -131,8 +151,10 @@ async def handle_api_call(payload: dict = Body(...)):
                             f"Attempting to import and run: {module_file_name} "
                             f"Calling {module_file_name}.main() with {payload = }."
                             )
-        # Dynamically import the target module and call it
-        result = importlib.import_module(module_file_name).main(**payload)
+        # Dynamically import the target module and call it off the event loop
+        result, wait = await executor.run(payload['api'], module_file_name, payload)
+        if response is not None:
+            response.headers['X-Queue-Wait'] = f"{wait:.3f}"
         # Log the result for debugging
         module_logger.debug(f"Result {result = }")
         # NEW: Handle if the module returns a JSON string
@@ -150,6 +172,10 @@ async def handle_api_call(payload: dict = Body(...)):
         else:
             # If not a dict or valid JSON string, wrap the result.
             return APIResponseData(response=result, log_path=None)
+    except Saturated as e:
+        module_logger.warning(f"{module_file_name}: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e),
+                            headers={'Retry-After': str(max(int(e.retry_after), 1))})
     except ImportError:
         msg = f"API module not found for '{module_file_name =}'."
         module_logger.error(msg, exc_info=True)
@@ -165,6 +191,156 @@ async def handle_api_call(payload: dict = Body(...)):
             detail=f"Internal Server Error for API '{module_file_name =}'. Check logs."
         )
 
+# --- Streaming Endpoint ---
+stream_media_types = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+def _stream_lines(items, stream_fmt: str):
+    """Encodes streamed items as NDJSON lines or server-sent events."""
+    for item in items:
+        line = json.dumps(item)
+        yield f"data: {line}\n\n" if stream_fmt == 'sse' else f"{line}\n"
+
+@app.post("/stream/")
+async def handle_api_stream(payload: dict = Body(...)):
+    """
+    Like /call/, but streams the model output while it is generated.
+    The api module must provide a stream(**payload) generator (i.e. api_thought.stream).
+    payload['stream_fmt'] selects 'ndjson' (default) or 'sse'.
+    Example:
+        curl -N -X POST localhost:$port/stream/ -H "Content-Type: application/json" \
+            -d '{"api": "thought", "user_prompt": "Why is the sky blue?"}'
+    """
+    module_logger.debug(f"Received API stream with payload: {payload}")
+    module_file_name = check_payload(payload)
+    stream_fmt = payload.pop('stream_fmt', 'ndjson')
+    if stream_fmt not in stream_media_types:
+        raise HTTPException(status_code=400, detail=f"Unknown stream_fmt '{stream_fmt}'.")
+    try:
+        module = importlib.import_module(module_file_name)
+    except ImportError:
+        msg = f"API module not found for '{module_file_name =}'."
+        module_logger.error(msg, exc_info=True)
+        raise HTTPException(status_code=404, detail=msg)
+    if not hasattr(module, 'stream'):
+        raise HTTPException(status_code=404,
+                            detail=f"API '{module_file_name}' does not support streaming.")
+    # a sync generator is iterated in the threadpool, so the event loop is not blocked
+    return StreamingResponse(   _stream_lines(module.stream(**payload), stream_fmt),
+                                media_type=stream_media_types[stream_fmt],
+            )
+
+
+# --- Job Endpoints ---
+def _get_job(job_id: str, *args, **kwargs) -> dict:
+    job = jobs.get(job_id, *args, **kwargs)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
+
+@app.post("/jobs/", status_code=202)
+async def submit_job(payload: dict = Body(...)) -> dict:
+    """
+    Queues the api call of payload as a job and returns its id at once, see server_jobs.py.
+    A full job queue answers 503 with a Retry-After header.
+    Example:
+        curl -X POST localhost:$port/jobs/ -H "Content-Type: application/json" \
+            -d '{"api": "thought", "user_prompt": "Why is the sky blue?"}'
+    """
+    module_logger.debug(f"Received job with payload: {payload}")
+    module_file_name = check_payload(payload)
+    if importlib.util.find_spec(module_file_name) is None:
+        raise HTTPException(status_code=404,
+                            detail=f"API module not found for '{module_file_name =}'.")
+    try:
+        return jobs.submit(payload['api'], module_file_name, payload)
+    except Saturated as e:
+        module_logger.warning(f"{module_file_name}: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e),
+                            headers={'Retry-After': str(max(int(e.retry_after), 1))})
+
+@app.get("/jobs/")
+async def job_stats() -> dict:
+    """Queue depth, jobs per status and wait, first chunk and run time percentiles."""
+    return jobs.stats()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str) -> dict:
+    """Status, queue position, partial output count and stage timings of a job."""
+    return _get_job(job_id)
+
+@app.get("/jobs/{job_id}/result", response_model=APIResponseData)
+async def job_result(job_id: str):
+    """
+    The result of a done job. Unfinished jobs answer 409, failed jobs 500 and
+    cancelled jobs 410.
+    """
+    job = _get_job(job_id, result=True)
+    if job['status'] == 'done':
+        result = job['result']
+        if isinstance(result, dict) and "response" in result:
+            return APIResponseData(**result)
+        return APIResponseData(response=result, log_path=None)
+    status_code = {'failed': 500, 'cancelled': 410}.get(job['status'], 409)
+    raise HTTPException(status_code=status_code,
+                        detail=f"Job '{job_id}' is {job['status']}. {job['error'] or ''}".strip())
+
+@app.get("/jobs/{job_id}/stream")
+async def job_stream(job_id: str, offset: int = 0, stream_fmt: str = 'ndjson'):
+    """
+    Streams the partial output of a job from offset on while it is generated, the last
+    item {'done': True, 'status': ..., 'result': ...} closes the stream.
+    Example:
+        curl -N "localhost:$port/jobs/$job_id/stream?offset=0"
+    """
+    if stream_fmt not in stream_media_types:
+        raise HTTPException(status_code=400, detail=f"Unknown stream_fmt '{stream_fmt}'.")
+    _get_job(job_id)
+    return StreamingResponse(   _stream_lines(jobs.follow(job_id, offset=offset), stream_fmt),
+                                media_type=stream_media_types[stream_fmt],
+            )
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str) -> dict:
+    """Cancels a job, a running non streaming api finishes but its result is discarded."""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
+
+
+@app.get("/metrics")
+async def metrics(model: str = None, server: str = None) -> dict:
+    """
+    Latency percentiles, throughput and error rate per model and server, plus the
+    response cache, coalescing, hedging, scheduler, residency and http client pool
+    counters, the api worker pools, the warm pipeline pool and the job queue.
+    Cheap to query, see model_metrics.py.
+    Example:
+        curl "localhost:$port/metrics?model=llama3.2:3b"
+    """
+    from altered.model_metrics import metrics as model_metrics
+    from altered.model_cache import cache
+    from altered.model_client_pool import clients
+    from altered.model_coalesce import single_flight
+    from altered.model_hedge import hedger
+    from altered.model_scheduler import scheduler
+    from altered.model_residency import residency
+    from altered.model_prefix import prefixes
+    from altered.pipeline_pool import pipelines
+    return {
+            'models': model_metrics.summary(model=model, server=server),
+            'cache': cache.stats(),
+            'coalesce': single_flight.stats(),
+            'hedge': hedger.stats(),
+            'scheduler': scheduler.stats(),
+            'residency': residency.stats(),
+            'prefix': prefixes.stats(),
+            'clients': clients.stats(),
+            'executor': executor.stats(),
+            'pipelines': pipelines.stats(),
+            'jobs': jobs.stats(),
+    }
+
 
 @app.get("/ping")
 async def ping() -> dict:
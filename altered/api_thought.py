@@ -4,13 +4,17 @@ api_thought.py
 
 from colorama import Fore, Style, Back
 from datetime import datetime as dt
-import pyperclip as pc
-import json, os, re, pyttsx3
+import json, os, re
 
 import altered.settings as sts
 import altered.hlp_printing as hlpp
 from altered.thought import Thought
+from altered.pipeline_pool import pipelines
 import altered.contracts as contracts
+from altered.hlp_lazy import lazy_import
+
+pc = lazy_import('pyperclip')
+pyttsx3 = lazy_import('pyttsx3')
 
 
 @sts.logs_timeit.timed("api_thought.thought")
@@ -22,8 +26,10 @@ def thought(*args, api: str, verbose: int, application:str='powershell', **kwarg
     try:
         # with open('C:/temp/api_thought.log', 'a') as l: 
         #     l.write(f"thought0:\n\n{re.sub(r'([: .])', '-', str(dt.now()))}: \n{args = }\n{kwargs = }")
-        thought = Thought(api, *args, verbose=verbose, api=api, **kwargs)
-        response = thought.think(*args, verbose=verbose, **kwargs)
+        # a warm Thought of this kwargs_defaults profile, see pipeline_pool.py
+        with pipelines.borrow(Thought, api, *args, verbose=verbose, api=api, **kwargs
+                                                                                ) as thought:
+            response = thought.think(*args, verbose=verbose, **kwargs)
         hlpp.play_sound('RESPONSE2')
         if response is None:
             msg = "ERROR: api_thought.thought: Response is None!"
@@ -54,6 +60,35 @@ def thought(*args, api: str, verbose: int, application:str='powershell', **kwarg
             f.write(f"\n{re.sub(r'([: .])', '-', str(dt.now()))}: \n{args = }\n{kwargs = }\n{msg = }\n")
         return msg
 
+def stream_thought(*args, api: str, verbose: int, **kwargs):
+    """
+    Streaming counterpart of thought. Yields {'chunk': str, 'done': False} while the model
+    generates, the final item {'done': True, 'response': str, 'log_path': str} carries the
+    validated response text.
+    """
+    try:
+        with pipelines.borrow(Thought, api, *args, verbose=verbose, api=api, **kwargs
+                                                                                ) as thought:
+            for item in thought.think(*args, stream=True, verbose=verbose, **kwargs):
+                if not item['done']:
+                    yield item
+                    continue
+                response = item.get('response')
+                if not response or not response.get('response'):
+                    msg = "ERROR: api_thought.stream_thought: No model response in response dict!"
+                    print(f"{Fore.RED}{msg}{Fore.RESET}")
+                    yield {'done': True, 'response': None, 'error': msg}
+                    return
+                response_text = response.get('response', '').strip()
+                log_path = os.path.join(sts.logs_dir, 'prompts', f"{sts.time_stamp()}_response.md" )
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                log_response(response_text, log_path, *args, **kwargs)
+                yield {'done': True, 'response': response_text, 'log_path': log_path}
+    except Exception as e:
+        msg = f"ERROR: altered.api_thought.stream_thought: {e}"
+        print(f"{Fore.RED}{msg}{Fore.RESET}")
+        yield {'done': True, 'response': None, 'error': msg}
+
 def copy_response(response: str, *args, to_clipboard: bool = False, **kwargs):
     """
     Copy code snippets from a markdown response to the clipboard.
@@ -136,6 +171,8 @@ def main(*args, **kwargs) -> str:
     Returns the result of the thought function
     """
     kwargs.update(contracts.checks(*args, **kwargs))
+    # editor prompts are user facing, they go first in the model queues (model_scheduler.py)
+    kwargs.setdefault('priority', 'interactive')
     # with open(os.path.join(sts.logs_dir, 'server', 'api_thought_kwargs.log'), 'a') as f:
     #     f.write(f"\n\n{re.sub(r"([: .])", r"-" , str(dt.now()))}: \n{kwargs = }")
     r = thought(*args, **kwargs)
@@ -143,6 +180,15 @@ def main(*args, **kwargs) -> str:
     contracts.write_tempfile(*args, content=r, **kwargs)
     return r
 
+def stream(*args, **kwargs):
+    """
+    Streaming entry point for the thought API, used by api_server /stream/
+    Yields the items of stream_thought.
+    """
+    kwargs.update(contracts.checks(*args, **kwargs))
+    kwargs.setdefault('priority', 'interactive')
+    yield from stream_thought(*args, **kwargs)
+
 
 if __name__ == "__main__":
     main()
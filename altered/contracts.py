@@ -3,7 +3,6 @@ import importlib, os, re, sys, yaml
 from datetime import datetime as dt
 from colorama import Fore, Style
 from dotenv import load_dotenv
-import pyttsx3
 
 import altered.settings as sts
 import altered.arguments as arguments
@@ -11,6 +10,10 @@ import altered.hlp_printing as hlpp
 from altered.hlp_directories import normalize_path as normpath
 # from altered.hlp_directories import set_workdir
 from altered.hlp_dir_context import DirContext
+from altered.hlp_lazy import lazy_import
+
+# text to speech loads its engines at import, only needed when something is spoken
+pyttsx3 = lazy_import('pyttsx3')
 
 
 def checks(*args, verbose:int=0, **kwargs):
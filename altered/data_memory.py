@@ -3,7 +3,7 @@ import csv, os, re
 from colorama import Fore, Style, Back
 import pandas as pd
 from altered.data_vectorized import VecDB
-from altered.model_params import config as config
+import altered.model_params as msts
 import altered.settings as sts
 import altered.hlp_printing as hlpp
 
@@ -32,7 +32,8 @@ class VecDB(Data):
     - NumPy array for storing the embeddings of the data.
     """
     mem_file_ext = 'npy'
-    embedding_model = msts.config.overwrites.get('get_embeddings').get('model')
+    # None: models_servers.yml overwrites.get_embeddings.model, read at the first VecDB
+    embedding_model = None
     # default_data_dir handles where table data are stored and loaded
     default_data_dir = os.path.join(sts.resources_dir, 'vec_db')
     # vec_fields_path is the path to the fields file for the table creator
@@ -46,6 +47,8 @@ class VecDB(Data):
         Args:
             model (str): The model name for generating embeddings.
         """
+        if self.embedding_model is None:
+            self.embedding_model = msts.config.overwrites.get('get_embeddings').get('model')
         u_fields_paths = self.load_vec_fields(*args, u_fields_paths=u_fields_paths, **kwargs)
         super().__init__(*args, name=name, u_fields_paths=u_fields_paths, **kwargs, )
         self.dtype = np.float32
@@ -120,13 +123,16 @@ class VecDB(Data):
         """
         return hashlib.sha256(vector[:self.embed_match_len].tobytes()).hexdigest()[:num]
 
-    def embedds(self, contents: List[str], *args, model:str=None, **kwargs) -> np.ndarray:
+    def embedds(self, contents: Union[str, List[str]], *args, model:str=None, **kwargs
+                    ) -> np.ndarray:
         """
         Retrieves embeddings for the given contents from the server.
+        A list of contents is embedded in batches within a single post.
         Args:
-            contents: The contents to be embedded.
+            contents: The content (str) or list of contents to be embedded.
         Returns:
-            An ndarray representing the embeddings.
+            An ndarray representing the embeddings. 1-D for a single str,
+            2-D (len(contents), embedd_size) for a list of contents.
         """
         # add this for getting the embedding directly
         assert contents, f"{Fore.RED}ERROR: VecDB.embedds: Contents is empty !{Fore.RESET}"
@@ -134,12 +140,15 @@ class VecDB(Data):
             print(  f"{Fore.YELLOW}WARNING: VecDB.embedds.embedding_model: "
                     f"{model} != {self.embedding_model} {Fore.RESET}"
                     f"continuing with {self.embedding_model = }")
-        return self.assi.post(
-                                contents, 
+        is_single = isinstance(contents, str)
+        responses = self.assi.post(
+                                [contents] if is_single else list(contents),
                                 service_endpoint=self.service_endpoint,
                                 model=self.embedding_model,
                                 **kwargs
-                ).get('responses')[0].get('embedding')
+                ).get('responses')
+        vectors = np.array([r.get('embedding') for r in responses])
+        return vectors[0] if is_single else vectors
 
     def normalize(self, vector: np.ndarray, ord: int = 2):
         """
@@ -158,8 +167,9 @@ class VecDB(Data):
         return np.stack((embedded, normalized))[None, ...]
 
     def append(self, record:Dict[str, Any], *args, **kwargs) -> None:
-        # first we create a new vector to be added to self.vectors
-        new_vec = self.mk_new_vector(record['content'], *args, **kwargs)
+        # first we create a new vector to be added to self.vectors, ingestion is bulk work
+        new_vec = self.mk_new_vector(record['content'], *args,
+                                        **dict(kwargs, priority='background'))
         # then we update the record to be added, with the generated hash (normalized)
         record['name'], record['hash'] = self.name, self.hashify(new_vec[0, 1])
         # we want to avoid table inconsistencies (unlikely but possible)
@@ -0,0 +1,84 @@
+"""
+hlp_lazy.py
+Lazy imports for heavy dependencies (pandas, openai, requests, playwright, ...).
+A lazy module is registered in sys.modules right away, its code runs at the first
+attribute access. Commands that never touch it do not pay its import time, see
+'alter profile-imports' (api_profile_imports.py) for the import cost per module.
+
+Module singletons that read models_servers.yml are built lazily too, lazy_instance
+returns a stand-in that constructs the object at its first attribute access.
+
+Import: from altered.hlp_lazy import lazy_import, lazy_instance
+    pd = lazy_import('pandas')
+    pd.DataFrame(rows)      # pandas is imported here
+    tokens = lazy_instance(TokenCounter)
+    tokens.count(text)      # TokenCounter() reads the config here
+"""
+
+import importlib.util, sys, threading
+from types import ModuleType
+from typing import Any, Callable
+
+lock = threading.Lock()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns module name without executing it. Already imported modules are returned
+    as they are, a missing module raises ModuleNotFoundError at once, not at first use.
+    """
+    with lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
+
+
+class LazyInstance:
+    """
+    Stands in for factory(*args, **kwargs), which is called once at the first attribute
+    access. Attributes are read from and written to the instance (mock.patch works).
+    """
+
+    def __init__(self, factory: Callable, *args, **kwargs) -> None:
+        object.__setattr__(self, '_lazy', (factory, args, kwargs))
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get(self) -> Any:
+        instance = object.__getattribute__(self, '_instance')
+        if instance is None:
+            with object.__getattribute__(self, '_lock'):
+                instance = object.__getattribute__(self, '_instance')
+                if instance is None:
+                    factory, args, kwargs = object.__getattribute__(self, '_lazy')
+                    instance = factory(*args, **kwargs)
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._get(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._get(), name)
+
+    def __repr__(self) -> str:
+        instance = object.__getattribute__(self, '_instance')
+        if instance is None:
+            return f"<lazy {object.__getattribute__(self, '_lazy')[0].__name__}>"
+        return repr(instance)
+
+
+def lazy_instance(factory: Callable, *args, **kwargs) -> Any:
+    """Returns a LazyInstance of factory(*args, **kwargs)."""
+    return LazyInstance(factory, *args, **kwargs)
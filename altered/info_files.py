@@ -31,6 +31,12 @@ class Tree:
         self.matched_files: Set[str] = set()
         self.disc_sym = "    | ..."  # Symbol indicating skipped directories
 
+    def reset(self, *args, **kwargs):
+        """
+        Forgets the files matched by the last call.
+        """
+        self.matched_files = set()
+
     def handle_ignoreds(self, subdir: str, dirs: list, indent_level: str) -> str:
         """
         Handles ignored directories by adding them to the tree but not traversing into them.
@@ -29,6 +29,13 @@ class PackageInfo:
         if not self.root_dir:
             raise RuntimeError("Root directory not found.")
         self.work_file_name = self.handle_file_name(*args, **kwargs)
+        self.reset(*args, **kwargs)
+
+    def reset(self, *args, **kwargs):
+        """
+        Starts a new, empty import graph. A reused instance would otherwise skip all
+        visited files and add its edges to the previous graph.
+        """
         self.graph = graphviz.Digraph(comment='Package Dependency Graph')
         self.visited_files = set()
         self.incoming_edges = {}  # Track incoming edges for each node
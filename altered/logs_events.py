@@ -1,6 +1,5 @@
-import os
 import logging
-from datetime import datetime
+from altered.logs_timeit import DailyFileHandler
 
 # Create a dedicated logger for events.
 event_logger = logging.getLogger("event_logger")
@@ -12,33 +11,18 @@ def init_event_logger(logs_path: str, logs_name: str) -> None:
     file handler and formatter. This configuration ensures that only one log
     file per day is created. If a file for today exists, it is reused.
     A header line containing the runtime timestamp is written to a new file.
+    The file is looked up when the first event is logged, see DailyFileHandler.
     
     Args:
         logs_path: (str) Directory where the log file will be stored.
         logs_name: (str) Name of the event log file (should include a full 
                      timestamp, e.g. "2025-03-14_18-04-17_events.log").
     """
-    os.makedirs(logs_path, exist_ok=True)
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    existing_file = None
-    for file in os.listdir(logs_path):
-        if file.startswith(today_str) and file.endswith("_events.log"):
-            existing_file = file
-            break
-    if existing_file:
-        log_file_path = os.path.join(logs_path, existing_file)
-    else:
-        log_file_path = os.path.join(logs_path, logs_name)
-        # Write header with runtime timestamp.
-        runtime_stamp = logs_name.split("_events.log")[0]
-        with open(log_file_path, "w") as f:
-            f.write(f"runtime: {runtime_stamp}\n")
-    
     # Remove any previously attached handlers for this logger.
     if event_logger.hasHandlers():
         event_logger.handlers.clear()
 
-    file_handler = logging.FileHandler(log_file_path)
+    file_handler = DailyFileHandler(logs_path, logs_name, "_events.log")
     formatter = logging.Formatter(
         '%(asctime)s - %(levelname)s - %(message)s'
     )
@@ -2,7 +2,8 @@ import os
 import time
 import atexit
 import logging
-from contextlib import ContextDecorator
+import threading
+from contextlib import ContextDecorator, contextmanager
 from datetime import datetime
 
 # Register shutdown to ensure logging handlers are closed on exit.
@@ -23,39 +24,64 @@ class CustomFormatter(logging.Formatter):
 # Create a dedicated logger for timer logs.
 timer_logger = logging.getLogger("timer_logger")
 timer_logger.setLevel(logging.INFO)
+# stage timings of the running thread, see collect
+_stages = threading.local()
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    File handler writing to a single file per day. The log directory is searched for
+    today's file when the first record is written, not when the handler is created,
+    so importing altered.settings touches no files.
+
+    Args:
+        logs_path: (str) Directory for the log file.
+        logs_name: (str) Name of a new log file (should include a full timestamp,
+                     e.g. "2025-03-14_18-04-17_timer.log").
+        suffix: (str) Common ending of the daily files, e.g. "_timer.log".
+    """
+    def __init__(self, logs_path: str, logs_name: str, suffix: str) -> None:
+        self.logs_path, self.logs_name, self.suffix = logs_path, logs_name, suffix
+        super().__init__(os.path.join(logs_path, logs_name), delay=True)
+
+    def _open(self):
+        self.baseFilename = self.find_daily_file()
+        return super()._open()
+
+    def find_daily_file(self) -> str:
+        """
+        Returns today's file if there is one, otherwise creates logs_name with a
+        header line.
+        """
+        os.makedirs(self.logs_path, exist_ok=True)
+        today_str = datetime.now().strftime('%Y-%m-%d')
+        for file in os.listdir(self.logs_path):
+            if file.startswith(today_str) and file.endswith(self.suffix):
+                return os.path.join(self.logs_path, file)
+        log_file_path = os.path.join(self.logs_path, self.logs_name)
+        # Write header if file is new; open in "w" mode to ensure header is at the top.
+        runtime_stamp = self.logs_name.split(self.suffix)[0]
+        with open(log_file_path, "w") as f:
+            f.write(f"runtime: {runtime_stamp}\n")
+        return log_file_path
+
 
 def init_timer(logs_path: str, logs_name: str) -> None:
     """
     Initializes timer logging. Creates a single file per day by checking
     for an existing file with today's date. If found, it uses that file; if not,
     it creates a new one using the provided logs_name and writes a header line.
+    The file is looked up when the first timing is logged, see DailyFileHandler.
     
     Args:
         logs_path: (str) Directory for the log file.
         logs_name: (str) Name of the log file (should include a full timestamp,
                      e.g. "2025-03-14_18-04-17_timer.log").
     """
-    os.makedirs(logs_path, exist_ok=True)
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    existing_file = None
-    for file in os.listdir(logs_path):
-        if file.startswith(today_str) and file.endswith("_timer.log"):
-            existing_file = file
-            break
-    if existing_file:
-        log_file_path = os.path.join(logs_path, existing_file)
-    else:
-        log_file_path = os.path.join(logs_path, logs_name)
-        # Write header if file is new; open in "w" mode to ensure header is at the top.
-        runtime_stamp = logs_name.split("_timer.log")[0]
-        with open(log_file_path, "w") as f:
-            f.write(f"runtime: {runtime_stamp}\n")
-    
     # Remove any previously attached handlers for this logger.
     if timer_logger.hasHandlers():
         timer_logger.handlers.clear()
         
-    file_handler = logging.FileHandler(log_file_path)
+    file_handler = DailyFileHandler(logs_path, logs_name, "_timer.log")
     formatter = CustomFormatter(
         fmt='%(asctime)s - %(levelname)s - %(message)s',
         datefmt='%H:%M:%S'
@@ -64,6 +90,30 @@ def init_timer(logs_path: str, logs_name: str) -> None:
     timer_logger.addHandler(file_handler)
 
 
+@contextmanager
+def collect():
+    """
+    Collects the elapsed seconds of all timed blocks run by this thread, summed per name.
+    Used to report the stages of a job (server_jobs.py).
+
+    Yields:
+        stages: (dict) {name: seconds}, filled while the block runs.
+    """
+    stages, outer = {}, getattr(_stages, 'current', None)
+    _stages.current = stages
+    try:
+        yield stages
+    finally:
+        _stages.current = outer
+
+def record(name: str, elapsed: float) -> None:
+    """Logs elapsed and adds it to the stages of the running collect block."""
+    timer_logger.info("Elapsed time for %s: %.6f seconds", name, elapsed)
+    stages = getattr(_stages, 'current', None)
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + elapsed
+
+
 class Timer(ContextDecorator):
     """Context manager and decorator for timing code blocks.
 
@@ -81,9 +131,7 @@ class Timer(ContextDecorator):
         return self
 
     def __exit__(self, *args, **kwargs) -> bool:
-        elapsed = time.perf_counter() - self.start
-        timer_logger.info("Elapsed time for %s: %.6f seconds", 
-                          self.name, elapsed)
+        record(self.name, time.perf_counter() - self.start)
         return False
 
 def timed(name: str = "function"):
@@ -97,9 +145,7 @@ def timed(name: str = "function"):
         def wrapper(*args, **kwargs):
             start_time = time.perf_counter()
             result = func(*args, **kwargs)
-            elapsed = time.perf_counter() - start_time
-            timer_logger.info("Elapsed time for %s: %.6f seconds",
-                              name, elapsed)
+            record(name, time.perf_counter() - start_time)
             return result
         return wrapper
     return decorator
@@ -0,0 +1,296 @@
+"""
+model_balancer.py
+Spreads model requests across a pool of Ollama servers. Pools are defined in
+models_servers.yml -> pools and are addressed like any other server, i.e. the alias
+'l3.2_gpus' resolves to one healthy member of the pool 'gpus' on every call.
+
+Policies:   round_robin, least_outstanding, latency_ewma (register_policy to add more)
+Health:     servers are probed via /api/ps (ollama) or /ping (altered endpoint server).
+            Failing servers are ejected and readmitted once a probe succeeds again.
+
+Import: msts.config.balancer (created by ModelParams)
+    msts.config.balancer.stats() -> {'while-ai_0': {'healthy': True, 'outstanding': 1, ...}}
+"""
+
+import itertools, threading, time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import httpx
+from colorama import Fore
+
+
+class ServerState:
+    """Runtime state of a single server, updated by requests and health probes."""
+
+    def __init__(self, name: str, *args, **kwargs) -> None:
+        self.name = name
+        self.healthy = True
+        self.outstanding = 0
+        self.ewma: Optional[float] = None
+        self.failures = 0
+        self.ejected_at: Optional[float] = None
+        self.last_probe: Optional[float] = None
+        self.loaded_models: List[str] = []
+        self.counts = {'requests': 0, 'errors': 0, 'ejections': 0, 'readmissions': 0}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+                'healthy': self.healthy,
+                'outstanding': self.outstanding,
+                'ewma': round(self.ewma, 3) if self.ewma is not None else None,
+                'failures': self.failures,
+                'loaded_models': self.loaded_models,
+                **self.counts,
+        }
+
+
+class RoundRobin:
+    """Cycles through the pool members in config order."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.counter = itertools.count()
+
+    def __call__(self, states: List[ServerState]) -> ServerState:
+        return states[next(self.counter) % len(states)]
+
+
+class LeastOutstanding:
+    """Picks the member with the fewest requests in flight."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def __call__(self, states: List[ServerState]) -> ServerState:
+        return min(states, key=lambda s: s.outstanding)
+
+
+class LatencyEWMA:
+    """
+    Picks the member with the lowest expected wait, i.e. its latency EWMA times the
+    requests it already has in flight. Members without measurements are tried first.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def __call__(self, states: List[ServerState]) -> ServerState:
+        return min(states, key=lambda s: (s.ewma or 0.0) * (s.outstanding + 1))
+
+
+policies: Dict[str, Callable] = {
+                                    'round_robin': RoundRobin,
+                                    'least_outstanding': LeastOutstanding,
+                                    'latency_ewma': LatencyEWMA,
+}
+
+
+def register_policy(name: str, policy: Callable) -> None:
+    """
+    Adds a routing policy. policy() must return a callable that takes the list of
+    available ServerStates and returns one of them.
+    """
+    policies[name] = policy
+
+
+class LoadBalancer:
+    """
+    Resolves pool names to member servers and keeps track of the member states.
+    Requests report back via track(), probes run in a daemon thread if probe_interval > 0.
+    """
+    defaults = {
+                'policy': 'least_outstanding',
+                'probe_interval': 30,
+                'probe_timeout': 2,
+                'probe_paths': ['/api/ps', '/ping'],
+                'max_failures': 3,
+                'eject_time': 60,
+                'ewma_alpha': 0.3,
+    }
+
+    def __init__(self, servers: Dict[str, Any], pools: Dict[str, Any], params: dict = None,
+                    *args, **kwargs) -> None:
+        self.servers = servers
+        self.pools = pools or {}
+        self.params = dict(self.defaults, **(params or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.states: Dict[str, ServerState] = {}
+        self.routers = {name: policies[pool.get('policy', self.params['policy'])]()
+                                                    for name, pool in self.pools.items()}
+        self.prober: Optional[threading.Thread] = None
+
+    # ─── routing ──────────────────────────────────────────────────────────
+    def is_pool(self, name: str) -> bool:
+        return isinstance(name, str) and name in self.pools
+
+    def members(self, pool_name: str) -> List[str]:
+        return list(self.pools[pool_name].get('servers') or [])
+
+    def state(self, server_name: str) -> ServerState:
+        if server_name not in self.states:
+            self.states[server_name] = ServerState(server_name)
+        return self.states[server_name]
+
+    def is_available(self, state: ServerState) -> bool:
+        """
+        Ejected servers get a trial request once eject_time has passed, so pools
+        recover even when no probes are running.
+        """
+        if state.healthy:
+            return True
+        return time.time() - (state.ejected_at or 0) >= self.params['eject_time']
+
+    def pick(self, pool_name: str, *args, **kwargs) -> str:
+        """
+        Returns the member of pool_name to send the next request to.
+        Non pool names are returned unchanged.
+        """
+        if not self.is_pool(pool_name):
+            return pool_name
+        self.start_probes()
+        with self.lock:
+            states = [self.state(name) for name in self.members(pool_name)]
+            available = [s for s in states if self.is_available(s)]
+            if not available:
+                print(  f"{Fore.YELLOW}WARNING: LoadBalancer.pick: no healthy server in "
+                        f"pool {pool_name}, using all members{Fore.RESET}")
+                available = states
+            return self.routers[pool_name](available).name
+
+    def alternate(self, server_name: str, *args, model: str = None, **kwargs
+                    ) -> Optional[str]:
+        """
+        Returns a healthy pool peer of server_name to send a hedged request to, or None.
+        Peers that already have model loaded (see probe) are preferred.
+        """
+        with self.lock:
+            for pool_name in self.pools:
+                names = self.members(pool_name)
+                if server_name not in names:
+                    continue
+                peers = [self.state(name) for name in names if name != server_name]
+                peers = [s for s in peers if s.healthy]
+                loaded = [s for s in peers if model in s.loaded_models]
+                if loaded or peers:
+                    return self.routers[pool_name](loaded or peers).name
+        return None
+
+    # ─── request feedback ─────────────────────────────────────────────────
+    @contextmanager
+    def track(self, server_name: str, *args, **kwargs) -> Iterator[Dict[str, bool]]:
+        """
+        Counts the request as outstanding while it runs and updates latency and failures.
+        Set tracked['ok'] = False for error responses.
+        Example:
+            with balancer.track('while-ai_0') as tracked:
+                response = ...
+                tracked['ok'] = 'error' not in response
+        """
+        tracked, start = {'ok': True}, time.time()
+        with self.lock:
+            self.state(server_name).outstanding += 1
+        try:
+            yield tracked
+        except Exception:
+            tracked['ok'] = False
+            raise
+        except BaseException:
+            # cancelled, i.e. the losing request of a hedge, says nothing about the server
+            tracked['ok'] = None
+            raise
+        finally:
+            self.end(server_name, time.time() - start, tracked['ok'])
+
+    def end(self, server_name: str, elapsed: float, ok: Optional[bool]) -> None:
+        with self.lock:
+            state = self.state(server_name)
+            state.outstanding = max(state.outstanding - 1, 0)
+            if ok is None:
+                return
+            state.counts['requests'] += 1
+            if ok:
+                alpha = self.params['ewma_alpha']
+                state.ewma = elapsed if state.ewma is None \
+                                        else alpha * elapsed + (1 - alpha) * state.ewma
+                self._readmit(state)
+            else:
+                state.counts['errors'] += 1
+                self._fail(state)
+
+    def _fail(self, state: ServerState) -> None:
+        state.failures += 1
+        if state.failures >= self.params['max_failures'] or not state.healthy:
+            if state.healthy:
+                state.counts['ejections'] += 1
+                print(f"{Fore.YELLOW}LoadBalancer: ejecting {state.name}{Fore.RESET}")
+            state.healthy, state.ejected_at = False, time.time()
+
+    def _readmit(self, state: ServerState) -> None:
+        if not state.healthy:
+            state.counts['readmissions'] += 1
+            print(f"{Fore.GREEN}LoadBalancer: readmitting {state.name}{Fore.RESET}")
+        state.healthy, state.failures, state.ejected_at = True, 0, None
+
+    # ─── health probes ────────────────────────────────────────────────────
+    def probe_urls(self, server_name: str) -> List[str]:
+        params = self.servers.get(server_name) or {}
+        port = params.get('generate_port') or params.get('get_generates_port')
+        base = f"{params.get('model_address')}:{port}" if port else params.get('model_address')
+        return [f"{base}{path}" for path in self.params['probe_paths']]
+
+    def probe(self, server_name: str, *args, **kwargs) -> bool:
+        """
+        A server is healthy if any of its probe_paths answers with status 200.
+        /api/ps also tells us which models are currently loaded.
+        """
+        ok, loaded_models = False, None
+        for url in self.probe_urls(server_name):
+            try:
+                r = httpx.get(url, timeout=self.params['probe_timeout'])
+            except httpx.HTTPError:
+                continue
+            if r.status_code != 200:
+                continue
+            if url.endswith('/api/ps'):
+                try:
+                    loaded_models = [m.get('name') for m in r.json().get('models', [])]
+                except (ValueError, AttributeError):
+                    # something else answers on the port, i.e. a proxy error page
+                    continue
+            ok = True
+            break
+        with self.lock:
+            state = self.state(server_name)
+            state.last_probe = time.time()
+            if loaded_models is not None:
+                state.loaded_models = loaded_models
+            if ok:
+                self._readmit(state)
+            else:
+                self._fail(state)
+        return ok
+
+    def probe_all(self, *args, **kwargs) -> Dict[str, bool]:
+        names = {name for pool_name in self.pools for name in self.members(pool_name)}
+        return {name: self.probe(name) for name in sorted(names)}
+
+    def start_probes(self, *args, **kwargs) -> None:
+        """Starts the probe thread once, concurrent first picks race for it."""
+        with self.lock:
+            if not self.pools or self.params['probe_interval'] <= 0 or self.prober is not None:
+                return
+            self.prober = threading.Thread(target=self._probe_loop, daemon=True)
+            self.prober.start()
+
+    def _probe_loop(self) -> None:
+        while True:
+            # a failed pass must not end the prober, ejected servers only return through it
+            try:
+                self.probe_all()
+            except Exception as e:
+                print(f"{Fore.YELLOW}LoadBalancer: probe failed:{Fore.RESET} {e}")
+            time.sleep(self.params['probe_interval'])
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {name: state.to_dict() for name, state in self.states.items()}
@@ -0,0 +1,197 @@
+"""
+model_cache.py
+Opt-in cache for model responses. Identical deterministic requests (same model, prompts,
+options, tools and seed) are answered from an in-memory LRU, backed by a SQLite file
+so entries survive CLI invocations.
+
+Enable per call:    ModelConnect().post(prompts, alias='l3.2_1', temperature=0, use_cache=True)
+Enable by default:  models_servers.yml -> params.cache.enabled: true
+Bypass:             use_cache=False (no read, no write), refresh_cache=True (no read, write)
+
+Import: from altered.model_cache import cache
+    cache.stats() -> {'hits': 3, 'misses': 1, ...}
+"""
+
+import copy, hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from colorama import Fore
+
+import altered.model_params as msts
+import altered.settings as sts
+from altered.hlp_lazy import lazy_instance
+
+
+class ResponseCache:
+    """
+    Two level response cache: OrderedDict LRU in memory, SQLite on disk.
+    Both levels are size bounded and entries expire after ttl seconds.
+    """
+    # ctx fields that determine the model output, everything else (timings, verbose) is noise
+    key_fields = ('model', 'prompts', 'messages', 'options', 'tools', 'tool_choice',
+                  'num_predict', 'fmt', 'repeats', 'service_endpoint')
+    # timings of the original call, a hit would report them (or the entry age) as its own
+    timing_fields = ('network_up_time', 'network_down_time', 'server_time', 'wall_time',
+                     'ollama_time', 'total_time', 'ttft')
+    defaults = {
+                'enabled': False,
+                'ttl': 7 * 24 * 3600,
+                'max_memory_entries': 256,
+                'max_disk_entries': 10_000,
+    }
+
+    def __init__(self, *args, db_path: str = None, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('cache') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.db_path = db_path if db_path is not None else sts.model_cache_path
+        self.lock = threading.Lock()
+        self.memory: OrderedDict[str, tuple] = OrderedDict()
+        self.db: Optional[sqlite3.Connection] = None
+        self.counts = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                       'writes': 0, 'skipped': 0, 'expired': 0, 'evicted': 0}
+
+    # ─── request classification ───────────────────────────────────────────
+    def is_enabled(self, use_cache: Optional[bool] = None) -> bool:
+        return bool(self.params['enabled'] if use_cache is None else use_cache)
+
+    @staticmethod
+    def is_deterministic(ctx: Dict[str, Any]) -> bool:
+        """
+        Only deterministic requests are cached. ConParams randomizes the temperature unless
+        one is given, so we require temperature 0 or a fixed seed.
+        """
+        options = ctx.get('options') or {}
+        temperature = options.get('temperature', ctx.get('temperature'))
+        return temperature == 0 or options.get('seed', ctx.get('seed')) is not None
+
+    def mk_key(self, ctx: Dict[str, Any]) -> str:
+        relevant = {k: ctx.get(k) for k in self.key_fields if ctx.get(k) is not None}
+        relevant['seed'] = (ctx.get('options') or {}).get('seed', ctx.get('seed'))
+        dumped = json.dumps(relevant, sort_keys=True, default=str)
+        return hashlib.sha256(dumped.encode('utf-8')).hexdigest()
+
+    def lookup(self, ctx: Dict[str, Any], *args, use_cache: bool = None,
+                    refresh_cache: bool = False, **kwargs) -> tuple:
+        """
+        Returns (key, response). key is None if the request must not be cached,
+        response is None on a cache miss.
+        """
+        if not self.is_enabled(use_cache):
+            return None, None
+        if not self.is_deterministic(ctx):
+            with self.lock:
+                self.counts['skipped'] += 1
+            return None, None
+        key = self.mk_key(ctx)
+        return key, (None if refresh_cache else self.get(key))
+
+    # ─── storage ──────────────────────────────────────────────────────────
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute(
+                            "CREATE TABLE IF NOT EXISTS responses ("
+                            "key TEXT PRIMARY KEY, model TEXT, response TEXT, "
+                            "created REAL, accessed REAL)"
+                            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS ix_accessed ON responses (accessed)")
+            self.db.commit()
+        return self.db
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and now - entry[0] <= self.params['ttl']:
+                self.memory.move_to_end(key)
+                self.counts['hits'] += 1
+                self.counts['memory_hits'] += 1
+                return copy.deepcopy(entry[1])
+            row = self._connect().execute(
+                            "SELECT response, created FROM responses WHERE key = ?", (key,)
+                            ).fetchone()
+            if row is None:
+                self.counts['misses'] += 1
+                return None
+            if now - row[1] > self.params['ttl']:
+                self._delete(key)
+                self.counts['expired'] += 1
+                self.counts['misses'] += 1
+                return None
+            self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            response = json.loads(row[0])
+            self._remember(key, row[1], response)
+            self.counts['hits'] += 1
+            self.counts['disk_hits'] += 1
+            return copy.deepcopy(response)
+
+    def put(self, key: str, response: Dict[str, Any], *args, model: str = None,
+                    **kwargs) -> None:
+        if key is None or not self.is_valid(response):
+            return
+        now = time.time()
+        stored = {k: v for k, v in response.items() if k not in self.timing_fields}
+        try:
+            dumped = json.dumps(stored, default=self.to_json)
+        except (TypeError, ValueError) as e:
+            print(f"{Fore.YELLOW}ResponseCache.put: not cacheable {e}{Fore.RESET}")
+            return
+        with self.lock:
+            self._remember(key, now, json.loads(dumped))
+            db = self._connect()
+            db.execute( "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                        (key, model, dumped, now, now))
+            self._evict_disk(db)
+            db.commit()
+            self.counts['writes'] += 1
+
+    @staticmethod
+    def to_json(obj: Any) -> Any:
+        """ollama returns pydantic models (i.e. EmbeddingsResponse), we store their dicts"""
+        return obj.model_dump() if hasattr(obj, 'model_dump') else str(obj)
+
+    @staticmethod
+    def is_valid(response: Dict[str, Any]) -> bool:
+        """Errors and empty answers are never cached."""
+        responses = response.get('responses') or []
+        return bool(responses) and not any('error' in r for r in responses)
+
+    def _remember(self, key: str, created: float, response: Dict[str, Any]) -> None:
+        self.memory[key] = (created, response)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.params['max_memory_entries']:
+            self.memory.popitem(last=False)
+            self.counts['evicted'] += 1
+
+    def _evict_disk(self, db: sqlite3.Connection) -> None:
+        db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.params['ttl'],))
+        overflow = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] \
+                                                        - self.params['max_disk_entries']
+        if overflow > 0:
+            db.execute( "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)", (overflow,))
+            self.counts['evicted'] += overflow
+
+    def _delete(self, key: str) -> None:
+        self.memory.pop(key, None)
+        self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self.db.commit()
+
+    def clear(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.memory.clear()
+            self._connect().execute("DELETE FROM responses")
+            self.db.commit()
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            counts = dict(self.counts)
+            counts['memory_entries'] = len(self.memory)
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / lookups, 3) if lookups else 0.0
+        return counts
+
+
+cache = lazy_instance(ResponseCache)
@@ -0,0 +1,152 @@
+"""
+model_client_pool.py
+Process-wide registry of long-lived Ollama clients.
+Every OllamaConnect used to build its own ollama.Client and therefore its own httpx
+connection pool. ClientPool hands out one client per (host, timeout) instead, so
+consecutive prompts, embeddings and search cleanings reuse the open sockets.
+
+Import: from altered.model_client_pool import clients
+    client = clients.get('http://192.168.0.235:11434', timeout=120)
+    aclient = clients.aget('http://192.168.0.235:11434', timeout=120) # inside a running loop
+    clients.stats()  ->  {'http://192.168.0.235:11434|120': {'requests': 5, ...}}
+"""
+
+import asyncio, threading
+from typing import Any, Dict, Optional, Tuple
+import httpx
+from ollama import AsyncClient, Client
+from colorama import Fore
+
+import altered.model_params as msts
+
+
+class ClientStats:
+    """
+    Connection reuse counters for a single pooled client.
+    A new tcp connection is only reported by httpcore when the pool could not hand out
+    an idle keep-alive socket, so reused = requests - connections.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.lock = threading.Lock()
+        self.requests, self.connections = 0, 0
+
+    def on_request(self, request: httpx.Request) -> None:
+        with self.lock:
+            self.requests += 1
+        request.extensions['trace'] = self.trace
+
+    def trace(self, event_name: str, info: dict) -> None:
+        if event_name == 'connection.connect_tcp.complete':
+            with self.lock:
+                self.connections += 1
+
+    async def on_arequest(self, request: httpx.Request) -> None:
+        with self.lock:
+            self.requests += 1
+        request.extensions['trace'] = self.atrace
+
+    async def atrace(self, event_name: str, info: dict) -> None:
+        self.trace(event_name, info)
+
+    def to_dict(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            reused = max(self.requests - self.connections, 0)
+            return {
+                    'requests': self.requests,
+                    'connections': self.connections,
+                    'reused': reused,
+                    'reuse_rate': round(reused / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+class ClientPool:
+    """
+    Hands out one ollama.Client per (host, timeout) for the lifetime of the process.
+    Pool limits are read from models_servers.yml (params.pool, servers.<name>.pool).
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.lock = threading.Lock()
+        self.clients: Dict[Tuple[str, Any], Client] = {}
+        self.counters: Dict[Tuple[str, Any], ClientStats] = {}
+        # httpx.AsyncClient connections are bound to the event loop that opened them
+        self.aclients: Dict[Tuple[str, Any, int], AsyncClient] = {}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Strips the api path from a url, 'http://h:11434/api/generate' -> 'http://h:11434'"""
+        return url.split('/api', 1)[0].rstrip('/')
+
+    @staticmethod
+    def mk_limits(host: str, *args, **kwargs) -> httpx.Limits:
+        limits = msts.config.get_pool_limits(host)
+        return httpx.Limits(
+                            max_connections=limits.get('max_connections'),
+                            max_keepalive_connections=limits.get('max_keepalive_connections'),
+                            keepalive_expiry=limits.get('keepalive_expiry'),
+                )
+
+    def get(self, url: str, *args, timeout: Optional[float] = None, **kwargs) -> Client:
+        """
+        Returns the shared client for url and timeout, creating it on first use.
+        """
+        host = self.host_of(url)
+        key = (host, timeout)
+        with self.lock:
+            if key not in self.clients:
+                counter = self.counters.setdefault(key, ClientStats())
+                self.clients[key] = Client(
+                                    host=host,
+                                    timeout=timeout,
+                                    limits=self.mk_limits(host),
+                                    event_hooks={'request': [counter.on_request]},
+                                    )
+            return self.clients[key]
+
+    def aget(self, url: str, *args, timeout: Optional[float] = None, **kwargs) -> AsyncClient:
+        """
+        Returns the shared async client for url and timeout within the running event loop.
+        Async and sync clients of the same host share one set of reuse counters.
+        """
+        host = self.host_of(url)
+        loop = asyncio.get_running_loop()
+        key = (host, timeout, id(loop))
+        with self.lock:
+            if key not in self.aclients:
+                counter = self.counters.setdefault((host, timeout), ClientStats())
+                self.aclients[key] = AsyncClient(
+                                    host=host,
+                                    timeout=timeout,
+                                    limits=self.mk_limits(host),
+                                    event_hooks={'request': [counter.on_arequest]},
+                                    )
+            return self.aclients[key]
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """Connection reuse counters per pooled client, keyed by 'host|timeout'."""
+        with self.lock:
+            return {f"{host}|{timeout}": c.to_dict() for (host, timeout), c
+                                                        in self.counters.items()}
+
+    def close(self, *args, **kwargs) -> None:
+        """Closes all pooled clients, i.e. on server shutdown."""
+        with self.lock:
+            for key, client in self.clients.items():
+                try:
+                    client._client.close()
+                except Exception as e:
+                    print(f"{Fore.YELLOW}ClientPool.close {key}: {e}{Fore.RESET}")
+            self.clients.clear()
+
+    async def aclose(self, *args, **kwargs) -> None:
+        """Closes the async clients owned by the running event loop."""
+        loop_id = id(asyncio.get_running_loop())
+        with self.lock:
+            keys = [key for key in self.aclients if key[-1] == loop_id]
+            aclients = [self.aclients.pop(key) for key in keys]
+        for aclient in aclients:
+            await aclient._client.aclose()
+
+
+clients = ClientPool()
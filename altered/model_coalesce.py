@@ -0,0 +1,167 @@
+"""
+model_coalesce.py
+Single-flight coalescing of identical model requests. While a request is in flight, every
+concurrent caller with the same normalized request key waits for it and gets a copy of its
+response instead of sending the same prompt to the model again (i.e. parallel api workers
+running the same web search page or warmup prompt). Like the response cache, only
+deterministic requests (temperature 0 or a fixed seed) are coalesced, concurrent samples of
+a randomized temperature are independent answers, i.e. repeats to be aggregated.
+
+Default:            models_servers.yml -> params.coalesce.enabled: true
+Opt out per call:   ModelConnect().post(prompts, alias='l3.2_1', coalesce=False)
+Streams are never coalesced.
+
+Import: from altered.model_coalesce import single_flight
+    single_flight.stats() -> {'leaders': 3, 'followers': 5, ...}
+"""
+
+import asyncio, copy, hashlib, json, threading
+from typing import Any, Callable, Dict, Optional
+
+import altered.model_params as msts
+from altered.hlp_lazy import lazy_instance
+from altered.model_cache import ResponseCache
+
+
+class Flight:
+    """One in-flight request, followers wait for event and then read result or error."""
+
+    def __init__(self, event: Any, *args, **kwargs) -> None:
+        self.event = event
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+        self.followers = 0
+        # the leader was cancelled, a follower calls again as the new leader
+        self.cancelled = False
+
+
+class SingleFlight:
+    # the response cache key fields plus the sampling parameters outside of options (gpt)
+    key_fields = ResponseCache.key_fields + ('temperature', 'seed')
+    defaults = {
+                'enabled': True,
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('coalesce') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.flights: Dict[str, Flight] = {}
+        # asyncio events are bound to their loop, so async flights are keyed per loop
+        self.aflights: Dict[tuple, Flight] = {}
+        self.counts = {'leaders': 0, 'followers': 0, 'errors': 0, 'cancelled': 0,
+                       'skipped': 0}
+
+    def is_enabled(self, coalesce: Optional[bool] = None, ctx: Dict[str, Any] = None
+                    ) -> bool:
+        enabled = bool(self.params['enabled'] if coalesce is None else coalesce)
+        if enabled and ctx is not None:
+            enabled = ResponseCache.is_deterministic(ctx)
+        if not enabled:
+            with self.lock:
+                self.counts['skipped'] += 1
+        return enabled
+
+    def mk_key(self, ctx: Dict[str, Any], *args, server: str = None, **kwargs) -> str:
+        """
+        An explicit server is part of the key, a caller pinned to it is not served by another.
+        """
+        relevant = {k: ctx.get(k) for k in self.key_fields if ctx.get(k) is not None}
+        if server is not None:
+            relevant['server'] = server
+        dumped = json.dumps(relevant, sort_keys=True, default=str)
+        return hashlib.sha256(dumped.encode('utf-8')).hexdigest()
+
+    # ─── coalescing ───────────────────────────────────────────────────────
+    def join(self, flights: dict, key: Any, mk_event: Callable) -> tuple:
+        """Returns (flight, is_leader), the first caller of a key becomes the leader."""
+        with self.lock:
+            flight = flights.get(key)
+            if flight is None:
+                flight = flights[key] = Flight(mk_event())
+                self.counts['leaders'] += 1
+                return flight, True
+            flight.followers += 1
+            self.counts['followers'] += 1
+            return flight, False
+
+    def land(self, flights: dict, key: Any, flight: Flight, result: Any = None,
+                    error: Exception = None, cancelled: bool = False) -> None:
+        """
+        Removes the flight, so later callers start a new request, and keeps a snapshot
+        of the result for the followers. The leader owns (and may change) the original.
+        """
+        with self.lock:
+            flights.pop(key, None)
+            if error is not None:
+                self.counts['errors'] += 1
+            if cancelled:
+                self.counts['cancelled'] += 1
+        flight.cancelled = cancelled
+        if flight.followers and not cancelled:
+            flight.error = error
+            flight.result = copy.deepcopy(result) if error is None else None
+        flight.event.set()
+
+    @staticmethod
+    def share(flight: Flight) -> Dict[str, Any]:
+        if flight.error is not None:
+            raise flight.error
+        response = copy.deepcopy(flight.result)
+        response['coalesced'] = True
+        return response
+
+    def do(self, key: str, call: Callable, /, *args, **kwargs) -> Dict[str, Any]:
+        """
+        Calls call(*args, **kwargs) once for all concurrent callers of key. Errors are
+        shared, the cancellation of the leader is not, a follower takes over then.
+        """
+        while True:
+            flight, is_leader = self.join(self.flights, key, threading.Event)
+            if is_leader:
+                break
+            flight.event.wait()
+            if not flight.cancelled:
+                return self.share(flight)
+        try:
+            result = call(*args, **kwargs)
+        except Exception as e:
+            self.land(self.flights, key, flight, error=e)
+            raise
+        except BaseException:
+            self.land(self.flights, key, flight, cancelled=True)
+            raise
+        self.land(self.flights, key, flight, result)
+        return result
+
+    async def ado(self, key: str, call: Callable, /, *args, **kwargs) -> Dict[str, Any]:
+        """Async version of do, call must return an awaitable."""
+        akey = (id(asyncio.get_running_loop()), key)
+        while True:
+            flight, is_leader = self.join(self.aflights, akey, asyncio.Event)
+            if is_leader:
+                break
+            await flight.event.wait()
+            if not flight.cancelled:
+                return self.share(flight)
+        try:
+            result = await call(*args, **kwargs)
+        except Exception as e:
+            self.land(self.aflights, akey, flight, error=e)
+            raise
+        except BaseException:
+            # a cancelled leader must not leave its followers waiting
+            self.land(self.aflights, akey, flight, cancelled=True)
+            raise
+        self.land(self.aflights, akey, flight, result)
+        return result
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            counts = dict(self.counts, in_flight=len(self.flights) + len(self.aflights))
+        calls = counts['leaders'] + counts['followers']
+        counts['dedup_rate'] = round(counts['followers'] / calls, 3) if calls else 0.0
+        return counts
+
+
+single_flight = lazy_instance(SingleFlight)
@@ -1,18 +1,28 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
-import json, math, re, requests, time
+from typing import List, Dict, Any, Iterator, Optional
+import json, math, re, time
 import random as rd
 from datetime import datetime as dt
-import pandas as pd
 
 import altered.model_params as msts
 import altered.hlp_printing as hlpp
 import altered.settings as sts
-from openai import OpenAI
+from altered.hlp_lazy import lazy_import
 from colorama import Fore, Style, Back
 
+# pandas and openai are imported at their first use, see hlp_lazy.py
+pd = lazy_import('pandas')
+oai = lazy_import('altered.model_openai_connect')
 
 from altered.model_ollama_connect import OllamaConnect
+from altered.model_cache import cache
+from altered.model_coalesce import single_flight
+from altered.model_hedge import hedger
+from altered.model_scheduler import scheduler
+from altered.model_prefix import prefixes
+from altered.model_residency import residency
+from altered.model_tokens import tokens
+from altered.model_metrics import metrics
 from altered.prompt_function_calling import Function
 
 
@@ -28,7 +38,9 @@ class ConParams:
     temperature:        Optional[float] = None
     num_ctx:            Optional[int] = None
     num_predict:        Optional[int] = None
-    keep_alive:         Optional[int] = 1000
+    seed:               Optional[int] = None
+    # None: adaptive, see model_residency.py
+    keep_alive:         Optional[int] = None
     service_endpoint:   Optional[str] = None
     stream:             Optional[bool] = False
     # helper parameters
@@ -44,6 +56,8 @@ class ConParams:
         # Normalize messages for GPT-based models.
         if self.messages is None:
             self.messages = []
+        elif isinstance(self.messages, str):
+            self.messages = [self.messages]
         if self.model.startswith('gpt'):
             if not isinstance(self.messages, list):
                 self.messages = [str(self.messages)]
@@ -66,6 +80,8 @@ class ConParams:
         # Compute effective context length.
         self.num_ctx = self._compute_num_ctx(self.context_length, default_min=2000)
         self.options = {'temperature': self.temperature, 'num_ctx': self.num_ctx}
+        if self.seed is not None:
+            self.options['seed'] = self.seed
         # Set a default service_endpoint if none provided.
         if not self.service_endpoint:
             self.service_endpoint = msts.config.defaults.get('service_endpoint')
@@ -86,23 +102,18 @@ class ConParams:
         return rd_temp
 
     def _compute_num_ctx(self, context_length: int, default_min: int = 2000) -> int:
-        """Estimate context length based on message sizes."""
-        lengths = []
-        for msg in self.messages:
-            content = (msg.get('content') if isinstance(msg, dict) and 'content' in msg
-                       else str(msg))
-            lengths.append(len(content) // 3)
-        num_ctx = max(max(lengths) if lengths else default_min, default_min)
-        if num_ctx > context_length:
-            print(f"{Fore.YELLOW}WARNING{Fore.RESET}: Computed num_ctx "
-                  f"({num_ctx}) exceeds context_length ({context_length}); "
-                  f"using context_length instead.")
-        return min(num_ctx, context_length)
+        """
+        Estimate context length based on message sizes. The result is rounded up to a
+        bucket of params.tokens.ctx_buckets, so that Ollama does not reload the model
+        for every small change in prompt size (see model_tokens.py).
+        """
+        return tokens.num_ctx(self.messages, context_length=context_length,
+                                default_min=default_min, num_predict=self.num_predict)
 
     def to_dict(self, *args, **kwargs) -> Dict[str, Any]:
         """
         Build request-dict for backend.
-        • GPT/OpenAI  → only keys they support.
+        • GPT/OpenAI  → messages plus local keys, OpenAIConnect filters what the API takes.
         • Non-GPT     → legacy fields plus tools/chat when present.
         """
         is_gpt = self.model.startswith("gpt")
@@ -128,6 +139,12 @@ class ConParams:
                 ctx["num_predict"] = self.num_predict
             if self.keep_alive:
                 ctx["keep_alive"] = self.keep_alive
+        else:                           # OpenAIConnect filters what the API accepts
+            ctx["repeats"] = self.repeats
+            if self.num_predict is not None:
+                ctx["num_predict"] = self.num_predict
+            if self.seed is not None:
+                ctx["seed"] = self.seed
         if self.tools:
             ctx["tools"] = self.tools
             ctx["tool_choice"] = self.tool_choice
@@ -185,41 +202,180 @@ class ModelConnect:
         self.stats = ModelStats(*args, **kwargs)
         self.m_params: Mandatory[Dict[str, Any]] = {}
 
-    def post(self, *args, **kwargs) -> dict:
+    def post(self, *args, hedge: bool = None, **kwargs) -> dict:
         """
         Sends a message to the remote AI assistant and returns the response.
+        hedge: see model_hedge.py
         """
+        m_params, start = self.get_params(*args, **kwargs), time.time()
         try:
-            self.m_params = msts.config.get_model(*args, **kwargs)
-            self.print_connect_params(*args, **kwargs)
+            backup = self.get_backup(m_params, *args, hedge=hedge, **kwargs)
+            if backup is None:
+                response = self.send(m_params, *args, **kwargs)
+            else:
+                # async legs, so the loser is cancelled and frees its server slot
+                async def primary():
+                    return await self.asend(m_params, *args, **kwargs), m_params
+
+                # the backup must not wait for the primary in model_coalesce
+                async def secondary():
+                    return await self.asend(backup['params'], *args,
+                                            **dict(kwargs, coalesce=False)), backup['params']
+                (response, m_params), leg = hedger.run_in_loop(primary, secondary,
+                                                                            backup['delay'])
+                response['hedged'] = ('primary', 'backup')[leg]
         except Exception as e:
-            raise
+            print(f"\n{Fore.RED}ModelConnect.post RmConnect raising Error!\n{e}{Fore.RESET}")
+            self.stats.record_error(m_params['model_file']['name'], m_params['server'])
+            raise Exception(e)
+        response['wall_time'] = time.time() - start
+        return self.finalize(response, m_params, *args, **kwargs)
+
+    async def apost(self, *args, hedge: bool = None, **kwargs) -> dict:
+        """
+        Awaitable version of post. Returns the same response dict, but does not block
+        the calling thread while the model generates. Many apost calls can be in flight
+        within one event loop.
+        Example:
+            r = await ModelConnect().apost(['Why is the sky blue?'], alias='l3.2_1')
+        """
+        m_params, start = self.get_params(*args, **kwargs), time.time()
         try:
-            response = RmConnect()( *args,
-                                        func=self.m_params['model_file']['host'],
-                                        name=self.m_params['model_file']['name'],
-                                        url=self.m_params['url'],
-                                    **kwargs
-                                    )
-            response['model'] = self.m_params['model_file']['name']
-            response['server'] = self.m_params.get('server')
+            backup = self.get_backup(m_params, *args, hedge=hedge, **kwargs)
+            if backup is None:
+                response = await self.asend(m_params, *args, **kwargs)
+            else:
+                async def primary():
+                    return await self.asend(m_params, *args, **kwargs), m_params
+
+                async def secondary():
+                    return await self.asend(backup['params'], *args,
+                                            **dict(kwargs, coalesce=False)), backup['params']
+                (response, m_params), leg = await hedger.arun(primary, secondary,
+                                                                            backup['delay'])
+                response['hedged'] = ('primary', 'backup')[leg]
         except Exception as e:
-            print(f"\n{Fore.RED}ModelConnect.post RmConnect raising Error!\n{e}{Fore.RESET}")
+            print(f"\n{Fore.RED}ModelConnect.apost RmConnect raising Error!\n{e}{Fore.RESET}")
+            self.stats.record_error(m_params['model_file']['name'], m_params['server'])
+            raise Exception(e)
+        response['wall_time'] = time.time() - start
+        return self.finalize(response, m_params, *args, **kwargs)
+
+    def send(self, m_params: dict, *args, **kwargs) -> dict:
+        with msts.config.balancer.track(m_params['server']) as tracked:
+            response = RmConnect()( *args, **self.mk_connect_params(m_params, **kwargs))
+            tracked['ok'] = self.is_ok(response)
+        return response
+
+    async def asend(self, m_params: dict, *args, **kwargs) -> dict:
+        with msts.config.balancer.track(m_params['server']) as tracked:
+            response = await RmConnect().acall(*args,
+                                                        **self.mk_connect_params(m_params, **kwargs))
+            tracked['ok'] = self.is_ok(response)
+        return response
+
+    def get_backup(self, m_params: dict, *args, hedge: bool = None, **kwargs
+                    ) -> Optional[dict]:
+        """
+        Returns {'params': m_params of a replica server, 'delay': seconds} if the request
+        should be hedged, else None.
+        """
+        if not hedger.is_enabled(hedge):
+            return None
+        model, server = m_params['model_file']['name'], m_params['server']
+        replica = msts.config.balancer.alternate(server, model=model)
+        if replica is None:
+            return None
+        delay = hedger.delay(self.stats, model, server)
+        if delay is None:
+            return None
+        return {'params': msts.config.get_model(*args, **dict(kwargs, server=replica)),
+                'delay': delay}
+
+    def stream(self, *args, **kwargs) -> Iterator[dict]:
+        """
+        Streams the model answer while it is generated. Yields {'chunk': str, 'done': False}
+        per text chunk and finally {'done': True, 'response': dict}, where response is the
+        same response dict post would return. Time-to-first-token is stored as 'ttft'.
+        Example:
+            for item in ModelConnect().stream(['Why is the sky blue?'], alias='l3.2_1'):
+                print(item.get('chunk', ''), end='', flush=True)
+        """
+        m_params = self.get_params(*args, **kwargs)
+        start, ttft, parts, timings = time.time(), None, [], {}
+        try:
+            with msts.config.balancer.track(m_params['server']):
+                for chunk in RmConnect().stream(*args,
+                                                        **self.mk_connect_params(m_params, **kwargs)):
+                    # the final ollama chunk carries eval counts and durations
+                    timings.update({k: v for k, v in chunk.items()
+                                                    if k in OllamaConnect.timing_keys})
+                    if not chunk['response']:
+                        continue
+                    if ttft is None:
+                        ttft = time.time() - start
+                    parts.append(chunk['response'])
+                    yield {'chunk': chunk['response'], 'done': False}
+        except Exception as e:
+            print(f"\n{Fore.RED}ModelConnect.stream RmConnect raising Error!\n{e}{Fore.RESET}")
+            self.stats.record_error(m_params['model_file']['name'], m_params['server'])
             raise Exception(e)
+        response = {
+                    'responses': [{'response': ''.join(parts), 'tool_call': None, **timings}],
+                    'ttft': ttft,
+                    'server_time': time.time() - start,
+                    'wall_time': time.time() - start,
+        }
+        yield {'done': True, 'response': self.finalize(response, m_params, *args, **kwargs)}
+
+    def get_params(self, *args, **kwargs) -> dict:
+        """
+        Resolves model and server parameters. m_params is returned (and not only kept
+        in self.m_params) because concurrent posts share this instance.
+        """
+        m_params = msts.config.get_model(*args, **kwargs)
+        self.m_params = m_params
+        self.print_connect_params(*args, **kwargs)
+        return m_params
+
+    @staticmethod
+    def mk_connect_params(m_params: dict, **kwargs) -> dict:
+        """
+        Request kwargs with the connection of m_params. The server of m_params wins over
+        a server kwarg, it is the one that was resolved (balancer pick or hedge replica).
+        """
+        return {
+                **kwargs,
+                'func': m_params['model_file']['host'],
+                'name': m_params['model_file']['name'],
+                'url': m_params['url'],
+                'server': m_params.get('server'),
+        }
+
+    def finalize(self, response: dict, m_params: dict, *args, **kwargs) -> dict:
+        """
+        Validates the response and updates the model statistics.
+        """
+        response['model'] = m_params['model_file']['name']
+        response['server'] = m_params.get('server')
         try:
             self.validate_response(response, *args, **kwargs)
         except Exception as e:
             print(f"{Fore.RED}ModelConnect.post validate_response Error!\n{e}{Fore.RESET}")
             raise
         try:
-            self.stats(response, *args, model=self.m_params['model_file']['name'], **kwargs)
-
+            self.stats(response, *args, model=m_params['model_file']['name'], **kwargs)
         except Exception as e:
             hlpp.play_sound("ERROR")
             raise
         hlpp.play_sound("RESPONSE1")
         return response
 
+    @staticmethod
+    def is_ok(response: dict) -> bool:
+        """Responses with errors count as server failures for the load balancer."""
+        return not any('error' in r for r in response.get('responses', []))
+
     def validate_response(self, r_dict: dict, *args, verbose: int = 0, **kwargs) -> bool:
         """
         Validates the response from the model API call.
@@ -248,18 +404,110 @@ class ModelConnect:
 
 class RmConnect:
 
-    def __call__(self, *args, func:str, name:str, **kwargs) -> dict:
+    # models_servers.yml host entries mapped to their async and streaming counterparts
+    async_funcs = {'_ollama': '_aollama', 'openAI': 'aopenAI'}
+    stream_funcs = {'_ollama': '_ollama_stream', 'openAI': 'openAI_stream'}
+
+    def __call__(self, *args, func:str, name:str, use_cache:bool=None,
+                        refresh_cache:bool=False, coalesce:bool=None, **kwargs) -> dict:
         """
         Dispatch the model call according to the given parameters.
+        use_cache, refresh_cache: see model_cache.py
+        coalesce: see model_coalesce.py
+        """
+        ctx = self.mk_context(*args, **dict(kwargs, model=name))
+        if not single_flight.is_enabled(coalesce, ctx):
+            return self.dispatch(*args, func=func, name=name, ctx=ctx, use_cache=use_cache,
+                                        refresh_cache=refresh_cache, **kwargs)
+        return single_flight.do(self.flight_key(ctx, **kwargs), self.dispatch, *args,
+                                        func=func, name=name, ctx=ctx, use_cache=use_cache,
+                                        refresh_cache=refresh_cache, **kwargs)
+
+    def dispatch(self, *args, func:str, name:str, ctx:dict, use_cache:bool=None,
+                        refresh_cache:bool=False, server:str=None, priority:str=None,
+                        **kwargs) -> dict:
+        """
+        Cache misses wait for a slot of server, see model_scheduler.py
         """
-        ctx = self.mk_context(*args, model=name, **kwargs)
+        key, response = cache.lookup(ctx, use_cache=use_cache, refresh_cache=refresh_cache)
+        if response is not None:
+            return self.from_cache(response, *args, **kwargs)
         self.print_calling_params(func, *args, ctx=ctx, **kwargs)
         # Call the appropriate model function.
         hlpp.play_sound("PROMPT2")
-        response = getattr(self, func)(*args, ctx=ctx, **kwargs)
+        self.set_keep_alive(func, name, server, ctx)
+        prefixes.observe(name, server, ctx)
+        with scheduler.slot(server, priority=priority):
+            response = getattr(self, func)(*args, ctx=ctx, **kwargs)
+        hlpp.play_sound("RESPONSE0")
+        cache.put(key, response, model=name)
+        return response
+
+    async def acall(self, *args, func:str, name:str, use_cache:bool=None,
+                        refresh_cache:bool=False, coalesce:bool=None, **kwargs) -> dict:
+        """
+        Async dispatch of the model call. Mirrors __call__ using the async backends.
+        """
+        ctx = self.mk_context(*args, **dict(kwargs, model=name))
+        if not single_flight.is_enabled(coalesce, ctx):
+            return await self.adispatch(*args, func=func, name=name, ctx=ctx,
+                                        use_cache=use_cache, refresh_cache=refresh_cache,
+                                        **kwargs)
+        return await single_flight.ado(self.flight_key(ctx, **kwargs), self.adispatch, *args,
+                                        func=func, name=name, ctx=ctx, use_cache=use_cache,
+                                        refresh_cache=refresh_cache, **kwargs)
+
+    async def adispatch(self, *args, func:str, name:str, ctx:dict, use_cache:bool=None,
+                        refresh_cache:bool=False, server:str=None, priority:str=None,
+                        **kwargs) -> dict:
+        key, response = cache.lookup(ctx, use_cache=use_cache, refresh_cache=refresh_cache)
+        if response is not None:
+            return self.from_cache(response, *args, **kwargs)
+        self.print_calling_params(func, *args, ctx=ctx, **kwargs)
+        hlpp.play_sound("PROMPT2")
+        self.set_keep_alive(func, name, server, ctx)
+        prefixes.observe(name, server, ctx)
+        async with scheduler.aslot(server, priority=priority):
+            response = await getattr(self, self.async_funcs[func])(*args, ctx=ctx, **kwargs)
         hlpp.play_sound("RESPONSE0")
+        cache.put(key, response, model=name)
         return response
 
+    @staticmethod
+    def set_keep_alive(func:str, name:str, server:str, ctx:dict) -> None:
+        """Ollama requests without an explicit keep_alive get the adaptive one."""
+        if func != '_ollama' or not residency.is_enabled():
+            return
+        residency.record(name, server)
+        if ctx.get('keep_alive') is None:
+            ctx['keep_alive'] = residency.keep_alive(name, server)
+
+    @staticmethod
+    def flight_key(ctx:dict, *args, server:str=None, **kwargs) -> str:
+        return single_flight.mk_key(ctx, server=server)
+
+    @staticmethod
+    def from_cache(response:dict, *args, verbose:int=0, **kwargs) -> dict:
+        if verbose:
+            print(f"{Fore.GREEN}RmConnect: response from cache{Fore.RESET} {cache.stats()}")
+        response['cached'] = True
+        return response
+
+    def stream(self, *args, func:str, name:str, server:str=None, priority:str=None,
+                        **kwargs) -> Iterator[dict]:
+        """
+        Streaming dispatch of the model call, yields {'response': str, 'done': bool} chunks.
+        The server slot is held until the stream is exhausted.
+        """
+        ctx = self.mk_context(*args, **dict(kwargs, model=name))
+        self.print_calling_params(func, *args, ctx=ctx, **kwargs)
+        hlpp.play_sound("PROMPT2")
+        self.set_keep_alive(func, name, server, ctx)
+        prefixes.observe(name, server, ctx)
+        with scheduler.slot(server, priority=priority):
+            yield from getattr(self, self.stream_funcs[func])(*args, ctx=ctx, **kwargs)
+        hlpp.play_sound("RESPONSE0")
+
     def mk_context(self, messages, *args, model:str, verbose:int=0, **kwargs) -> None:
         # Set up the context with model parameters.
         try:
@@ -338,52 +586,40 @@ class RmConnect:
         # print(f"{Fore.YELLOW}\nSending request to OllamaConnect module {url = }{Fore.RESET}")
         return OllamaConnect(url=url, **kwargs)(ctx=ctx)
 
-    # ───────────────────────── helpers ─────────────────────────
     @staticmethod
-    def _extract_tool_call(msg: Any) -> Optional[Dict[str, Any]]:
+    async def _aollama(*args, url:str, ctx:dict, **kwargs) -> dict:
         """
-        Return only the `{name, arguments}` part of the first tool-call, or None.
+        Async version of _ollama, uses the pooled httpx.AsyncClient of the running loop.
         """
-        tc = (msg.tool_calls[0] if getattr(msg, "tool_calls", None)
-              else getattr(msg, "function_call", None))
-        if not tc:
-            return None
-        name = tc.function.name if hasattr(tc, "function") else tc.name
-        args = tc.function.arguments if hasattr(tc, "function") else tc.arguments
-        return {"name": name, "arguments": json.loads(args or "{}")}
-
-    def _norm_response(self, *args, msg:Any, tool_call:Optional[dict]=None, **kwargs) -> str:
-        """
-        Ensure every OpenAI reply yields *some* text.
-        Cases handled
-        1. text only           → keep original text
-        2. tool-call only       → inject placeholder
-        3. text + tool-call     → keep original text
-        4. neither (invalid)    → raise for validator
-        """
-        has_text: bool = bool(msg.content and msg.content.strip())
-        has_tool: bool = tool_call is not None
-        if has_text:
-            return msg.content
-        if has_tool:
-            return json.dumps({'tool_call': tool_call})
-        raise ValueError("OpenAI returned neither text nor tool-call.")
+        return await OllamaConnect(url=url, **kwargs).__acall__(ctx=ctx)
+
+    @staticmethod
+    def _ollama_stream(*args, url:str, ctx:dict, **kwargs) -> Iterator[dict]:
+        """
+        Streaming version of _ollama, yields the generated text chunk by chunk.
+        """
+        yield from OllamaConnect(url=url, **kwargs).stream(ctx=ctx)
 
+    # ───────────────────────── openAI ─────────────────────────
     def openAI(self, *args, ctx: dict, **kwargs) -> dict:
         """
         Dispatch a chat request to the OpenAI backend and normalise the answer
-        into the project’s canonical response structure.
+        into the project’s canonical response structure. Repeats run concurrently
+        on a cached client, see model_openai_connect.py.
         """
-        client = OpenAI(api_key=msts.config.api_key)
-        ctx = {k: v for k, v in ctx.items() if k != "keep_alive"}  # OpenAI ignores this
-        msg = client.chat.completions.create(**ctx).choices[0].message
-        tool_call = self._extract_tool_call(msg)
-        response_txt: str = self._norm_response(msg=msg, tool_call=tool_call)
-        return {
-            "responses": [
-                {"response": response_txt, "tool_call": tool_call}
-            ]
-        }
+        return oai.OpenAIConnect()(ctx=ctx)
+
+    async def aopenAI(self, *args, ctx: dict, **kwargs) -> dict:
+        """
+        Async version of openAI using the cached AsyncOpenAI client.
+        """
+        return await oai.OpenAIConnect().__acall__(ctx=ctx)
+
+    def openAI_stream(self, *args, ctx: dict, **kwargs) -> Iterator[dict]:
+        """
+        Streaming version of openAI, yields the generated text chunk by chunk.
+        """
+        yield from oai.OpenAIConnect().stream(ctx=ctx)
 
 
 class SingleModelConnect(ModelConnect):
@@ -407,7 +643,17 @@ class SingleModelConnect(ModelConnect):
 class ModelStats:
     """
     Encapsulates timing statistics and logging for model calls.
+    Every call is recorded in the ring buffers of model_metrics.metrics, which provide
+    latency percentiles, throughput and error rates per (model, server), see summary.
+    Ollama reports token counts and durations per generation. These are harvested into
+    the response (prefill_tps, decode_tps, load_time, reloaded) and summed up per
+    (model, server) in self.throughput, see throughput_stats.
     """
+    # ollama durations are nanoseconds
+    ns = 1e9
+    # a load_duration above this many seconds means the model was (re)loaded
+    reload_threshold = 0.5
+
     def __init__(self, *args, columns: Optional[List[str]] = None, **kwargs) -> None:
         self.times = {
             'network_up_time': 0.0,
@@ -418,35 +664,161 @@ class ModelStats:
         self.columns = columns or [
             'network_up_time', 'server_time', 'network_down_time', 'total_time',
             'time_stamp', 'api_counter', 'prompt_counter', 'num_ctx_pr',
-            'num_ctx_resp', 'server', 'model'
+            'num_ctx_resp', 'server', 'model', 'ttft',
+            'prompt_eval_count', 'eval_count', 'prefill_tps', 'decode_tps', 'load_time',
+            'reloaded',
         ]
-        self.times_df = pd.DataFrame([{col: None for col in self.columns}], index=[0])
+        # the last recorded call, running totals are kept in self.times
+        self.last: Dict[str, Any] = {}
+        self.throughput: Dict[tuple, Dict[str, float]] = {}
 
     def __call__(self, r:dict, *args, model:str, **kwargs) -> dict:
         if model.startswith('gpt'):
+            if not self.is_replay(r):
+                metrics.record(model, r.get('server'), {'total_time': r.get('wall_time')},
+                                                                    ok=ModelConnect.is_ok(r))
             return r
         return self.update_stats(r, *args, **kwargs)
 
-    def update_stats(self, r: dict, *args, context_length: int = 8000,
-                     verbose: int = 0, **kwargs) -> dict:
-        """Update timing stats based on the response and context."""
-        r['network_down_time'] = time.time() - r.get('network_down_time', time.time())
-        time_delta = (r['network_down_time'] - r.get('network_up_time', 0)) / 2
-        r['network_up_time'] = r.get('network_up_time', 0) + time_delta
-        r['network_down_time'] -= time_delta
-        r['total_time'] = (         r['network_down_time'] +
+    def record_error(self, model: str, server: str, *args, **kwargs) -> None:
+        """Calls that raised are counted as errors, they have no response to record."""
+        metrics.record(model, server, {}, ok=False)
+
+    def percentile(self, model: str, server: str, col: str = 'total_time', q: float = 90,
+                        *args, **kwargs) -> Optional[float]:
+        """Historical latency percentile of (model, server), used to time hedged requests."""
+        return metrics.percentile(model, server, col, q, *args, **kwargs)
+
+    def summary(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """p50/p90/p99 latencies, throughput and error rate per 'model|server'."""
+        return metrics.summary(*args, **kwargs)
+
+    def print_summary(self, *args, **kwargs) -> None:
+        rows = []
+        for key, s in self.summary(*args, **kwargs).items():
+            row = {'model|server': key, 'requests': s['requests'], 'errors': s['error_rate'],
+                   'req/s': s['requests_per_sec'], 'tok/s': s['tokens_per_sec']}
+            for col in ('server_time', 'total_time'):
+                for p, v in s.get(col, {}).items():
+                    row[f"{col[:-5]} {p}"] = v
+            rows.append(row)
+        hlpp.pretty_print_df(pd.DataFrame(rows), *args, **kwargs)
+
+    def harvest(self, r: dict, *args, **kwargs) -> dict:
+        """
+        Sums the server reported counters of all responses into r and derives
+        tokens/sec for prefill (prompt eval) and decode (eval) and the model load time.
+        Returns the raw sums, which are empty if the server did not report any.
+        """
+        sums = {}
+        for resp in r.get('responses', []):
+            for k in OllamaConnect.timing_keys:
+                if resp.get(k) is not None:
+                    sums[k] = sums.get(k, 0) + resp[k]
+        if not sums:
+            return sums
+        r['prompt_eval_count'] = sums.get('prompt_eval_count', 0)
+        r['eval_count'] = sums.get('eval_count', 0)
+        r['prefill_tps'] = self.rate(sums.get('prompt_eval_count'),
+                                        sums.get('prompt_eval_duration'))
+        r['decode_tps'] = self.rate(sums.get('eval_count'), sums.get('eval_duration'))
+        r['load_time'] = sums.get('load_duration', 0) / self.ns
+        r['reloaded'] = r['load_time'] > self.reload_threshold
+        # repeats run in parallel, so the slowest generation is the server time
+        r['ollama_time'] = max(resp.get('total_duration', 0)
+                                    for resp in r.get('responses', [])) / self.ns
+        return sums
+
+    @staticmethod
+    def calibrate_tokens(r: dict, messages: Any = None, *args, **kwargs) -> None:
+        """
+        Tunes the num_ctx token estimate (model_tokens.py) with the prompt tokens the
+        server counted. Repeats evaluate the same prompt, the largest count is the least
+        reduced by a cached prefix.
+        """
+        counts = [resp['prompt_eval_count'] for resp in r.get('responses', [])
+                                                        if resp.get('prompt_eval_count')]
+        if not counts or not messages:
+            return
+        messages = messages if isinstance(messages, list) else [messages]
+        tokens.calibrate(''.join(tokens.content(msg) for msg in messages), max(counts))
+
+    def rate(self, count: Optional[int], duration: Optional[int]) -> Optional[float]:
+        if not count or not duration:
+            return None
+        return round(count / (duration / self.ns), 2)
+
+    def update_throughput(self, r: dict, sums: dict, *args, **kwargs) -> None:
+        if not sums or self.is_replay(r):
+            return
+        key = (r.get('model'), r.get('server'))
+        t = self.throughput.setdefault(key, {k: 0 for k in OllamaConnect.timing_keys})
+        for k, v in sums.items():
+            t[k] += v
+        t['requests'] = t.get('requests', 0) + 1
+        t['reloads'] = t.get('reloads', 0) + int(r['reloaded'])
+        t['last_load_time'] = r['load_time']
+
+    def throughput_stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """
+        Real throughput per model and server, i.e.
+        {'llama3.2:3b|while-ai_0': {'prefill_tps': 2100.5, 'decode_tps': 95.1, ...}}
+        """
+        return {f"{model}|{server}": {
+                            'requests': t['requests'],
+                            'prompt_tokens': t['prompt_eval_count'],
+                            'generated_tokens': t['eval_count'],
+                            'prefill_tps': self.rate(t['prompt_eval_count'],
+                                                        t['prompt_eval_duration']),
+                            'decode_tps': self.rate(t['eval_count'], t['eval_duration']),
+                            'load_time': round(t['load_duration'] / self.ns, 3),
+                            'last_load_time': t['last_load_time'],
+                            'reloads': t['reloads'],
+                    }
+                for (model, server), t in self.throughput.items()}
+
+    def update_times(self, r: dict, *args, **kwargs) -> None:
+        """
+        The altered endpoint server reports network_up_time and server_time, otherwise
+        the server time is the one ollama reports and the network time is the rest of
+        the wall time.
+        """
+        if 'network_up_time' in r:
+            r['network_down_time'] = time.time() - r.get('network_down_time', time.time())
+            time_delta = (r['network_down_time'] - r.get('network_up_time', 0)) / 2
+            r['network_up_time'] = r.get('network_up_time', 0) + time_delta
+            r['network_down_time'] -= time_delta
+        elif 'ollama_time' in r and 'wall_time' in r:
+            r['server_time'] = r['ollama_time']
+            network_time = max(r['wall_time'] - r['server_time'], 0.0)
+            r['network_up_time'] = r['network_down_time'] = network_time / 2
+        r['total_time'] = (         r.get('network_down_time', 0) +
                                     r.get('network_up_time', 0) +
                                     r.get('server_time', 0)
         )
+
+    @staticmethod
+    def is_replay(r: dict) -> bool:
+        """Cached and coalesced responses took no server time of their own."""
+        return bool(r.get('cached') or r.get('coalesced'))
+
+    def update_stats(self, r: dict, *args, context_length: int = 8000,
+                     verbose: int = 0, **kwargs) -> dict:
+        """Update timing stats based on the response and context."""
+        sums = self.harvest(r)
+        if not self.is_replay(r):
+            self.update_times(r)
+            self.calibrate_tokens(r, *args)
+        self.update_throughput(r, sums)
         all_responses = [resp.get('response', []) for resp in r.get('responses', [])]
         r['num_ctx_resp'] = (max(len(resp) // 3 for resp in all_responses)
                              if all_responses else 0)
         r['time_stamp'] = dt.now().strftime("%H:%M")
         for col in self.times:
             self.times[col] += r.get(col, 0)
-        self.times_df.iloc[-1] = {k: r.get(k, None) for k in self.columns}
-        self.times_df.loc[len(self.times_df)] = {col: self.times.get(col, 0)
-                                                  for col in self.columns}
+        self.last = {k: r.get(k, None) for k in self.columns}
+        if not self.is_replay(r):
+            metrics.record(r.get('model'), r.get('server'), r, ok=ModelConnect.is_ok(r))
         if verbose:
-            hlpp.pretty_print_df(self.times_df, *args, sum_color=Fore.MAGENTA, **kwargs)
+            self.print_summary(*args, **kwargs)
         return r
@@ -0,0 +1,161 @@
+"""
+model_hedge.py
+Hedged requests for tail latency control. If the primary server has not answered within
+a percentile of its own recorded latency (model_metrics.py), the same request is sent to a
+pool peer that serves the same model (model_balancer.py). The first answer wins.
+The losing leg is cancelled, which closes its model request and frees its scheduler slot.
+ModelConnect.post races async legs on the event loop thread of the hedger for that, plain
+sync callables (Hedger.run) can not be interrupted, their answer is dropped.
+A budget caps the fraction of requests that may be hedged, so a slow cluster is not
+flooded with duplicates.
+
+Enable by default:  models_servers.yml -> params.hedge.enabled: true
+Enable per call:    ModelConnect().post(prompts, alias='l3.2_gpus', hedge=True)
+
+Import: from altered.model_hedge import hedger
+    hedger.stats() -> {'requests': 120, 'hedged': 9, 'backup_wins': 6, ...}
+"""
+
+import asyncio, threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+from colorama import Fore
+
+import altered.model_params as msts
+from altered.hlp_lazy import lazy_instance
+
+
+class Hedger:
+    defaults = {
+                'enabled': False,
+                # percentile of the recorded column that triggers the backup request
+                'percentile': 90,
+                'column': 'total_time',
+                'min_samples': 20,
+                'min_delay': 1.0,
+                # max fraction of requests that are hedged
+                'budget': 0.1,
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('hedge') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'hedged': 0, 'backup_wins': 0, 'over_budget': 0,
+                       'no_history': 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def is_enabled(self, hedge: Optional[bool] = None) -> bool:
+        return bool(self.params['enabled'] if hedge is None else hedge)
+
+    def delay(self, stats: Any, model: str, server: str) -> Optional[float]:
+        """
+        Seconds to wait for the primary before hedging, None if (model, server) has
+        too little history. stats is the ModelStats of the calling ModelConnect.
+        """
+        latency = stats.percentile(model, server, self.params['column'],
+                                   self.params['percentile'],
+                                   min_samples=self.params['min_samples'])
+        with self.lock:
+            self.counts['requests'] += 1
+            if latency is None:
+                self.counts['no_history'] += 1
+                return None
+        return max(latency, self.params['min_delay'])
+
+    def take_budget(self) -> bool:
+        with self.lock:
+            if self.counts['hedged'] + 1 > self.params['budget'] * self.counts['requests']:
+                self.counts['over_budget'] += 1
+                return False
+            self.counts['hedged'] += 1
+            return True
+
+    def won(self, leg: int, *args, **kwargs) -> None:
+        if leg:
+            with self.lock:
+                self.counts['backup_wins'] += 1
+
+    # ─── racing ───────────────────────────────────────────────────────────
+    def run(self, primary: Callable, backup: Callable, delay: float) -> Tuple[Any, int]:
+        """
+        Returns (result, leg) where leg 0 is the primary and 1 the backup.
+        The backup only starts if the primary takes longer than delay.
+        """
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            legs = [executor.submit(primary)]
+            if wait(legs, timeout=delay).done or not self.take_budget():
+                return legs[0].result(), 0
+            print(f"{Fore.YELLOW}Hedger: no answer after {delay:.2f}s, hedging{Fore.RESET}")
+            legs.append(executor.submit(backup))
+            pending = set(legs)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for leg, future in enumerate(legs):
+                    if future in done and future.exception() is None:
+                        self.won(leg)
+                        return future.result(), leg
+            # both legs failed, report the primary error
+            return legs[0].result(), 0
+        finally:
+            # the losing thread finishes in the background, its result is dropped
+            executor.shutdown(wait=False)
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop thread of run_in_loop, async clients are bound to a single loop."""
+        with self.lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    def run_in_loop(self, primary: Callable, backup: Callable, delay: float
+                    ) -> Tuple[Any, int]:
+        """
+        Sync version of arun, primary and backup return awaitables. The race runs on the
+        event loop thread of the hedger, so the losing leg is cancelled as in arun.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.arun(primary, backup, delay),
+                                                                                self.loop())
+        try:
+            return future.result()
+        except BaseException:
+            # i.e. Ctrl+C in the caller, both legs are cancelled
+            future.cancel()
+            raise
+
+    async def arun(self, primary: Callable, backup: Callable, delay: float
+                    ) -> Tuple[Any, int]:
+        """Async version of run, primary and backup return awaitables."""
+        legs = [asyncio.ensure_future(primary())]
+        pending = set(legs)
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done or not self.take_budget():
+                return await legs[0], 0
+            print(f"{Fore.YELLOW}Hedger: no answer after {delay:.2f}s, hedging{Fore.RESET}")
+            legs.append(asyncio.ensure_future(backup()))
+            pending = set(legs)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for leg, task in enumerate(legs):
+                    if task in done and task.exception() is None:
+                        self.won(leg)
+                        return task.result(), leg
+            return await legs[0], 0
+        finally:
+            for task in pending:
+                task.cancel()
+            # the loser has closed its request and freed its slot when the winner returns
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            counts = dict(self.counts)
+        counts['hedge_rate'] = round(counts['hedged'] / counts['requests'], 3) \
+                                                            if counts['requests'] else 0.0
+        return counts
+
+
+hedger = lazy_instance(Hedger)
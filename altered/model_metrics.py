@@ -0,0 +1,123 @@
+"""
+model_metrics.py
+Fixed size latency and throughput statistics per (model, server). Every model call adds
+one row to a numpy ring buffer, so recording and querying cost the same no matter how
+long the process has been running.
+
+Import: from altered.model_metrics import metrics
+    metrics.record('llama3.2:3b', 'while-ai_0', {'total_time': 1.2, 'server_time': 1.0})
+    metrics.summary() -> {'llama3.2:3b|while-ai_0': {'total_time': {'p50': 1.2, ...}, ...}}
+"""
+
+import threading, time
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Keeps the last capacity rows of a float matrix, the oldest row is overwritten first.
+    Missing values are stored as NaN.
+    """
+
+    def __init__(self, columns: List[str], capacity: int = 1024, *args, **kwargs) -> None:
+        self.columns = list(columns)
+        self.ixs = {col: i for i, col in enumerate(self.columns)}
+        self.capacity = capacity
+        self.data = np.full((capacity, len(self.columns)), np.nan, dtype=np.float64)
+        self.head, self.size = 0, 0
+
+    def append(self, row: Dict[str, Any]) -> None:
+        values = np.full(len(self.columns), np.nan)
+        for col, value in row.items():
+            if col in self.ixs and value is not None:
+                values[self.ixs[col]] = float(value)
+        self.data[self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def column(self, col: str) -> np.ndarray:
+        """Values of col in insertion order, oldest first."""
+        if self.size < self.capacity:
+            return self.data[:self.size, self.ixs[col]]
+        return np.roll(self.data[:, self.ixs[col]], -self.head)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class MetricsRegistry:
+    """
+    One RingBuffer per (model, server). summary() reports percentiles of the time columns,
+    the request and token throughput over the buffered window and the error rate.
+    """
+    time_columns = ['network_up_time', 'server_time', 'network_down_time', 'total_time', 'ttft']
+    columns = ['time_stamp', 'ok', 'eval_count', 'prompt_eval_count'] + time_columns
+    percentiles = (50, 90, 99)
+
+    def __init__(self, *args, capacity: int = 1024, **kwargs) -> None:
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.buffers: Dict[tuple, RingBuffer] = {}
+
+    def record(self, model: str, server: Optional[str], row: Dict[str, Any], *args,
+                    ok: bool = True, **kwargs) -> None:
+        key = (model, server)
+        with self.lock:
+            if key not in self.buffers:
+                self.buffers[key] = RingBuffer(self.columns, self.capacity)
+            self.buffers[key].append(dict(row, time_stamp=time.time(), ok=float(ok)))
+
+    def summarize(self, buffer: RingBuffer) -> Dict[str, Any]:
+        stamps, ok = buffer.column('time_stamp'), buffer.column('ok')
+        span = float(stamps[-1] - stamps[0]) if len(buffer) > 1 else 0.0
+        out = {
+                'requests': len(buffer),
+                'error_rate': round(float(1 - np.mean(ok)), 3),
+                'requests_per_sec': round((len(buffer) - 1) / span, 3) if span else None,
+                'tokens_per_sec': None,
+        }
+        tokens = buffer.column('eval_count')
+        if span and not np.all(np.isnan(tokens)):
+            out['tokens_per_sec'] = round(float(np.nansum(tokens[1:])) / span, 2)
+        for col in self.time_columns:
+            values = buffer.column(col)
+            values = values[~np.isnan(values)]
+            if not len(values):
+                continue
+            ps = np.percentile(values, self.percentiles)
+            out[col] = {f"p{p}": round(float(v), 3) for p, v in zip(self.percentiles, ps)}
+            out[col]['mean'] = round(float(values.mean()), 3)
+        return out
+
+    def summary(self, *args, model: str = None, server: str = None, **kwargs
+                    ) -> Dict[str, Dict[str, Any]]:
+        """Summaries per 'model|server', optionally filtered by model and server."""
+        with self.lock:
+            buffers = {k: b for k, b in self.buffers.items()
+                                if (model is None or k[0] == model)
+                                and (server is None or k[1] == server)}
+            return {f"{m}|{s}": self.summarize(b) for (m, s), b in buffers.items()}
+
+    def percentile(self, model: str, server: Optional[str], col: str, q: float, *args,
+                        min_samples: int = 1, **kwargs) -> Optional[float]:
+        """
+        q-th percentile of col over the successful calls of (model, server), None if
+        there are fewer than min_samples of them.
+        """
+        with self.lock:
+            buffer = self.buffers.get((model, server))
+            if buffer is None:
+                return None
+            values, ok = buffer.column(col).copy(), buffer.column('ok').copy()
+        values = values[~np.isnan(values) & (ok == 1)]
+        if len(values) < min_samples:
+            return None
+        return float(np.percentile(values, q))
+
+    def clear(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.buffers.clear()
+
+
+metrics = MetricsRegistry()
@@ -1,18 +1,37 @@
 # altered/ollama_connect.py  – REPLACE the previous version
-from typing import Any, Dict, Callable, Optional
-import json, httpx
-from ollama import Client
+from typing import Any, AsyncIterator, Dict, Callable, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, json, httpx
 from colorama import Fore
 
+import altered.model_params as msts
+from altered.model_client_pool import clients, ClientPool
+from altered.model_tokens import tokens
+
 class OllamaConnect:
     """
     Direct bridge to the Ollama daemon.
     Signature preserved:  OllamaConnect()(ctx=ctx, url=url)
+    Async use:            await OllamaConnect(url=url).__acall__(ctx=ctx)
+    Streaming:            for chunk in OllamaConnect(url=url).stream(ctx=ctx): ...
+    Embeddings:           ctx['service_endpoint'] in embed_endpoints, one vector per prompt
     """
+    embed_endpoints = {"embeddings", "get_embeddings"}
+    # server reported counters, durations are in nanoseconds (see ModelStats.harvest)
+    timing_keys = ("prompt_eval_count", "prompt_eval_duration", "eval_count",
+                   "eval_duration", "load_duration", "total_duration")
+    # fallback batch limits for /api/embed, see models_servers.yml -> params.embed
+    embed_defaults = {"max_batch_size": 32, "max_batch_tokens": 8192}
+    # RmConnect sets an adaptive keep_alive (model_residency.py), this is the fallback,
+    # None: models_servers.yml defaults.keep_alive, read at the first request
+    keep_alive: Optional[int] = None
 
     def __init__(self, *, url: str, timeout: int = 120, **__) -> None:
-        self.url = url
-        self.client = Client(host=self.url.split('/api', 1)[0], timeout=timeout)
+        self.url, self.timeout = url, timeout
+        # pooled client, keeps the http connections to the host alive between requests
+        self.client = clients.get(self.url, timeout=timeout)
+        # repeats are fanned out to at most num_parallel slots of the host
+        self.num_parallel = msts.config.get_num_parallel(ClientPool.host_of(self.url))
 
     # ─── public entry ──────────────────────────────────────────────────────
     def __call__(self, *, ctx: Dict[str, Any]) -> Dict[str, Any]:
@@ -21,59 +40,223 @@ class OllamaConnect:
         except httpx.TimeoutException as err:
             return {"responses": [{"error": str(err)}]}
 
+    async def __acall__(self, *, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        # async clients are bound to the running loop, so we fetch them per call
+        self.aclient = clients.aget(self.url, timeout=self.timeout)
+        try:
+            return await self._aroute(ctx)(ctx)
+        except httpx.TimeoutException as err:
+            return {"responses": [{"error": str(err)}]}
+
+    def stream(self, *, ctx: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the generated text chunk by chunk as {'response': str, 'done': bool}.
+        Streaming always produces a single generation, repeats are ignored.
+        """
+        if ctx.get("tools"):
+            for part in self.client.chat(**dict(self._chat_params(ctx), stream=True)):
+                yield self._stream_chunk(part, part["message"].get("content") or '')
+        else:
+            for part in self.client.generate(**dict(self._generate_params(ctx), stream=True)):
+                yield self._stream_chunk(part, part["response"])
+
+    async def astream(self, *, ctx: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Async version of stream."""
+        aclient = clients.aget(self.url, timeout=self.timeout)
+        if ctx.get("tools"):
+            async for part in await aclient.chat(**dict(self._chat_params(ctx), stream=True)):
+                yield self._stream_chunk(part, part["message"].get("content") or '')
+        else:
+            params = dict(self._generate_params(ctx), stream=True)
+            async for part in await aclient.generate(**params):
+                yield self._stream_chunk(part, part["response"])
+
     # ─── routing helpers ───────────────────────────────────────────────────
     def _route(self, ctx: Dict[str, Any]) -> Callable:
         # print(f"\n\n\n{Fore.CYAN}_route with model:{Fore.RESET} \n{ctx}")
-        if ctx.get("service_endpoint") == "embeddings":
+        if ctx.get("service_endpoint") in self.embed_endpoints:
             return self._embeddings
         if ctx.get("tools"):
             return self._chat
         return self._generate
 
+    def _aroute(self, ctx: Dict[str, Any]) -> Callable:
+        if ctx.get("service_endpoint") in self.embed_endpoints:
+            return self._aembeddings
+        if ctx.get("tools"):
+            return self._achat
+        return self._agenerate
+
+    # ─── request builders (shared by sync and async endpoints) ────────────
+    @classmethod
+    def _keep_alive(cls, ctx: Dict[str, Any]) -> Any:
+        if "keep_alive" in ctx:
+            return ctx["keep_alive"]
+        if cls.keep_alive is None:
+            cls.keep_alive = msts.config.defaults.get("keep_alive") or 1000
+        return cls.keep_alive
+
+    @classmethod
+    def _generate_params(cls, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(model=ctx["model"],
+                    prompt="".join(ctx["prompts"]),
+                    options=ctx.get("options", {}),
+                    keep_alive=cls._keep_alive(ctx),
+                    stream=False)
+
+    @classmethod
+    def _chat_params(cls, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        messages = ctx.get("messages") or [{'role': 'user', 'content': p}
+                                           for p in ctx.get("prompts", [])]
+        tc_flag_none = ctx.get("tool_choice") == "none"
+        return dict(model=ctx["model"], messages=messages,
+                    tools=None if tc_flag_none else ctx.get("tools"),
+                    keep_alive=cls._keep_alive(ctx),
+                    stream=False)
+
+    @staticmethod
+    def _embed_inputs(ctx: Dict[str, Any]) -> List[str]:
+        # with tools present ConParams puts the prompts into messages
+        prompts = ctx.get("prompts") or [m.get("content") for m in ctx.get("messages", [])]
+        return [prompts] if isinstance(prompts, str) else list(prompts)
+
+    @classmethod
+    def mk_batches(cls, texts: List[str], *args, max_batch_size: int = None,
+                        max_batch_tokens: int = None, **kwargs) -> List[List[str]]:
+        """
+        Splits texts into consecutive batches for /api/embed. A batch is closed when it
+        holds max_batch_size texts or its tokens (model_tokens.py) would exceed
+        max_batch_tokens. A single oversized text gets a batch of its own.
+        Example:
+            OllamaConnect.mk_batches(['a', 'b', 'c'], max_batch_size=2) -> [['a', 'b'], ['c']]
+        """
+        limits = dict(cls.embed_defaults, **(msts.config.params.get('embed') or {}))
+        max_batch_size = max_batch_size or limits['max_batch_size']
+        max_batch_tokens = max_batch_tokens or limits['max_batch_tokens']
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            num_tokens = tokens.count(text)
+            is_full = len(batch) >= max_batch_size or batch_tokens + num_tokens > max_batch_tokens
+            if batch and is_full:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += num_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    def _embed_response(outs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        responses = [{"embedding": list(vec), "tool_call": None}
+                                                for out in outs for vec in out["embeddings"]]
+        return {"responses": responses, "num_results": len(responses)}
+
+    def _chat_error(self, ctx: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+        msg = {'content': (
+                            f"\n{Fore.RED}ERROR: model_ollama_connect._chat: "
+                            f"\n{e =}\n{self.url = }, {ctx['model'] =}{Fore.RESET}"
+                            )}
+        print(msg['content'])
+        return msg
+
+    def _chat_response(self, msg: Dict[str, Any], c: Any = None) -> Dict[str, Any]:
+        tc = self._norm_tool((msg.get("tool_calls") or [None])[0])
+        content = msg.get("content") or json.dumps({"tool_call": tc} )
+        return {"responses": [{"response": content, "tool_call": tc, **self._timings(c)}]}
+
     # ─── endpoints ────────────────────────────────────────────────────────
     def _generate(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
         print(f"\n\n\n{Fore.YELLOW}_generate with model:{Fore.RESET} \n{ctx}")
         rpt = ctx.get("repeats", {}).get("num", 1)
-        outs = [self._once_generate(ctx) for _ in range(rpt)]
+        if rpt <= 1 or self.num_parallel <= 1:
+            outs = [self._once_generate(ctx) for _ in range(rpt)]
+        else:
+            # executor.map keeps the original order of the repeats
+            with ThreadPoolExecutor(max_workers=min(rpt, self.num_parallel)) as executor:
+                outs = list(executor.map(self._once_generate, [ctx] * rpt))
         return {"responses": outs, "num_results": len(outs)}
 
     def _once_generate(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
         # print(f"\n\n\n{Fore.RED}_once_generate with model:{Fore.RESET} \n{ctx}")
-        g = self.client.generate(model=ctx["model"],
-                                 prompt="".join(ctx["prompts"]),
-                                 options=ctx.get("options", {}),
-                                 keep_alive=ctx.get("keep_alive", 1000),
-                                 stream=False)
-        return {"response": g["response"], "tool_call": None}
+        g = self.client.generate(**self._generate_params(ctx))
+        return {"response": g["response"], "tool_call": None, **self._timings(g)}
 
     def _chat(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
         # print(f"\n\n\n{Fore.RED}_chat with model:{Fore.RESET} \n{ctx}")
-        messages = ctx.get("messages") or [{'role': 'user', 'content': p}
-                                           for p in ctx.get("prompts", [])]
-        tc_flag_none = ctx.get("tool_choice") == "none"
-        tools = None if tc_flag_none else ctx.get("tools")
-        msg = {}
+        c = None
         try:
-            msg = self.client.chat(model=ctx["model"], messages=messages,
-                               tools=tools,
-                               keep_alive=ctx.get("keep_alive", 1000),
-                               stream=False)["message"]
+            c = self.client.chat(**self._chat_params(ctx))
+            msg = c["message"]
         except Exception as e:
-            msg['content'] = (
-                                f"\n{Fore.RED}ERROR: model_ollama_connect._chat: "
-                                f"\n{e =}\n{self.url = }, {ctx['model'] =}{Fore.RESET}"
-                                )
-            print(msg['content'])
-        tc = self._norm_tool((msg.get("tool_calls") or [None])[0])
-        content = msg.get("content") or json.dumps({"tool_call": tc} )
-        return {"responses": [{"response": content, "tool_call": tc}]}
+            msg = self._chat_error(ctx, e)
+        return self._chat_response(msg, c)
 
     def _embeddings(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
-        vec = self.client.embeddings(model=ctx["model"],
-                                     prompt="".join(ctx["prompts"]))
-        return {"responses": [{"response": vec, "tool_call": None}]}
+        """
+        Sends the prompts in batches to /api/embed and returns one vector per prompt,
+        in prompt order.
+        """
+        batches = self.mk_batches(self._embed_inputs(ctx))
+        keep_alive = self._keep_alive(ctx)
+        embed = lambda batch: self.client.embed(model=ctx["model"], input=batch,
+                                                keep_alive=keep_alive)
+        if len(batches) <= 1 or self.num_parallel <= 1:
+            outs = [embed(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(batches), self.num_parallel)) as executor:
+                outs = list(executor.map(embed, batches))
+        return self._embed_response(outs)
+
+    # ─── async endpoints ──────────────────────────────────────────────────
+    async def _agenerate(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        rpt = ctx.get("repeats", {}).get("num", 1)
+        slots = asyncio.Semaphore(self.num_parallel)
+
+        async def bounded(ctx: Dict[str, Any]) -> Dict[str, Any]:
+            async with slots:
+                return await self._aonce_generate(ctx)
+        # gather keeps the original order of the repeats
+        outs = list(await asyncio.gather(*[bounded(ctx) for _ in range(rpt)]))
+        return {"responses": outs, "num_results": len(outs)}
+
+    async def _aonce_generate(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        g = await self.aclient.generate(**self._generate_params(ctx))
+        return {"response": g["response"], "tool_call": None, **self._timings(g)}
+
+    async def _achat(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        c = None
+        try:
+            c = await self.aclient.chat(**self._chat_params(ctx))
+            msg = c["message"]
+        except Exception as e:
+            msg = self._chat_error(ctx, e)
+        return self._chat_response(msg, c)
+
+    async def _aembeddings(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        slots = asyncio.Semaphore(self.num_parallel)
+        keep_alive = self._keep_alive(ctx)
+
+        async def bounded(batch: List[str]) -> Dict[str, Any]:
+            async with slots:
+                return await self.aclient.embed(model=ctx["model"], input=batch,
+                                                keep_alive=keep_alive)
+        batches = self.mk_batches(self._embed_inputs(ctx))
+        return self._embed_response(await asyncio.gather(*[bounded(b) for b in batches]))
 
     # ─── misc helpers ──────────────────────────────────────────────────────
+    @classmethod
+    def _timings(cls, r: Any) -> Dict[str, int]:
+        """Server reported token counts and durations of an ollama response."""
+        if r is None:
+            return {}
+        return {k: r.get(k) for k in cls.timing_keys if r.get(k) is not None}
+
+    @classmethod
+    def _stream_chunk(cls, part: Any, text: str) -> Dict[str, Any]:
+        # the final chunk (done=True) carries the timings of the whole generation
+        return {"response": text, "done": bool(part.get("done")), **cls._timings(part)}
+
     @staticmethod
     def _norm_tool(tc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         if tc is None:
@@ -0,0 +1,165 @@
+"""
+model_openai_connect.py
+Bridge to the OpenAI chat completions API, the counterpart of model_ollama_connect.py.
+Clients are cached per (api_key, base_url) so the http stack is built once, repeats are
+sent concurrently and every request goes through the same RetryEngine policy
+(models_servers.yml -> params.retry) as the Ollama path.
+
+Signature:      OpenAIConnect()(ctx=ctx)
+Async use:      await OpenAIConnect().__acall__(ctx=ctx)
+Streaming:      for chunk in OpenAIConnect().stream(ctx=ctx): ...
+Stand-in:       servers.openAI.base_url points the client to any OpenAI compatible server
+"""
+
+import asyncio, json, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+import altered.model_params as msts
+from altered.model_retry import RetryEngine
+
+
+class OpenAIConnect:
+
+    # request keys the chat completions API understands, everything else stays local
+    oai_keys = {'model', 'messages', 'temperature', 'tools', 'tool_choice', 'seed',
+                'max_tokens', 'response_format'}
+    clients: Dict[tuple, OpenAI] = {}
+    aclients: Dict[tuple, AsyncOpenAI] = {}
+    lock = threading.Lock()
+    # shared by all instances, so the circuit breaker sees every request, see retry
+    engine: Optional[RetryEngine] = None
+
+    def __init__(self, *args, api_key: str = None, base_url: str = None,
+                    timeout: float = None, **kwargs) -> None:
+        server = msts.config.servers.get('openAI') or {}
+        self.api_key = api_key or msts.config.api_key
+        self.base_url = base_url or server.get('base_url')
+        self.timeout = timeout or msts.config.params.get('timeout')
+        self.num_parallel = max(int(server.get('num_parallel') or 1), 1)
+
+    @property
+    def retry(self) -> RetryEngine:
+        """Built at the first request, importing this module reads no config."""
+        cls = type(self)
+        with self.lock:
+            if cls.engine is None:
+                cls.engine = RetryEngine(max_retries=msts.config.params.get('max_retries'),
+                        **{k: v for k, v in (msts.config.params.get('retry') or {}).items()
+                                                                    if k != 'kill_on_open'},
+                        retry_exceptions=(openai.APIConnectionError,),
+                        timeout_exceptions=(openai.APITimeoutError,),
+                )
+            return cls.engine
+
+    # ─── cached clients ───────────────────────────────────────────────────
+    @property
+    def client(self) -> OpenAI:
+        key = (self.api_key, self.base_url, self.timeout)
+        with self.lock:
+            if key not in self.clients:
+                # retries are done by self.retry, not by the openai client
+                self.clients[key] = OpenAI(api_key=self.api_key, base_url=self.base_url,
+                                           timeout=self.timeout, max_retries=0)
+            return self.clients[key]
+
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        # async clients are bound to the running loop
+        key = (self.api_key, self.base_url, self.timeout, id(asyncio.get_running_loop()))
+        with self.lock:
+            if key not in self.aclients:
+                self.aclients[key] = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                                 timeout=self.timeout, max_retries=0)
+            return self.aclients[key]
+
+    # ─── public entry ──────────────────────────────────────────────────────
+    def __call__(self, *, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        params, rpt = self._oai_params(ctx), self._repeats(ctx)
+        if rpt <= 1 or self.num_parallel <= 1:
+            msgs = [self._once(params) for _ in range(rpt)]
+        else:
+            # executor.map keeps the original order of the repeats
+            with ThreadPoolExecutor(max_workers=min(rpt, self.num_parallel)) as executor:
+                msgs = list(executor.map(self._once, [params] * rpt))
+        return self._response(msgs)
+
+    async def __acall__(self, *, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        params, slots = self._oai_params(ctx), asyncio.Semaphore(self.num_parallel)
+
+        async def bounded() -> Any:
+            async with slots:
+                return await self._aonce(params)
+        return self._response(await asyncio.gather(*[bounded()
+                                                        for _ in range(self._repeats(ctx))]))
+
+    def stream(self, *, ctx: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Yields {'response': str, 'done': bool}, repeats are ignored."""
+        parts = self.retry.call('openAI', self.client.chat.completions.create,
+                                                    **self._oai_params(ctx), stream=True)
+        for part in parts:
+            if not part.choices:
+                continue
+            choice = part.choices[0]
+            yield {"response": choice.delta.content or '',
+                   "done": choice.finish_reason is not None}
+
+    # ─── requests ─────────────────────────────────────────────────────────
+    def _once(self, params: Dict[str, Any]) -> Any:
+        return self.retry.call('openAI', self.client.chat.completions.create,
+                                                    **params).choices[0].message
+
+    async def _aonce(self, params: Dict[str, Any]) -> Any:
+        r = await self.retry.acall('openAI', self.aclient.chat.completions.create, **params)
+        return r.choices[0].message
+
+    # ─── helpers ──────────────────────────────────────────────────────────
+    @classmethod
+    def _oai_params(cls, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        params = {k: v for k, v in ctx.items() if k in cls.oai_keys}
+        if ctx.get('num_predict') is not None:
+            params['max_tokens'] = ctx['num_predict']
+        return params
+
+    @staticmethod
+    def _repeats(ctx: Dict[str, Any]) -> int:
+        return max(int((ctx.get('repeats') or {}).get('num') or 1), 1)
+
+    def _response(self, msgs: list) -> Dict[str, Any]:
+        outs = []
+        for msg in msgs:
+            tool_call = self._extract_tool_call(msg)
+            outs.append({"response": self._norm_response(msg, tool_call),
+                         "tool_call": tool_call})
+        return {"responses": outs, "num_results": len(outs)}
+
+    @staticmethod
+    def _extract_tool_call(msg: Any) -> Optional[Dict[str, Any]]:
+        """
+        Return only the `{name, arguments}` part of the first tool-call, or None.
+        """
+        tc = (msg.tool_calls[0] if getattr(msg, "tool_calls", None)
+              else getattr(msg, "function_call", None))
+        if not tc:
+            return None
+        name = tc.function.name if hasattr(tc, "function") else tc.name
+        args = tc.function.arguments if hasattr(tc, "function") else tc.arguments
+        return {"name": name, "arguments": json.loads(args or "{}")}
+
+    @staticmethod
+    def _norm_response(msg: Any, tool_call: Optional[dict] = None) -> str:
+        """
+        Ensure every OpenAI reply yields *some* text.
+        Cases handled
+        1. text only           → keep original text
+        2. tool-call only       → inject placeholder
+        3. text + tool-call     → keep original text
+        4. neither (invalid)    → raise for validator
+        """
+        if msg.content and msg.content.strip():
+            return msg.content
+        if tool_call is not None:
+            return json.dumps({'tool_call': tool_call})
+        raise ValueError("OpenAI returned neither text nor tool-call.")
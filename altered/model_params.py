@@ -3,16 +3,21 @@ model_settings.py
 path: ~/python_venvs/libs/altered_bytes/altered/model_settings.py
 This file contains the settings for the openAI model. 
 Import: import altered.model_params as msts
-msts.params.config, msts.params.api_key
+msts.config.params, msts.config.api_key (loaded at first access)
 """
 
-import os, re, requests, shutil
+import os, re, shutil, threading
 import yaml
 from datetime import datetime as dt
 from typing import Dict, Tuple, Union
+from urllib.parse import urlsplit
 import altered.settings as sts
+from altered.hlp_lazy import lazy_import
+from altered.model_balancer import LoadBalancer
 from colorama import Fore, Style
 
+requests = lazy_import('requests')
+
 
 class ModelParams:
 
@@ -21,10 +26,12 @@ class ModelParams:
         self.config = self._load_model_configs(*args, **kwargs)
         self.aliasses = self.config.get('aliasses', {})
         self.servers = self.config.get('servers', {})
+        self.pools = self.config.get('pools', {}) or {}
         self.models = self.config.get('models', {})
         self.defaults, self.used_defaults = self.config.get('defaults', {}), {}
         self.overwrites = self.config.get('overwrites', {})
         self.params = self.config.get('params', {})
+        self.balancer = LoadBalancer(self.servers, self.pools, self.params.get('balancer'))
         self.last_update = dt.now().strftime('%Y-%m-%d')
         self.api_key = self.get_api_key(*args, **kwargs)
         self.services = self.get_services(*args, **kwargs)
@@ -95,7 +102,15 @@ class ModelParams:
         with open(path, 'w') as file:
             yaml.safe_dump(self.config, file)
 
-    def unpack_alias(self, *args,   alias:str=None,
+    def unpack_alias(self, *args, **kwargs) -> Tuple[str, str]:
+        """
+        Like _unpack_alias, but server pools (models_servers.yml -> pools) are resolved
+        to one of their member servers. i.e. 'l3.2_gpus' -> ('llama3.2:3b', 'while-ai_1')
+        """
+        model_name, server_name = self._unpack_alias(*args, **kwargs)
+        return model_name, self.balancer.pick(server_name)
+
+    def _unpack_alias(self, *args,   alias:str=None,
                                     model:str=None,
                                     server:str=None,
                                     service_endpoint:str=None,
@@ -165,6 +180,50 @@ class ModelParams:
         else:
             raise ValueError(f"Server '{server_name}' not found in servers")
 
+    def get_server_by_host(self, host:str, *args, **kwargs) -> str:
+        """
+        Returns the server name whose model_address matches host, i.e.
+        'http://192.168.0.235:11434' -> 'while-ai_0'
+        Addresses are compared exactly, http://192.168.0.23 is not http://192.168.0.235.
+        """
+        target = urlsplit(host)
+        for server_name, params in self.servers.items():
+            if not isinstance(params, dict) or not params.get('model_address'):
+                continue
+            address = urlsplit(params['model_address'])
+            if (address.scheme, address.hostname) != (target.scheme, target.hostname):
+                continue
+            ports = {address.port, params.get('generate_port')} - {None}
+            if target.port is None or not ports or target.port in ports:
+                return server_name
+
+    def get_pool_limits(self, host:str, *args, **kwargs) -> dict:
+        """
+        Returns the http connection pool limits for host. Server specific pool settings
+        from models_servers.yml take precedence over params.pool.
+        """
+        limits = {
+                    'max_connections': 20,
+                    'max_keepalive_connections': 10,
+                    'keepalive_expiry': 60,
+        }
+        limits.update(self.params.get('pool') or {})
+        server_name = self.get_server_by_host(host)
+        if server_name is not None:
+            limits.update(self.servers[server_name].get('pool') or {})
+        return limits
+
+    def get_num_parallel(self, host:str, *args, **kwargs) -> int:
+        """
+        Returns the number of requests a host can process in parallel
+        (its OLLAMA_NUM_PARALLEL). Used to bound the fan-out of repeats and prompt lists.
+        """
+        num_parallel = self.params.get('num_parallel') or 1
+        server_name = self.get_server_by_host(host)
+        if server_name is not None:
+            num_parallel = self.servers[server_name].get('num_parallel') or num_parallel
+        return max(int(num_parallel), 1)
+
     def get_model(self, *args, **kwargs) -> dict:
         """
         Takes an model alias and returns the model parameters like server_name and 
@@ -368,4 +427,16 @@ class SingleModelParams(ModelParams):
         return cls._instance
 
 
-config = SingleModelParams()
+config_lock = threading.Lock()
+
+def __getattr__(name: str):
+    """
+    config is loaded at its first use (msts.config), importing model_params reads no
+    files, so commands without model calls do not pay for the config and api key.
+    """
+    if name != 'config':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with config_lock:
+        if 'config' not in globals():
+            globals()['config'] = SingleModelParams()
+    return globals()['config']
@@ -0,0 +1,81 @@
+"""
+model_prefix.py
+Shared prefix length of consecutive prompts per (model, server). Ollama keeps the KV
+cache of the previous prompt of a slot and only evaluates the tokens after the common
+prefix, OpenAI caches prompt prefixes too. The longer the shared prefix, the less prefill
+work a request costs. See renderer.Render prefix_stable for prompts that keep their
+instructions in a fixed leading block.
+
+Import: from altered.model_prefix import prefixes
+    prefixes.observe('llama3.2:3b', 'while-ai_0', ctx) -> {'shared_prefix': 1830, ...}
+    prefixes.stats() -> {'llama3.2:3b|while-ai_0': {'prefix_ratio': {'p50': 0.71, ...}}}
+"""
+
+import os, threading
+from typing import Any, Dict, Optional
+import numpy as np
+
+from altered.model_metrics import RingBuffer
+
+
+class PrefixTracker:
+    columns = ['shared_prefix', 'prompt_len', 'prefix_ratio']
+    percentiles = (50, 90)
+    # rough characters per token, good enough to size the reused prefill
+    chars_per_token = 4
+
+    def __init__(self, *args, capacity: int = 1024, **kwargs) -> None:
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.last: Dict[tuple, str] = {}
+        self.buffers: Dict[tuple, RingBuffer] = {}
+
+    @staticmethod
+    def prompt_text(ctx: dict) -> str:
+        """The text the model evaluates first, prompts or message contents."""
+        if ctx.get('prompts'):
+            return str(ctx['prompts'][0])
+        return ''.join(str(m.get('content') or '') for m in ctx.get('messages') or [])
+
+    def observe(self, model: str, server: Optional[str], ctx: dict, *args, **kwargs
+                    ) -> Dict[str, Any]:
+        """Compares the prompt of ctx with the previous one sent to (model, server)."""
+        text, key = self.prompt_text(ctx), (model, server)
+        with self.lock:
+            previous = self.last.get(key)
+            self.last[key] = text
+            if previous is None or not text:
+                return {}
+            shared = len(os.path.commonprefix([previous, text]))
+            row = {
+                    'shared_prefix': shared,
+                    'shared_prefix_tokens': shared // self.chars_per_token,
+                    'prompt_len': len(text),
+                    'prefix_ratio': round(shared / len(text), 3),
+            }
+            if key not in self.buffers:
+                self.buffers[key] = RingBuffer(self.columns, self.capacity)
+            self.buffers[key].append(row)
+        return row
+
+    def summarize(self, buffer: RingBuffer) -> Dict[str, Any]:
+        out = {'prompts': len(buffer)}
+        for col in ('shared_prefix', 'prefix_ratio'):
+            values = buffer.column(col)
+            ps = np.percentile(values, self.percentiles)
+            out[col] = {f"p{p}": round(float(v), 3) for p, v in zip(self.percentiles, ps)}
+            out[col]['mean'] = round(float(values.mean()), 3)
+        return out
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """Shared prefix in characters and as a share of the prompt per 'model|server'."""
+        with self.lock:
+            return {f"{m}|{s}": self.summarize(b) for (m, s), b in self.buffers.items()}
+
+    def clear(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.last.clear()
+            self.buffers.clear()
+
+
+prefixes = PrefixTracker()
@@ -0,0 +1,225 @@
+"""
+model_residency.py
+Adaptive keep_alive for Ollama models. Ollama unloads a model keep_alive seconds after
+its last request. A fixed value either evicts hot models too early or pins cold ones in
+VRAM, so the keep_alive of every request is derived from how often its model is used on
+its server: gap_factor times the typical time between requests, within
+[min_keep_alive, max_keep_alive].
+Hosts hold max_loaded_models models at once. A model that is not loaded on a full host
+(GET /api/ps) only gets min_keep_alive, so it does not push a hot model out for long.
+The request history is stored on disk, preload() loads the most used models per host,
+i.e. at api_server start.
+
+Defaults:   models_servers.yml -> params.residency, servers.<name>.max_loaded_models
+Per call:   keep_alive=<seconds> overwrites the adaptive value
+Disabled:   params.residency.enabled: false, no history, no /api/ps, the fixed keep_alive
+
+Import: from altered.model_residency import residency
+    residency.keep_alive('llama3.2:3b', 'while-ai_0') -> 600
+    residency.preload() -> {'while-ai_0': ['llama3.2:3b']}
+"""
+
+import json, math, os, threading, time
+from collections import deque
+from typing import Any, Dict, List, Optional
+import httpx
+import numpy as np
+from colorama import Fore
+
+import altered.model_params as msts
+import altered.settings as sts
+from altered.hlp_lazy import lazy_instance
+from altered.model_client_pool import clients
+
+
+class ResidencyManager:
+    defaults = {
+                'enabled': True,
+                # seconds, used while a model has too little history
+                'default_keep_alive': 1000,
+                'min_keep_alive': 120,
+                'max_keep_alive': 7200,
+                # keep_alive = gap_factor * median time between requests
+                'gap_factor': 3.0,
+                # request time stamps kept per model and server
+                'history': 64,
+                'max_loaded_models': 2,
+                # seconds an /api/ps answer is reused
+                'ps_ttl': 10,
+                'ps_timeout': 2,
+                # models per host preloaded by preload()
+                'preload': 2,
+                # seconds between history writes
+                'save_interval': 30,
+    }
+
+    def __init__(self, *args, path: str = None, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('residency') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.path = path if path is not None else sts.model_residency_path
+        self.lock = threading.Lock()
+        self.history: Dict[tuple, deque] = {}
+        self.ps: Dict[str, tuple] = {}
+        self.saved = time.time()
+        self.load()
+
+    def is_enabled(self, *args, **kwargs) -> bool:
+        return bool(self.params['enabled'])
+
+    # ─── history ──────────────────────────────────────────────────────────
+    def record(self, model: str, server: Optional[str], *args, **kwargs) -> None:
+        if not self.is_enabled():
+            return
+        with self.lock:
+            key = (model, server)
+            if key not in self.history:
+                self.history[key] = deque(maxlen=self.params['history'])
+            self.history[key].append(time.time())
+            due = time.time() - self.saved >= self.params['save_interval']
+        if due:
+            self.save()
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"{Fore.YELLOW}ResidencyManager.load: {e}{Fore.RESET}")
+            return
+        for key, stamps in stored.items():
+            model, server = key.rsplit('|', 1)
+            self.history[(model, server)] = deque(stamps, maxlen=self.params['history'])
+
+    def save(self) -> None:
+        if not self.path or not self.is_enabled():
+            return
+        with self.lock:
+            stored = {f"{m}|{s}": list(stamps) for (m, s), stamps in self.history.items()}
+            self.saved = time.time()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(stored, f)
+
+    # ─── keep_alive ───────────────────────────────────────────────────────
+    def keep_alive(self, model: str, server: Optional[str], *args, **kwargs
+                    ) -> Optional[int]:
+        """
+        Seconds model should stay loaded on server after this request, None if residency
+        is disabled (OllamaConnect.keep_alive applies then).
+        """
+        if not self.is_enabled():
+            return None
+        with self.lock:
+            stamps = list(self.history.get((model, server), ()))
+        if len(stamps) < 3:
+            keep_alive = self.params['default_keep_alive']
+        else:
+            gap = float(np.median(np.diff(stamps)))
+            keep_alive = min(max(self.params['gap_factor'] * gap,
+                                 self.params['min_keep_alive']), self.params['max_keep_alive'])
+        loaded = self.loaded(server, wait=False)
+        if loaded is not None and model not in loaded \
+                                    and len(loaded) >= self.max_loaded_models(server):
+            keep_alive = self.params['min_keep_alive']
+        return int(keep_alive)
+
+    def max_loaded_models(self, server: Optional[str]) -> int:
+        params = msts.config.servers.get(server) if server else None
+        return int((params or {}).get('max_loaded_models') or self.params['max_loaded_models'])
+
+    # ─── host state ───────────────────────────────────────────────────────
+    @staticmethod
+    def host_of(server: Optional[str]) -> Optional[str]:
+        """The ollama daemon of server, not the altered endpoint server in front of it."""
+        params = msts.config.servers.get(server) if server else None
+        if not params or not params.get('model_address'):
+            return None
+        port = params.get('generate_port') or msts.config.defaults.get('port')
+        return f"{params['model_address']}:{port}" if port else params['model_address']
+
+    def loaded(self, server: Optional[str], *args, wait: bool = True, **kwargs
+                    ) -> Optional[List[str]]:
+        """
+        Models loaded on server (GET /api/ps), None if the host can not be asked.
+        With wait=False a stale answer is refreshed in the background, so requests
+        never wait for /api/ps.
+        """
+        if not self.is_enabled() or self.host_of(server) is None:
+            return None
+        with self.lock:
+            stamp, models = self.ps.get(server, (0, None))
+            stale = time.time() - stamp >= self.params['ps_ttl']
+            if stale and not wait:
+                # marks the refresh as started
+                self.ps[server] = (time.time(), models)
+        if not stale:
+            return models
+        if not wait:
+            threading.Thread(target=self.refresh, args=(server,), daemon=True).start()
+            return models
+        return self.refresh(server)
+
+    def refresh(self, server: str) -> Optional[List[str]]:
+        try:
+            r = httpx.get(f"{self.host_of(server)}/api/ps", timeout=self.params['ps_timeout'])
+            r.raise_for_status()
+            models = [m.get('name') for m in r.json().get('models', [])]
+        except (httpx.HTTPError, ValueError):
+            models = None
+        with self.lock:
+            self.ps[server] = (time.time(), models)
+        return models
+
+    # ─── preloading ───────────────────────────────────────────────────────
+    def ranking(self, server: Optional[str], *args, now: float = None, **kwargs
+                    ) -> List[str]:
+        """
+        Models of server, most likely next first. Every past request counts with
+        exp(-age / max_keep_alive), so recent use outweighs old use.
+        """
+        now = now or time.time()
+        with self.lock:
+            scores = {model: sum(math.exp(-(now - t) / self.params['max_keep_alive'])
+                                                                                for t in stamps)
+                                    for (model, s), stamps in self.history.items() if s == server}
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def preload(self, *args, servers: List[str] = None, **kwargs) -> Dict[str, List[str]]:
+        """
+        Loads the most used models per server, without exceeding the models a host can
+        hold. An empty prompt makes ollama load a model without generating anything.
+        """
+        if not self.is_enabled():
+            return {}
+        with self.lock:
+            known = sorted({s for _, s in self.history if s is not None})
+        out = {}
+        for server in servers or known:
+            host, loaded = self.host_of(server), self.loaded(server) or []
+            if host is None:
+                continue
+            free = self.max_loaded_models(server) - len(loaded)
+            ranked = [m for m in self.ranking(server) if m not in loaded]
+            out[server] = []
+            for model in ranked[:max(min(free, self.params['preload']), 0)]:
+                try:
+                    clients.get(host).generate(model=model, prompt='',
+                                               keep_alive=self.keep_alive(model, server))
+                except Exception as e:
+                    print(f"{Fore.YELLOW}ResidencyManager.preload {model} on {server}: "
+                          f"{e}{Fore.RESET}")
+                    continue
+                out[server].append(model)
+        return out
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            keys = list(self.history)
+            counts = {k: len(v) for k, v in self.history.items()}
+        return {f"{m}|{s}": {'requests': counts[(m, s)],
+                            'keep_alive': self.keep_alive(m, s)} for m, s in keys}
+
+
+residency = lazy_instance(ResidencyManager)
@@ -0,0 +1,207 @@
+"""
+model_retry.py
+Retries for calls to model servers. Every attempt has its own deadline (the http timeout
+of the pooled client), failed attempts are retried with exponential backoff and jitter and
+a per-server circuit breaker stops calling a server that keeps failing.
+
+Breaker states:
+    closed      requests pass, consecutive failures are counted
+    open        requests fail fast with CircuitOpenError for reset_timeout seconds
+    half_open   a single trial request is let through, success closes the breaker
+
+Import: from altered.model_retry import RetryEngine, CircuitOpenError
+    engine = RetryEngine(**msts.config.params.get('retry'))
+    engine.call('while-ai_0', client.generate, model='llama3.2:3b', prompt='Hi')
+    await engine.acall('while-ai_0', aclient.generate, model='llama3.2:3b', prompt='Hi')
+    engine.stats() -> {'while-ai_0': {'state': 'closed', 'attempts': 1, ...}}
+"""
+
+import random as rd
+import asyncio, threading, time
+from typing import Any, Callable, Dict, Optional
+import httpx
+from colorama import Fore
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the breaker of its server is open."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, name: str, *args, failure_threshold: int = 5,
+                    reset_timeout: float = 30, on_open: Callable = None, **kwargs) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_open = on_open
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == 'open' and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self.lock:
+            self.state, self.failures, self.trial_running = 'closed', 0, False
+
+    def cancelled(self) -> None:
+        """A call was cancelled before it succeeded or failed, i.e. asyncio.CancelledError."""
+        with self.lock:
+            self.trial_running = False
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                opened = self.state != 'open'
+                self.state, self.opened_at = 'open', time.time()
+            else:
+                opened = False
+        if opened:
+            print(f"{Fore.YELLOW}CircuitBreaker: {self.name} is open{Fore.RESET}")
+            if self.on_open is not None:
+                self.on_open(self.name)
+
+
+class RetryEngine:
+    """
+    Runs a function with retries, backoff and a circuit breaker per key (server).
+    Only transient errors are retried: retry_exceptions (transport errors incl. timeouts)
+    and responses with a retry_statuses status code. Clients that wrap httpx errors
+    (i.e. openai) pass their own retry_exceptions and timeout_exceptions.
+    """
+    defaults = {
+                'max_retries': 3,
+                'base_delay': 0.5,
+                'max_delay': 8.0,
+                'jitter': 0.5,
+                'failure_threshold': 5,
+                'reset_timeout': 30,
+    }
+    retry_statuses = {408, 429, 500, 502, 503, 504}
+
+    def __init__(self, *args, on_open: Callable = None,
+                    retry_exceptions: tuple = (httpx.TransportError,),
+                    timeout_exceptions: tuple = (httpx.TimeoutException,), **kwargs) -> None:
+        self.retry_exceptions, self.timeout_exceptions = retry_exceptions, timeout_exceptions
+        self.params = dict(self.defaults)
+        self.params.update({k: v for k, v in kwargs.items()
+                                            if k in self.defaults and v is not None})
+        self.on_open = on_open
+        self.lock = threading.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self.lock:
+            if key not in self.breakers:
+                self.breakers[key] = CircuitBreaker(key,
+                                        failure_threshold=self.params['failure_threshold'],
+                                        reset_timeout=self.params['reset_timeout'],
+                                        on_open=self.on_open)
+                self.counts[key] = {'calls': 0, 'attempts': 0, 'retries': 0, 'successes': 0,
+                                    'failures': 0, 'timeouts': 0, 'rejected': 0}
+            return self.breakers[key]
+
+    def count(self, key: str, name: str) -> None:
+        with self.lock:
+            self.counts[key][name] += 1
+
+    def attempts(self) -> int:
+        """max_retries counts all attempts, at least one is made."""
+        return max(int(self.params['max_retries']), 1)
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff, attempt 1 waits about base_delay, with +- jitter."""
+        delay = min(self.params['base_delay'] * 2 ** (attempt - 1), self.params['max_delay'])
+        return delay * (1 + self.params['jitter'] * (2 * rd.random() - 1))
+
+    def is_retryable(self, e: Exception) -> bool:
+        if isinstance(e, self.retry_exceptions):
+            return True
+        return getattr(e, 'status_code', None) in self.retry_statuses
+
+    def call(self, key: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Calls func(*args, **kwargs) and returns its result. Raises the last error once all
+        retries are used up and CircuitOpenError if the breaker of key rejects the call.
+        """
+        breaker = self.breaker(key)
+        self.count(key, 'calls')
+        for attempt in range(1, self.attempts() + 1):
+            self.admit(key, breaker)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.failed(key, breaker, e, attempt)
+                time.sleep(self.backoff(attempt))
+            except BaseException:
+                # a cancelled half open trial must not block the breaker
+                breaker.cancelled()
+                raise
+            else:
+                return self.succeeded(key, breaker, result)
+
+    async def acall(self, key: str, func: Callable, *args, **kwargs) -> Any:
+        """Async version of call, func must return an awaitable."""
+        breaker = self.breaker(key)
+        self.count(key, 'calls')
+        for attempt in range(1, self.attempts() + 1):
+            self.admit(key, breaker)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                self.failed(key, breaker, e, attempt)
+                await asyncio.sleep(self.backoff(attempt))
+            except BaseException:
+                # a cancelled half open trial must not block the breaker
+                breaker.cancelled()
+                raise
+            else:
+                return self.succeeded(key, breaker, result)
+
+    def admit(self, key: str, breaker: CircuitBreaker) -> None:
+        if not breaker.allow():
+            self.count(key, 'rejected')
+            raise CircuitOpenError(f"circuit for {key} is open, request rejected")
+        self.count(key, 'attempts')
+
+    def succeeded(self, key: str, breaker: CircuitBreaker, result: Any) -> Any:
+        breaker.success()
+        self.count(key, 'successes')
+        return result
+
+    def failed(self, key: str, breaker: CircuitBreaker, e: Exception, attempt: int) -> None:
+        """Re-raises e unless it is transient and retries are left."""
+        if isinstance(e, self.timeout_exceptions):
+            self.count(key, 'timeouts')
+        if not self.is_retryable(e):
+            # the server answered, so it is not the server that failed
+            breaker.success()
+            self.count(key, 'failures')
+            raise e
+        breaker.failure()
+        if attempt >= self.attempts():
+            self.count(key, 'failures')
+            raise e
+        self.count(key, 'retries')
+        print(  f"{Fore.YELLOW}RetryEngine: {key} {type(e).__name__}, retrying "
+                f"{attempt + 1}/{self.attempts()}{Fore.RESET}")
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {key: dict(self.counts[key], state=b.state, failures_in_row=b.failures)
+                                                        for key, b in self.breakers.items()}
@@ -0,0 +1,217 @@
+"""
+model_scheduler.py
+Priority scheduling of model requests. Every server has num_parallel slots (its
+OLLAMA_NUM_PARALLEL), requests beyond that wait in a per server queue and are admitted
+by priority class:
+
+    interactive     user facing prompts (api_thought)
+    normal          default
+    background      bulk work (search result cleaning, memory ingestion)
+
+Waiting requests move up one class every aging seconds, so background work is never
+starved. Aged requests rank with interactive ones at most and ties go to the higher
+original class, so an aged backlog never runs ahead of a waiting user facing prompt.
+Background requests never hold the last reserve_interactive slots of a server, so a user
+facing prompt waits for at most one running generation.
+
+Use per call:   ModelConnect().post(prompts, alias='l3.2_1', priority='interactive')
+Import: from altered.model_scheduler import scheduler
+    with scheduler.slot('while-ai_0', priority='background'): ...
+    scheduler.stats() -> {'interactive': {'queued': 0, 'wait_p90': 0.01, ...}, ...}
+"""
+
+import asyncio, threading, time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from colorama import Fore
+
+import altered.model_params as msts
+from altered.hlp_lazy import lazy_instance
+from altered.model_metrics import RingBuffer
+
+
+class Waiter:
+    """A queued request, grant() hands it a slot."""
+
+    def __init__(self, priority: str, rank: int, grant: Callable, *args, **kwargs) -> None:
+        self.priority, self.rank, self.grant = priority, rank, grant
+        self.enqueued = time.time()
+        self.granted = False
+
+    def aged_rank(self, now: float, aging: float) -> tuple:
+        """
+        Aging lifts a request up to the interactive class, never past it. Among equally
+        ranked requests the higher original class goes first, then the earlier arrival.
+        """
+        return (max(self.rank - (now - self.enqueued) / aging, 0.0), self.rank, self.enqueued)
+
+
+class Lane:
+    """Slots and wait queue of one server."""
+
+    def __init__(self, name: str, slots: int, *args, **kwargs) -> None:
+        self.name, self.slots = name, slots
+        self.running: Dict[str, int] = {}
+        self.waiters: List[Waiter] = []
+
+    def busy(self) -> int:
+        return sum(self.running.values())
+
+
+class Scheduler:
+    classes = {'interactive': 0, 'normal': 1, 'background': 2}
+    defaults = {
+                'enabled': True,
+                # seconds of waiting that lift a request by one priority class
+                'aging': 10.0,
+                # slots per server background requests can not take
+                'reserve_interactive': 1,
+                'wait_samples': 1024,
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('scheduler') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.lanes: Dict[str, Lane] = {}
+        self.waits = {c: RingBuffer(['wait'], self.params['wait_samples'])
+                                                                    for c in self.classes}
+        self.counts = {c: {'served': 0, 'max_queued': 0} for c in self.classes}
+
+    def is_enabled(self, *args, **kwargs) -> bool:
+        return bool(self.params['enabled'])
+
+    def lane(self, server: Optional[str]) -> Lane:
+        name = str(server)
+        if name not in self.lanes:
+            self.lanes[name] = Lane(name, self.num_slots(server))
+        return self.lanes[name]
+
+    @staticmethod
+    def num_slots(server: Optional[str]) -> int:
+        params = msts.config.servers.get(server) if server else None
+        num_parallel = (params or {}).get('num_parallel') \
+                                        or msts.config.params.get('num_parallel') or 1
+        return max(int(num_parallel), 1)
+
+    def check(self, priority: Optional[str]) -> str:
+        priority = priority or 'normal'
+        if priority not in self.classes:
+            raise ValueError(f"{Fore.RED}Scheduler: unknown priority '{priority}', "
+                             f"use one of {list(self.classes)}{Fore.RESET}")
+        return priority
+
+    # ─── admission ────────────────────────────────────────────────────────
+    def admissible(self, lane: Lane, priority: str) -> bool:
+        if lane.busy() >= lane.slots:
+            return False
+        if priority != 'background':
+            return True
+        cap = max(lane.slots - self.params['reserve_interactive'], 1)
+        return lane.running.get('background', 0) < cap
+
+    def take(self, lane: Lane, waiter: Waiter) -> None:
+        lane.running[waiter.priority] = lane.running.get(waiter.priority, 0) + 1
+        waiter.granted = True
+        self.counts[waiter.priority]['served'] += 1
+        self.waits[waiter.priority].append({'wait': time.time() - waiter.enqueued})
+
+    def dispatch(self, lane: Lane) -> None:
+        """Grants free slots to the best ranked admissible waiters, call with self.lock."""
+        while lane.waiters and lane.busy() < lane.slots:
+            now = time.time()
+            candidates = [w for w in lane.waiters if self.admissible(lane, w.priority)]
+            if not candidates:
+                return
+            waiter = min(candidates, key=lambda w: w.aged_rank(now, self.params['aging']))
+            lane.waiters.remove(waiter)
+            self.take(lane, waiter)
+            waiter.grant()
+
+    def enqueue(self, server: Optional[str], priority: str, grant: Callable) -> Waiter:
+        with self.lock:
+            lane = self.lane(server)
+            waiter = Waiter(priority, self.classes[priority], grant)
+            lane.waiters.append(waiter)
+            queued = sum(w.priority == priority for w in lane.waiters)
+            self.counts[priority]['max_queued'] = max(self.counts[priority]['max_queued'],
+                                                                                    queued)
+            self.dispatch(lane)
+        return waiter
+
+    def release(self, server: Optional[str], priority: str) -> None:
+        with self.lock:
+            lane = self.lane(server)
+            lane.running[priority] = max(lane.running.get(priority, 0) - 1, 0)
+            self.dispatch(lane)
+
+    def withdraw(self, server: Optional[str], waiter: Waiter) -> None:
+        """Removes a waiter that gave up, a slot it was granted meanwhile is released."""
+        with self.lock:
+            lane = self.lane(server)
+            if not waiter.granted:
+                lane.waiters.remove(waiter)
+                return
+        self.release(server, waiter.priority)
+
+    # ─── slots ────────────────────────────────────────────────────────────
+    @contextmanager
+    def slot(self, server: Optional[str], *args, priority: str = None, **kwargs
+                    ) -> Iterator[None]:
+        """Blocks until server has a slot for priority and holds it for the with block."""
+        if not self.is_enabled():
+            yield
+            return
+        priority, event = self.check(priority), threading.Event()
+        waiter = self.enqueue(server, priority, event.set)
+        try:
+            event.wait()
+        except BaseException:
+            self.withdraw(server, waiter)
+            raise
+        try:
+            yield
+        finally:
+            self.release(server, priority)
+
+    @asynccontextmanager
+    async def aslot(self, server: Optional[str], *args, priority: str = None, **kwargs):
+        """Async version of slot, waiting does not block the event loop."""
+        if not self.is_enabled():
+            yield
+            return
+        priority, loop = self.check(priority), asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant() -> None:
+            # slots are released from other threads too
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        waiter = self.enqueue(server, priority, grant)
+        try:
+            await granted
+        except BaseException:
+            self.withdraw(server, waiter)
+            raise
+        try:
+            yield
+        finally:
+            self.release(server, priority)
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """Queue depth, running requests and wait times per priority class."""
+        with self.lock:
+            out = {}
+            for c in self.classes:
+                waits = self.waits[c].column('wait')
+                out[c] = dict(self.counts[c],
+                    queued=sum(w.priority == c for l in self.lanes.values() for w in l.waiters),
+                    running=sum(l.running.get(c, 0) for l in self.lanes.values()),
+                    wait_p50=round(float(np.percentile(waits, 50)), 3) if len(waits) else None,
+                    wait_p90=round(float(np.percentile(waits, 90)), 3) if len(waits) else None,
+                    wait_max=round(float(waits.max()), 3) if len(waits) else None,
+                )
+            return out
+
+
+scheduler = lazy_instance(Scheduler)
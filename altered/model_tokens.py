@@ -0,0 +1,161 @@
+"""
+model_tokens.py
+Token counting for num_ctx estimation. Ollama reloads a model whenever num_ctx changes,
+so num_ctx is rounded up to a fixed ladder of context buckets (params.tokens.ctx_buckets)
+and consecutive requests keep the loaded model resident.
+
+Counters:   heuristic (chars / chars_per_token), tiktoken (if installed), or any function
+            registered via register_counter. Counts are memoized by content hash.
+
+Import: from altered.model_tokens import tokens
+    tokens.count('Why is the sky blue?') -> 6
+    tokens.num_ctx(['Why is the sky blue?'], context_length=8000) -> 2048
+"""
+
+import hashlib, threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from colorama import Fore
+
+import altered.model_params as msts
+from altered.hlp_lazy import lazy_instance
+
+
+def heuristic_counter(chars_per_token: float = 3.0, *args, **kwargs) -> Callable[[str], int]:
+    """Character based estimate, calibrate chars_per_token with TokenCounter.calibrate."""
+    return lambda text: int(len(text) / chars_per_token)
+
+
+def tiktoken_counter(*args, encoding: str = 'cl100k_base', **kwargs) -> Callable[[str], int]:
+    import tiktoken
+    enc = tiktoken.get_encoding(encoding)
+    return lambda text: len(enc.encode(text, disallowed_special=()))
+
+
+counters: Dict[str, Callable] = {
+                                    'heuristic': heuristic_counter,
+                                    'tiktoken': tiktoken_counter,
+}
+
+
+def register_counter(name: str, counter: Callable) -> None:
+    """
+    Adds a token counter. counter(**params.tokens) must return a function text -> int,
+    i.e. a wrapper around the tokenizer of the model family you use.
+    """
+    counters[name] = counter
+
+
+class TokenCounter:
+    defaults = {
+                'counter': 'heuristic',
+                'chars_per_token': 3.0,
+                'memo_size': 4096,
+                'ctx_buckets': [2048, 4096, 8192, 16384, 32768, 65536, 131072],
+                # plausible characters per token, observations outside are ignored
+                'calibrate_range': [1.0, 8.0],
+                # relative drift of chars_per_token that rebuilds the counter and its memo
+                'calibrate_threshold': 0.05,
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('tokens') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.memo: OrderedDict[str, int] = OrderedDict()
+        self.counts = {'hits': 0, 'misses': 0}
+        self.counter = self.mk_counter(self.params['counter'])
+        # chars_per_token of the current counter, the memo holds its counts
+        self.counter_ratio = self.params['chars_per_token']
+
+    def mk_counter(self, name: str) -> Callable[[str], int]:
+        """Falls back to the heuristic if the requested tokenizer is not available."""
+        try:
+            return counters[name](**self.params)
+        except (ImportError, KeyError) as e:
+            print(  f"{Fore.YELLOW}WARNING: TokenCounter: counter '{name}' not available "
+                    f"({e}), using heuristic{Fore.RESET}")
+            self.params['counter'] = 'heuristic'
+            return heuristic_counter(**self.params)
+
+    def calibrate(self, text: str, num_tokens: int, *args, alpha: float = 0.2,
+                    **kwargs) -> float:
+        """
+        Moves chars_per_token towards the ratio observed for text, i.e. with the
+        prompt_eval_count Ollama reports (ModelStats.calibrate_tokens). Only affects the
+        heuristic counter. Ratios outside calibrate_range are ignored, a prompt whose
+        prefix came from the KV cache reports too few tokens. The counter and its memo are
+        only rebuilt once the estimate drifts by more than calibrate_threshold.
+        """
+        if self.params['counter'] != 'heuristic' or not text or not num_tokens:
+            return self.params['chars_per_token']
+        observed = len(text) / num_tokens
+        low, high = self.params['calibrate_range']
+        if not low <= observed <= high:
+            return self.params['chars_per_token']
+        with self.lock:
+            self.params['chars_per_token'] = round(
+                        alpha * observed + (1 - alpha) * self.params['chars_per_token'], 3)
+            drift = abs(self.params['chars_per_token'] / self.counter_ratio - 1)
+            if drift > self.params['calibrate_threshold']:
+                self.counter = heuristic_counter(**self.params)
+                self.counter_ratio = self.params['chars_per_token']
+                self.memo.clear()
+        return self.params['chars_per_token']
+
+    def count(self, text: str) -> int:
+        key = hashlib.sha1(text.encode('utf-8', errors='replace')).hexdigest()
+        with self.lock:
+            if key in self.memo:
+                self.memo.move_to_end(key)
+                self.counts['hits'] += 1
+                return self.memo[key]
+            self.counts['misses'] += 1
+        num_tokens = self.counter(text)
+        with self.lock:
+            self.memo[key] = num_tokens
+            while len(self.memo) > self.params['memo_size']:
+                self.memo.popitem(last=False)
+        return num_tokens
+
+    def to_bucket(self, num_tokens: int, *args, context_length: Optional[int] = None,
+                    **kwargs) -> int:
+        """Smallest bucket that holds num_tokens, capped by context_length."""
+        buckets = sorted(self.params['ctx_buckets'])
+        if num_tokens > buckets[-1] and (context_length is None or context_length > buckets[-1]):
+            print(f"{Fore.YELLOW}WARNING{Fore.RESET}: num_ctx ({num_tokens}) exceeds the "
+                  f"largest ctx_bucket ({buckets[-1]}); using the largest bucket instead.")
+        bucket = next((b for b in buckets if b >= num_tokens), buckets[-1])
+        return bucket if context_length is None else min(bucket, context_length)
+
+    def num_ctx(self, messages: List[Any], *args, context_length: Optional[int] = None,
+                    default_min: int = 2000, num_predict: Optional[int] = None,
+                    **kwargs) -> int:
+        """
+        Bucketed context size for messages (str or {'content': str}) plus the tokens
+        reserved for the answer (num_predict).
+        """
+        num_tokens = sum(self.count(self.content(msg)) for msg in messages)
+        num_tokens = max(num_tokens + (num_predict or 0), default_min)
+        if context_length is not None and num_tokens > context_length:
+            print(f"{Fore.YELLOW}WARNING{Fore.RESET}: Computed num_ctx "
+                  f"({num_tokens}) exceeds context_length ({context_length}); "
+                  f"using context_length instead.")
+        return self.to_bucket(num_tokens, context_length=context_length)
+
+    @staticmethod
+    def content(msg: Any) -> str:
+        if isinstance(msg, dict) and 'content' in msg:
+            content = msg['content']
+            return "\n".join(content) if isinstance(content, list) else str(content)
+        return str(msg)
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.counts['hits'] + self.counts['misses']
+            return dict(self.counts, counter=self.params['counter'],
+                        chars_per_token=self.params['chars_per_token'],
+                        hit_rate=round(self.counts['hits'] / lookups, 3) if lookups else 0.0)
+
+
+tokens = lazy_instance(TokenCounter)
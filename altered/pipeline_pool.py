@@ -0,0 +1,137 @@
+"""
+pipeline_pool.py
+Keeps warm, resettable pipeline objects (Thought, Prompt) between requests. Building a
+Thought instantiates the whole prompt object graph (context readers, search, renderer,
+strategies, validations) on every request, although only the request kwargs change.
+Requests borrow an idle instance of their profile instead and return it afterwards.
+
+A profile is the api name, the kwargs_defaults file and the key_args kwargs, which are
+read by the constructors. Instances are reset when they are returned, an instance whose
+request raised is dropped, as are instances older than max_age or used max_uses times.
+
+Defaults:   models_servers.yml -> params.pipelines
+Import: from altered.pipeline_pool import pipelines
+    with pipelines.borrow(Thought, api, *args, **kwargs) as thought:
+        thought.think(*args, **kwargs)
+    pipelines.stats() -> {'Thought': {'hits': 9, 'misses': 1, 'hit_rate': 0.9, ...}}
+"""
+
+import threading, time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+import numpy as np
+
+import altered.model_params as msts
+from altered.hlp_lazy import lazy_instance
+from altered.model_metrics import RingBuffer
+
+
+class PipelinePool:
+    defaults = {
+                'enabled': True,
+                # idle instances kept per profile
+                'max_idle': 2,
+                # seconds and requests after which an instance is rebuilt
+                'max_age': 3600.0,
+                'max_uses': 500,
+                # kwargs read by the constructors, part of the profile
+                'key_args': ['verbose', 'fmt', 'log_file_path', 'work_dir', 'work_file_name'],
+                'build_samples': 1024,
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('pipelines') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        # profile -> [[instance, created, uses], ...]
+        self.idle: Dict[tuple, List[list]] = {}
+        self.builds: Dict[str, RingBuffer] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def profile(self, factory: Callable, name: str, kwargs: dict) -> tuple:
+        return (factory.__name__, name, kwargs.get('kwargs_defaults'),
+                *(repr(kwargs.get(k)) for k in self.params['key_args']))
+
+    def count(self, kind: str, key: str) -> None:
+        """Call with self.lock."""
+        counts = self.counts.setdefault(kind, {'hits': 0, 'misses': 0, 'in_use': 0,
+                                                'dropped': 0})
+        counts[key] += 1
+
+    @contextmanager
+    def borrow(self, factory: Callable, name: str, *args, **kwargs):
+        """
+        Yields a warm instance of factory(name, *args, **kwargs) for the profile of
+        kwargs, a new one if none is idle.
+        """
+        if not self.params['enabled']:
+            yield factory(name, *args, **kwargs)
+            return
+        profile, kind = self.profile(factory, name, kwargs), factory.__name__
+        entry = self.take(profile, kind)
+        if entry is None:
+            start = time.time()
+            entry = [factory(name, *args, **kwargs), time.time(), 0]
+            with self.lock:
+                if kind not in self.builds:
+                    self.builds[kind] = RingBuffer(['build'], self.params['build_samples'])
+                self.builds[kind].append({'build': time.time() - start})
+        with self.lock:
+            self.counts[kind]['in_use'] += 1
+        ok = False
+        try:
+            yield entry[0]
+            ok = True
+        finally:
+            with self.lock:
+                self.counts[kind]['in_use'] -= 1
+            entry[2] += 1
+            self.give(profile, kind, entry, ok)
+
+    def take(self, profile: tuple, kind: str) -> list:
+        """Pops an idle instance of profile, None on a miss."""
+        with self.lock:
+            idle = self.idle.get(profile)
+            self.count(kind, 'hits' if idle else 'misses')
+            return idle.pop() if idle else None
+
+    def give(self, profile: tuple, kind: str, entry: list, ok: bool) -> None:
+        """Resets entry and keeps it idle, or drops it."""
+        instance, created, uses = entry
+        keep = ok and uses < self.params['max_uses'] \
+                  and time.time() - created < self.params['max_age']
+        if keep:
+            try:
+                instance.reset()
+            except Exception:
+                keep = False
+        with self.lock:
+            idle = self.idle.setdefault(profile, [])
+            if keep and len(idle) < self.params['max_idle']:
+                idle.append(entry)
+            else:
+                self.count(kind, 'dropped')
+
+    def clear(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.idle.clear()
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """Hit rate, idle instances and construction times per pipeline class."""
+        with self.lock:
+            out = {}
+            for kind, counts in sorted(self.counts.items()):
+                builds = self.builds[kind].column('build') if kind in self.builds \
+                                                                        else np.array([])
+                served = counts['hits'] + counts['misses']
+                out[kind] = dict(counts,
+                    hit_rate=round(counts['hits'] / served, 3) if served else None,
+                    idle=sum(len(v) for k, v in self.idle.items() if k[0] == kind),
+                    profiles=len([k for k in self.idle if k[0] == kind]),
+                    build_p50=round(float(np.percentile(builds, 50)), 4) if len(builds) else None,
+                    build_mean=round(float(np.mean(builds)), 4) if len(builds) else None,
+                )
+            return out
+
+
+pipelines = lazy_instance(PipelinePool)
@@ -13,6 +13,7 @@ from altered.prompt_stats import PromptStats
 from altered.model_connect import SingleModelConnect
 from altered.prompt_deliverable import Deliverable
 import altered.hlp_printing as hlpp
+import altered.model_params as msts
 import altered.settings as sts
 
 default_aggreg = 'default_user_prompt'
@@ -21,9 +22,16 @@ default_aggreg = 'default_user_prompt'
 class Prompt:
 
     template_name = 'prompt.md'
+    defaults = {
+                # instructions first, so consecutive prompts share a long prefix
+                # (see renderer.Render, model_prefix.py), per call i.e. from kwargs_defaults
+                'prefix_stable': False,
+    }
 
     def __init__(self, name, *args, **kwargs):
         self.name = name
+        self.params = dict(self.defaults, **(msts.config.params.get('prompt') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
         self.C = Context(name, *args, **kwargs)
         self.U = UserPrompt(*args, **kwargs)
         self.I = Instructions(name, *args, **kwargs)
@@ -34,6 +42,14 @@ class Prompt:
         self.warnings = {}
         self.context = {} # contains the context for rendering the prompt
 
+    def reset(self, *args, **kwargs):
+        """
+        Drops the rendered prompt and its context, see thought.Thought.reset.
+        """
+        self.data, self.warnings, self.context = None, {}, {}
+        self.C.reset(*args, **kwargs)
+        self.I.context, self.I.params = {}, {}
+
     @sts.logs_timeit.timed("prompt.Prompt.__call__")
     def __call__(self, *args, **kwargs):
         hlpp.play_sound('PROMPT0')
@@ -68,11 +84,14 @@ class Prompt:
             print(f"\n{Fore.CYAN}Prompt.mk_prompt.context:{Fore.RESET} {verbose = } >= 2")
             print(self.stats(2, *args, data_dict=self.context, **kwargs))
 
-    def render_prompt(self, *args, context:dict=None, _cont:dict=None, verbose:int=0, **kwargs
+    def render_prompt(self, *args, context:dict=None, _cont:dict=None, verbose:int=0,
+                        prefix_stable:bool=None, **kwargs
         ):
         kwargs.update(self.get_template(*args, **kwargs))
         context = _cont if _cont is not None else self.context
-        prompt = self.RD.render(*args, context=context, verbose=verbose, **kwargs, )
+        prefix_stable = self.params['prefix_stable'] if prefix_stable is None else prefix_stable
+        prompt = self.RD.render(*args, context=context, verbose=verbose,
+                                prefix_stable=prefix_stable, **kwargs, )
         if verbose >= 3:
             print(f"\n{Fore.CYAN}Prompt.render_prompt.prompt:{Fore.RESET} {verbose = } >= 1")
             hlpp.pretty_prompt(prompt, *args, verbose=verbose, **kwargs)
@@ -164,6 +183,11 @@ class Response:
         self.r = {}
         self.V = Validations(name, *args, **kwargs)
 
+    def reset(self, *args, **kwargs):
+        self.r = {}
+        self.V.reset(*args, **kwargs)
+        self.V.errors = {}
+
     @sts.logs_timeit.timed("prompt.Response.__call__")
     def __call__(self, *args, **kwargs):
         checks_ok = self.V(*args, **kwargs)
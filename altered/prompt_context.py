@@ -18,6 +18,11 @@ class Context:
         self.os_sys_info = ContextSysInfo(*args, **kwargs)
         self.pg_info = ContextPackageData(*args, **kwargs)
 
+    def reset(self, *args, **kwargs):
+        self.context = {}
+        self.user_infos.reset(*args, **kwargs)
+        self.pg_info.reset(*args, **kwargs)
+
     def __call__(self, *args, **kwargs):
         self.prep_data(*args, **kwargs)
         return self.context
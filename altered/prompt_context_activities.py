@@ -25,10 +25,19 @@ class ContextActivities:
         Initialize the class with the path to the most recent activity log file.
         If no specific log_file_path is provided, it will find the most recent log file.
         """
+        self.pinned = log_file_path is not None
         self.log_file_path = self.find_most_recent_act_log(*args, **kwargs) \
                                                 if log_file_path is None else log_file_path
         self.context = {}
 
+    def reset(self, *args, **kwargs):
+        """
+        A reused instance looks for the most recent log file again, unless it was given.
+        """
+        self.context = {}
+        if not self.pinned:
+            self.log_file_path = self.find_most_recent_act_log(*args, **kwargs)
+
     def __call__(self, *args, **kwargs):
         return self.get_all_infos(*args, **kwargs)
 
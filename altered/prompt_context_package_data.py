@@ -22,6 +22,15 @@ class ContextPackageData:
         self.data = PackageInfo(*args, **kwargs)
         self.tree = Tree(*args, **kwargs)
 
+    def reset(self, *args, **kwargs):
+        """
+        Drops the graph and matched files of the last request. The package root is kept,
+        pipeline_pool.py keys pooled instances by work_dir and work_file_name.
+        """
+        self.context = {}
+        self.data.reset(*args, **kwargs)
+        self.tree.reset(*args, **kwargs)
+
     def get_pg_imports(self, *args, work_file_name:str=None, **kwargs) -> dict:
         if work_file_name is None:
             return {}
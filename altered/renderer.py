@@ -8,6 +8,9 @@ import altered.settings as sts
 
 class Render:
     fields = ['prompt_title', 'context', 'deliverable', 'user_comment', 'instructs', 'prompt_summary']
+    # prefix_stable: immutable instructions lead, volatile context follows, so consecutive
+    # prompts share a long prefix the model server can reuse (see model_prefix.py)
+    stable_templates = {'prompt.md': 'prompt_stable.md'}
     default_context_path = os.path.join(sts.resources_dir, 'kwargs', 
                                         'renderer_default_context.yml')
 
@@ -27,14 +30,19 @@ class Render:
             return {}
 
     @sts.logs_timeit.timed("renderer.Render.render")
-    def render(self, *args, template_name: str, context: dict=None, verbose:int=0, **kwargs):
+    def render(self, *args, template_name: str, context: dict=None, verbose:int=0,
+                        prefix_stable:bool=False, **kwargs):
         self.context = self._load_context(*args, context=context, **kwargs)
+        prefix_stable = prefix_stable and template_name in self.stable_templates
+        if prefix_stable:
+            template_name = self.stable_templates[template_name]
         template = self.env.get_template(template_name)
         context = context if context else self.context
         if verbose >= 3:
             hlpp.dict_to_table('Render.render.context', context, color=Fore.MAGENTA)
         # we sort the keys to make sure the fields are in the correct order
         sorted = {k: context.get(k) for k in self.fields}
+        sorted['prefix_stable'] = prefix_stable
         self.document = template.render(sorted)
         self.document = Render.render_from_string(self.document, sorted, *args, **kwargs)
         self.document = Render.correct_ansi_codes(self.document, *args, **kwargs)
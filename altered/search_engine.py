@@ -1,15 +1,16 @@
 import os
-import requests
-import pandas as pd
 from colorama import Fore
 
 # from altered.data_vectorized import VecDB
 from altered.data import Data
-from altered.model_params import config as config
+import altered.model_params as msts
 import altered.settings as sts
 import altered.hlp_printing as hlpp
+from altered.hlp_lazy import lazy_import
 from altered.search_parser import Parser  # Importing Parser from the Parser module
 
+requests = lazy_import('requests')
+
 
 class WebSearch:
     """
@@ -23,9 +24,9 @@ class WebSearch:
 
     def __init__(self, *args, name:str=None, data_dir:str=None, **kwargs):
         self.name = name
-        self.api_key = config.services.get('google_se').get('api_key')
-        self.cse_id = config.services.get('google_se').get('cse_id')
-        self.g_url = config.services.get('google_se').get('url')
+        self.api_key = msts.config.services.get('google_se').get('api_key')
+        self.cse_id = msts.config.services.get('google_se').get('cse_id')
+        self.g_url = msts.config.services.get('google_se').get('url')
         self.search_results = Data(*args, 
                     name=name, 
                     u_fields_paths=[self.search_fields_path], 
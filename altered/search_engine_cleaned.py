@@ -5,8 +5,6 @@ search results. We use the returned links to parse the web-sites contents
 """
 
 import os
-import requests
-import pandas as pd
 from colorama import Fore, Style
 
 
@@ -65,7 +63,9 @@ class CleanWebSearch(WebSearch):
             )
         # we use the ModelConnect object to post the contents to the AI model
         # NOTE: due to the potentially giant context size we have to use a powerfull server
-        return self.assi.post(contents, *args, alias=self.alias, **kwargs ).get('responses')
+        # cleaning is bulk work, it must not hold up user facing prompts (model_scheduler.py)
+        return self.assi.post(contents, *args, alias=self.alias,
+                                **dict(kwargs, priority='background')).get('responses')
 
     def mk_prompt(self, content:str, link:str, search_query:str, *args, 
                                     user_prompt:str, **kwargs,
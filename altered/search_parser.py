@@ -1,11 +1,14 @@
 import altered.settings as sts
 import altered.hlp_printing as hlpp
+from altered.hlp_lazy import lazy_import
 
-from playwright.sync_api import sync_playwright
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from bs4 import BeautifulSoup
 from colorama import Fore
-import requests
+
+# playwright, bs4 and requests load when the first page is parsed, see hlp_lazy.py
+playwright_api = lazy_import('playwright.sync_api')
+bs4 = lazy_import('bs4')
+requests = lazy_import('requests')
 
 class Parser:
     """
@@ -43,7 +46,7 @@ class Parser:
         Fetches content from a URL using Playwright to render JavaScript.
         """
         print(f"\tPlaywright, Parsing: {Fore.MAGENTA}{url} ...{Fore.RESET}")
-        with sync_playwright() as p:
+        with playwright_api.sync_playwright() as p:
             browser = p.chromium.launch(headless=True)
             page = browser.new_page()
             page.goto(url)
@@ -56,7 +59,7 @@ class Parser:
         """
         Extracts both paragraph text and code snippets from the HTML content.
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = bs4.BeautifulSoup(html_content, 'html.parser')
         # Extract text from <p>, <pre>, and <code> tags
         paragraphs = [p.get_text() for p in soup.find_all('p')]
         code_blocks = [code.get_text() for code in soup.find_all(['pre', 'code'])]
@@ -0,0 +1,108 @@
+"""
+server_batcher.py
+Dynamic micro-batching for the altered endpoint server. Requests for the same queue
+(endpoint, model and ollama parameters) that arrive within max_wait seconds are merged
+into one batch: embeddings go to ollama as batched /api/embed calls, generate prompts
+share the num_parallel slots of the host instead of every request fanning out on its own.
+Each caller gets its own slice of the results back.
+
+The first request of a batch is its leader, it waits up to max_wait for more requests,
+runs the batch and hands out the results. A batch holding max_batch_size items runs
+at once.
+
+Defaults:   models_servers.yml -> params.batching, per model under models.<name>
+Import: from altered.server_batcher import MicroBatcher
+    batcher = MicroBatcher()
+    batcher.submit(('get_embeddings', 'nomic-embed-text'), prompts, embed_all) -> [...]
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import altered.model_params as msts
+
+
+class Batch:
+    """Items of one batch and the callers waiting for their slice of the results."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.items: List[Any] = []
+        self.slices: List[tuple] = []
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    defaults = {
+                'enabled': True,
+                # items (prompts) per batch, a single larger request is not split
+                'max_batch_size': 32,
+                # seconds the leader waits for more requests
+                'max_wait': 0.005,
+                # per model overwrites, i.e. {'nomic-embed-text': {'max_batch_size': 64}}
+                'models': {},
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('batching') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.open: Dict[tuple, Batch] = {}
+        self.counts = {'requests': 0, 'batches': 0, 'items': 0, 'max_batch': 0, 'merged': 0}
+
+    def limits(self, key: tuple) -> Dict[str, Any]:
+        """max_batch_size and max_wait of key, the model is the second key element."""
+        model = key[1] if len(key) > 1 else None
+        return dict(self.params, **(self.params['models'].get(model) or {}))
+
+    def submit(self, key: tuple, items: List[Any], run: Callable, /) -> List[Any]:
+        """
+        Adds items to the open batch of key and returns the results of these items.
+        run(items) -> results must return one result per item, in item order.
+        """
+        if not self.params['enabled'] or not items:
+            return run(items)
+        limits, future = self.limits(key), Future()
+        with self.lock:
+            self.counts['requests'] += 1
+            batch = self.open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self.open[key] = Batch()
+            batch.slices.append((len(batch.items), len(items), future))
+            batch.items.extend(items)
+            if len(batch.items) >= limits['max_batch_size']:
+                self.close(key, batch)
+        if leader:
+            batch.full.wait(limits['max_wait'])
+            with self.lock:
+                self.close(key, batch)
+            self.flush(batch, run)
+        return future.result()
+
+    def close(self, key: tuple, batch: Batch) -> None:
+        """No more requests join batch, call with self.lock."""
+        if self.open.get(key) is batch:
+            del self.open[key]
+        batch.full.set()
+
+    def flush(self, batch: Batch, run: Callable) -> None:
+        with self.lock:
+            self.counts['batches'] += 1
+            self.counts['items'] += len(batch.items)
+            self.counts['max_batch'] = max(self.counts['max_batch'], len(batch.items))
+            self.counts['merged'] += len(batch.slices) - 1
+        try:
+            results = run(batch.items)
+        except BaseException as e:
+            for *_, future in batch.slices:
+                future.set_exception(e)
+            return
+        for start, size, future in batch.slices:
+            future.set_result(results[start:start + size])
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            out = dict(self.counts, open=len(self.open))
+        out['mean_batch'] = round(out['items'] / out['batches'], 2) if out['batches'] else None
+        return out
@@ -0,0 +1,253 @@
+"""
+server_daemon.py
+Resident daemon for the alter CLI. Every 'alter thought -up ...' pays for interpreter
+startup, imports, config loading and object construction before any model work starts.
+A running daemon (alter daemon) keeps all of that warm and listens on a Unix domain
+socket, __main__.main forwards the parsed arguments to it and prints what comes back.
+Without a daemon, on systems without Unix sockets or with ALTERED_DAEMON=0 the api runs
+in-process as before, so do calls without -up / -uf, which ask for the prompt on stdin.
+
+Protocol, one JSON object per line:
+    client -> daemon    {'kwargs': {...}}   arguments.mk_args(), paths made absolute
+    daemon -> client    {'out': str}        stdout of the api, while it runs
+                        {'done': True, 'result': ..., 'error': str | None}
+
+The daemon runs every request in its own thread, with the environment it was started
+in. Output printed by threads the api starts itself stays in the daemon log.
+
+The socket carries prompts and paths, it lives in a directory only its user can write to
+($XDG_RUNTIME_DIR or a 0700 <tempdir>/altered_<user>) and is created with mode 0600. The
+client talks only to a socket of its own user with that mode.
+
+Defaults:   models_servers.yml -> params.daemon
+Import: from altered.server_daemon import forward
+    served, result = forward(kwargs)    # served is False if no daemon answered
+"""
+
+import importlib, json, os, socket, socketserver, stat, sys, tempfile, threading, time
+from typing import Any, Callable, Dict, Tuple
+from colorama import Fore
+
+# Windows has no Unix sockets, forward runs every api in-process there
+UnixStreamServer = getattr(socketserver, 'UnixStreamServer', socketserver.TCPServer)
+# apis that always run in the calling process
+local_apis = {'daemon', 'server', 'profile_imports'}
+# argument paths resolved against the working directory of the caller
+path_args = ('up_file', 'deliverable_path')
+# seconds the client waits for the next output line of the daemon
+default_timeout = 600.0
+
+
+def socket_path() -> str:
+    """ALTERED_DAEMON_SOCKET, or a socket in XDG_RUNTIME_DIR or a per user temp directory."""
+    if os.environ.get('ALTERED_DAEMON_SOCKET'):
+        return os.environ['ALTERED_DAEMON_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'altered.sock')
+    user = os.environ.get('USER') or os.environ.get('USERNAME') or 'user'
+    return os.path.join(tempfile.gettempdir(), f"altered_{user}", 'altered.sock')
+
+
+def is_private(path: str, mask: int = 0o077) -> bool:
+    """True if path belongs to the current user and grants nobody else any of mask."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_uid == os.getuid() and not stat.S_IMODE(st.st_mode) & mask
+
+
+def forward(kwargs: dict, *args, path: str = None, timeout: float = default_timeout,
+            **_kwargs) -> Tuple[bool, Any]:
+    """
+    Runs the api of kwargs in the daemon and prints its output.
+    Returns (False, None) if no daemon answered, the caller runs the api itself then.
+    """
+    api = (kwargs.get('api') or '').replace('-', '_')
+    if not hasattr(socket, 'AF_UNIX') or os.environ.get('ALTERED_DAEMON') == '0' \
+                                or api.removeprefix('api_') in local_apis:
+        return False, None
+    # without a prompt the api asks for one with input(), which reads the daemon stdin
+    if not kwargs.get('user_prompt') and not kwargs.get('up_file'):
+        return False, None
+    path = path or socket_path()
+    # another user may have put a socket at the path to read the prompts
+    if not is_private(path):
+        return False, None
+    kwargs = dict(kwargs)
+    # the daemon has its own working directory
+    kwargs['work_dir'] = os.path.abspath(kwargs.get('work_dir') or os.getcwd())
+    for k in path_args:
+        if kwargs.get(k):
+            kwargs[k] = os.path.abspath(kwargs[k])
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(path)
+    except OSError:
+        # a stale socket of a stopped daemon
+        return False, None
+    with sock, sock.makefile('rwb') as conn:
+        conn.write(json.dumps({'kwargs': kwargs}).encode() + b'\n')
+        conn.flush()
+        try:
+            for line in conn:
+                msg = json.loads(line)
+                if 'out' in msg:
+                    sys.stdout.write(msg['out'])
+                    sys.stdout.flush()
+                elif msg.get('done'):
+                    if msg.get('error'):
+                        raise RuntimeError(f"altered daemon: {msg['error']}")
+                    return True, msg.get('result')
+        except TimeoutError:
+            raise TimeoutError(f"altered daemon at {path} sent nothing for {timeout} s")
+    raise ConnectionError(f"altered daemon at {path} closed the connection")
+
+
+class ThreadStdout:
+    """
+    Replaces sys.stdout in the daemon, a request thread writes to its client,
+    all other threads to the daemon stdout.
+    """
+
+    def __init__(self, stdout, *args, **kwargs) -> None:
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def sink(self, write: Callable = None) -> None:
+        self.local.write = write
+
+    def write(self, text: str) -> int:
+        write = getattr(self.local, 'write', None)
+        if write is None:
+            return self.stdout.write(text)
+        write(text)
+        return len(text)
+
+    def flush(self) -> None:
+        self.stdout.flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.stdout, name)
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+
+    def send(self, msg: dict) -> None:
+        self.wfile.write(json.dumps(msg, default=str).encode() + b'\n')
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        kwargs = json.loads(line).get('kwargs') or {}
+        start, result, error = time.time(), None, None
+        self.server.stdout.sink(lambda text: self.send({'out': text}))
+        try:
+            result = self.server.run(**kwargs)
+        except BrokenPipeError:
+            # the client is gone
+            self.server.count('dropped')
+            return
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            self.server.stdout.sink(None)
+        self.server.count('errors' if error else 'served', time.time() - start)
+        try:
+            self.send({'done': True, 'result': result, 'error': error})
+        except BrokenPipeError:
+            self.server.count('dropped')
+
+
+class Daemon(socketserver.ThreadingMixIn, UnixStreamServer):
+    defaults = {
+                # socket file, None: ALTERED_DAEMON_SOCKET, $XDG_RUNTIME_DIR/altered.sock
+                # or <tempdir>/altered_<user>/altered.sock
+                'socket_path': None,
+                # api modules imported at start, so the first request finds them warm
+                'preload': ['thought', 'prompt'],
+    }
+    daemon_threads = True
+
+    def __init__(self, *args, handler=DaemonHandler, **kwargs) -> None:
+        # the client (forward) stays free of the config and its imports
+        import altered.model_params as msts
+        self.params = dict(self.defaults, **(msts.config.params.get('daemon') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.path = self.params['socket_path'] or socket_path()
+        self.lock = threading.Lock()
+        self.counts = {'served': 0, 'errors': 0, 'dropped': 0, 'seconds': 0.0}
+        self.mk_socket_dir()
+        self.clear_stale()
+        # only the user who started the daemon may talk to it, from the moment of bind
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, handler)
+        finally:
+            os.umask(umask)
+        self.stdout = ThreadStdout(sys.stdout)
+
+    def mk_socket_dir(self) -> None:
+        """Creates the socket directory, refuses one that others can write to."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not is_private(directory, mask=0o022):
+            raise OSError(f"altered daemon socket directory {directory} is writable "
+                          f"by other users")
+
+    def clear_stale(self) -> None:
+        """Removes the socket of a stopped daemon, refuses to replace a running one."""
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"an altered daemon already listens on {self.path}")
+
+    def run(self, *args, api: str, **kwargs) -> Any:
+        """Runs the api like __main__.main does in-process."""
+        from altered.__main__ import runable
+        return runable(*args, api=api, **kwargs).main(*args, api=api, **kwargs)
+
+    def preload(self, *args, **kwargs) -> None:
+        for api in self.params['preload']:
+            try:
+                importlib.import_module(f"altered.api_{api}")
+            except Exception as e:
+                print(f"{Fore.YELLOW}Daemon preload of api_{api} failed:{Fore.RESET} {e}")
+
+    def count(self, key: str, seconds: float = 0.0) -> None:
+        with self.lock:
+            self.counts[key] += 1
+            self.counts['seconds'] += seconds
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.counts, socket=self.path)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def serve(self, *args, **kwargs) -> None:
+        """Serves until Ctrl+C, stdout of request threads goes to their clients."""
+        self.preload()
+        sys.stdout = self.stdout
+        print(f"{Fore.GREEN}altered daemon listens on{Fore.RESET} {self.path}")
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sys.stdout = self.stdout.stdout
+            self.server_close()
+            print(f"{Fore.YELLOW}altered daemon stopped:{Fore.RESET} {self.stats()}")
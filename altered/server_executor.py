@@ -0,0 +1,181 @@
+"""
+server_executor.py
+Runs the api modules of api_server /call off the event loop. api main functions are
+blocking, called on the loop a long api_thought run would stall every other request,
+/ping included. I/O bound apis (model calls) run in a thread pool, CPU heavy ones
+(process_apis, i.e. prompt rendering with package import graphs) in a process pool.
+
+Every api runs at most limit requests at once, further requests wait up to
+queue_timeout seconds for a slot. A request is refused with
+    429     if max_queue requests of its api are waiting already
+    503     if max_pending requests wait in total, or no slot freed up in queue_timeout
+
+Defaults:   models_servers.yml -> params.executor, per api under apis.<name>
+Import: from altered.server_executor import executor
+    result, wait = await executor.run('thought', 'altered.api_thought', payload)
+    executor.stats() -> {'thought': {'running': 1, 'wait_p90': 0.02, ...}}
+"""
+
+import asyncio, importlib, multiprocessing, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+import altered.model_params as msts
+from altered.hlp_lazy import lazy_instance
+from altered.model_metrics import RingBuffer
+
+
+class Saturated(Exception):
+    """No capacity left to queue the request."""
+    status_code = 503
+
+    def __init__(self, msg: str, *args, retry_after: float = 1.0, **kwargs) -> None:
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class Throttled(Saturated):
+    """Too many requests of one api."""
+    status_code = 429
+
+
+def call_api(module_name: str, payload: dict) -> Any:
+    """Imports the api module and runs its main, module level to be picklable."""
+    return importlib.import_module(module_name).main(**payload)
+
+
+class ApiExecutor:
+    defaults = {
+                'thread_workers': 8,
+                'process_workers': 2,
+                # apis run in the process pool, all others in the thread pool
+                'process_apis': ['prompt'],
+                # requests of one api running at once, waiting requests
+                'limit': 4,
+                'max_queue': 16,
+                # waiting requests of all apis
+                'max_pending': 64,
+                # seconds a request waits for a slot
+                'queue_timeout': 30.0,
+                'wait_samples': 1024,
+                # per api overwrites, i.e. {'thought': {'limit': 2}}
+                'apis': {},
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('executor') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.threads: Optional[ThreadPoolExecutor] = None
+        self.processes: Optional[ProcessPoolExecutor] = None
+        # api -> (event loop, semaphore), asyncio primitives belong to one loop
+        self.slots: Dict[str, tuple] = {}
+        self.waiting: Dict[str, int] = {}
+        self.running: Dict[str, int] = {}
+        self.waits: Dict[str, RingBuffer] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def api_params(self, api: str) -> Dict[str, Any]:
+        return dict(self.params, **(self.params['apis'].get(api) or {}))
+
+    def pool(self, api: str):
+        """The process pool for process_apis, the thread pool otherwise, started lazily."""
+        with self.lock:
+            if api in self.params['process_apis']:
+                if self.processes is None:
+                    # spawn: forking a process with running threads is unsafe
+                    self.processes = ProcessPoolExecutor(self.params['process_workers'],
+                                            mp_context=multiprocessing.get_context('spawn'))
+                return self.processes
+            if self.threads is None:
+                self.threads = ThreadPoolExecutor(self.params['thread_workers'],
+                                                  thread_name_prefix='api')
+            return self.threads
+
+    def slot(self, api: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if api not in self.slots or self.slots[api][0] is not loop:
+                self.slots[api] = (loop, asyncio.Semaphore(self.api_params(api)['limit']))
+            return self.slots[api][1]
+
+    def count(self, api: str, key: str) -> None:
+        """Call with self.lock."""
+        counts = self.counts.setdefault(api, {'served': 0, 'throttled': 0, 'rejected': 0,
+                                              'timeouts': 0, 'errors': 0})
+        counts[key] += 1
+
+    def admit(self, api: str) -> None:
+        """Queues a request of api or raises Throttled / Saturated."""
+        p = self.api_params(api)
+        with self.lock:
+            if self.waiting.get(api, 0) >= p['max_queue']:
+                self.count(api, 'throttled')
+                raise Throttled(f"api '{api}' has {p['max_queue']} requests waiting",
+                                retry_after=p['queue_timeout'] / p['max_queue'])
+            if sum(self.waiting.values()) >= self.params['max_pending']:
+                self.count(api, 'rejected')
+                raise Saturated(f"{self.params['max_pending']} requests are waiting")
+            self.waiting[api] = self.waiting.get(api, 0) + 1
+
+    async def run(self, api: str, module_name: str, payload: dict, *args, **kwargs
+                    ) -> Tuple[Any, float]:
+        """Runs module_name.main(**payload) off the loop, returns (result, queue wait)."""
+        self.admit(api)
+        slot, start = self.slot(api), time.time()
+        try:
+            await asyncio.wait_for(slot.acquire(), timeout=self.api_params(api)['queue_timeout'])
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.count(api, 'timeouts')
+            raise Saturated(f"no slot for api '{api}' within "
+                            f"{self.api_params(api)['queue_timeout']} seconds")
+        finally:
+            with self.lock:
+                self.waiting[api] -= 1
+        wait = time.time() - start
+        with self.lock:
+            self.running[api] = self.running.get(api, 0) + 1
+            if api not in self.waits:
+                self.waits[api] = RingBuffer(['wait'], self.params['wait_samples'])
+            self.waits[api].append({'wait': wait})
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.pool(api), call_api, module_name, payload)
+        except BaseException:
+            with self.lock:
+                self.count(api, 'errors')
+            raise
+        finally:
+            with self.lock:
+                self.running[api] -= 1
+            slot.release()
+        with self.lock:
+            self.count(api, 'served')
+        return result, wait
+
+    def shutdown(self, *args, **kwargs) -> None:
+        with self.lock:
+            pools, self.threads, self.processes = (self.threads, self.processes), None, None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """Running and waiting requests, queue waits and refusals per api."""
+        with self.lock:
+            out = {}
+            for api in sorted(set(self.counts) | set(self.waiting)):
+                waits = self.waits[api].column('wait') if api in self.waits else np.array([])
+                out[api] = dict(self.counts.get(api, {}),
+                    running=self.running.get(api, 0),
+                    waiting=self.waiting.get(api, 0),
+                    pool='process' if api in self.params['process_apis'] else 'thread',
+                    wait_p50=round(float(np.percentile(waits, 50)), 3) if len(waits) else None,
+                    wait_p90=round(float(np.percentile(waits, 90)), 3) if len(waits) else None,
+                )
+            return out
+
+
+executor = lazy_instance(ApiExecutor)
@@ -0,0 +1,379 @@
+"""
+server_jobs.py
+Asynchronous jobs for api_server /jobs. A thought with repeats and web search can run
+for minutes, /call/ holds the http request open all the while. A job is submitted
+instead, the client gets a job id back and polls the status, follows the partial output,
+fetches the result or cancels the job.
+
+Jobs wait in a bounded in-process queue (max_queue, 503 beyond) and run in workers
+threads. Apis with a stream generator (api_thought.stream) are streamed, their chunks are
+kept as partial output, others run their main. Every job reports its stage timings,
+the queue wait, the time to the first chunk, the run time and all sts.logs_timeit.timed
+stages run by the job (see logs_timeit.collect).
+
+With persist the jobs are kept in a SQLite file, finished jobs survive restarts and
+jobs queued at shutdown run again, jobs running at shutdown are failed.
+
+Job status: queued -> running -> done | failed | cancelled
+
+Defaults:   models_servers.yml -> params.jobs
+Import: from altered.server_jobs import jobs
+    job = jobs.submit('thought', 'altered.api_thought', payload) -> {'id': ..., 'status': 'queued'}
+    jobs.get(job['id']) -> {'status': 'running', 'stages': {...}, 'chunks': 12, ...}
+    for item in jobs.follow(job['id']): ...
+    jobs.cancel(job['id'])
+"""
+
+import importlib, json, os, sqlite3, threading, time, uuid
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+
+import altered.settings as sts
+import altered.logs_timeit as logs_timeit
+import altered.model_params as msts
+from altered.hlp_lazy import lazy_instance
+from altered.model_metrics import RingBuffer
+from altered.server_executor import Saturated
+
+
+final_states = ('done', 'failed', 'cancelled')
+
+
+class Job:
+    """One api call, its partial output and its stage timings."""
+    columns = ('id', 'api', 'module', 'status', 'payload', 'result', 'error',
+               'created', 'started', 'finished', 'stages')
+
+    def __init__(self, api: str, module: str, payload: dict, *args, id: str = None,
+                    status: str = 'queued', created: float = None, **kwargs) -> None:
+        self.id = id or uuid.uuid4().hex
+        self.api, self.module, self.payload = api, module, payload
+        self.status = status
+        self.result: Any = kwargs.get('result')
+        self.error: Optional[str] = kwargs.get('error')
+        self.created = created or time.time()
+        self.started: Optional[float] = kwargs.get('started')
+        self.finished: Optional[float] = kwargs.get('finished')
+        self.stages: Dict[str, float] = kwargs.get('stages') or {}
+        self.chunks: List[dict] = []
+        self.cancelled = threading.Event()
+
+    def to_dict(self, *args, result: bool = False, **kwargs) -> Dict[str, Any]:
+        out = {
+                'id': self.id, 'api': self.api, 'status': self.status,
+                'created': self.created, 'started': self.started, 'finished': self.finished,
+                'chunks': len(self.chunks), 'error': self.error,
+                'stages': {k: round(v, 4) for k, v in self.stages.items()},
+        }
+        if result:
+            out['result'] = self.result
+        return out
+
+    def to_row(self) -> tuple:
+        return (self.id, self.api, self.module, self.status, json.dumps(self.payload),
+                json.dumps(self.result, default=str), self.error, self.created,
+                self.started, self.finished, json.dumps(self.stages))
+
+    @classmethod
+    def from_row(cls, row: tuple) -> 'Job':
+        record = dict(zip(cls.columns, row))
+        for k in ('payload', 'result', 'stages'):
+            record[k] = json.loads(record[k]) if record[k] is not None else None
+        return cls(**record)
+
+
+class JobStore:
+    """SQLite persistence of jobs, one connection shared by the worker threads."""
+
+    def __init__(self, db_path: str, *args, **kwargs) -> None:
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS jobs ("
+                         f"id TEXT PRIMARY KEY, {', '.join(Job.columns[1:])})")
+        self.con.commit()
+
+    def save(self, job: Job) -> None:
+        with self.lock:
+            self.con.execute(f"INSERT OR REPLACE INTO jobs VALUES "
+                             f"({', '.join('?' * len(Job.columns))})", job.to_row())
+            self.con.commit()
+
+    def delete(self, job_ids: List[str]) -> None:
+        with self.lock:
+            self.con.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in job_ids])
+            self.con.commit()
+
+    def load(self) -> List[Job]:
+        with self.lock:
+            rows = self.con.execute(f"SELECT {', '.join(Job.columns)} FROM jobs "
+                                    f"ORDER BY created").fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def close(self) -> None:
+        with self.lock:
+            self.con.close()
+
+
+class JobManager:
+    defaults = {
+                # worker threads running jobs
+                'workers': 2,
+                # queued jobs, further submits get a 503
+                'max_queue': 32,
+                # jobs kept, the oldest finished jobs are dropped first
+                'max_jobs': 1024,
+                # SQLite persistence, db_path defaults to logs/server/jobs.sqlite
+                'persist': False,
+                'db_path': None,
+                # seconds a follow waits for new output before it gives up
+                'follow_timeout': 600.0,
+                'timing_samples': 1024,
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('jobs') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.jobs: Dict[str, Job] = {}
+        self.queue: deque = deque()
+        self.workers: List[threading.Thread] = []
+        self.store: Optional[JobStore] = None
+        self.started, self.stopping = False, False
+        self.timings = RingBuffer(['wait', 'first_chunk', 'run'], self.params['timing_samples'])
+        self.counts = {'submitted': 0, 'rejected': 0, 'done': 0, 'failed': 0, 'cancelled': 0}
+
+    def start(self, *args, **kwargs) -> None:
+        """Loads persisted jobs and starts the workers, once."""
+        with self.lock:
+            if self.started:
+                return
+            self.started, self.stopping = True, False
+            if self.params['persist']:
+                self.store = JobStore(self.params['db_path'] or
+                                        os.path.join(sts.logs_dir, 'server', 'jobs.sqlite'))
+                for job in self.store.load():
+                    if job.status == 'running':
+                        job.status, job.error = 'failed', 'interrupted by a server restart'
+                        job.finished = time.time()
+                        self.store.save(job)
+                    elif job.status == 'queued':
+                        self.queue.append(job)
+                    self.jobs[job.id] = job
+            for i in range(self.params['workers']):
+                worker = threading.Thread(target=self.work, name=f"job_{i}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def shutdown(self, *args, timeout: float = 1.0, **kwargs) -> None:
+        """Stops the workers, running jobs are cancelled, queued jobs stay persisted."""
+        with self.lock:
+            if not self.started:
+                return
+            self.stopping = True
+            for job in self.jobs.values():
+                if job.status == 'running':
+                    job.cancelled.set()
+            self.changed.notify_all()
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.join(timeout)
+        with self.lock:
+            self.started = False
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+    def save(self, job: Job) -> None:
+        if self.store is not None:
+            self.store.save(job)
+
+    def submit(self, api: str, module_name: str, payload: dict, *args, **kwargs
+                ) -> Dict[str, Any]:
+        """Queues module_name.main(**payload) or stream(**payload), raises Saturated if full."""
+        self.start()
+        with self.lock:
+            if len(self.queue) >= self.params['max_queue']:
+                self.counts['rejected'] += 1
+                raise Saturated(f"{self.params['max_queue']} jobs are queued",
+                                retry_after=self.wait_estimate())
+            job = Job(api, module_name, payload)
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self.counts['submitted'] += 1
+            self.evict()
+            self.changed.notify_all()
+            depth = len(self.queue)
+        self.save(job)
+        return dict(job.to_dict(), queue_depth=depth)
+
+    def evict(self) -> None:
+        """Drops the oldest finished jobs beyond max_jobs, call with self.lock."""
+        finished = [job for job in self.jobs.values() if job.status in final_states]
+        excess = len(self.jobs) - self.params['max_jobs']
+        if excess <= 0:
+            return
+        dropped = sorted(finished, key=lambda job: job.finished or 0)[:excess]
+        for job in dropped:
+            del self.jobs[job.id]
+        if self.store is not None and dropped:
+            self.store.delete([job.id for job in dropped])
+
+    def wait_estimate(self) -> float:
+        """Seconds until a queue slot frees up, from the recent run times."""
+        runs = self.timings.column('run')
+        runs = runs[~np.isnan(runs)]
+        run = float(np.median(runs)) if len(runs) else 1.0
+        return max(run * len(self.queue) / max(self.params['workers'], 1), 1.0)
+
+    def get(self, job_id: str, *args, result: bool = False, **kwargs
+                ) -> Optional[Dict[str, Any]]:
+        self.start()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            out = job.to_dict(result=result)
+            if job.status == 'queued':
+                out['queue_position'] = self.queue.index(job) + 1
+            return out
+
+    def cancel(self, job_id: str, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        """
+        A queued job is cancelled at once. A streamed job stops at its next chunk,
+        a running main can not be interrupted, its result is discarded.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status in final_states:
+                return job.to_dict()
+            job.cancelled.set()
+            if job.status == 'queued':
+                self.queue.remove(job)
+                self.finish(job, 'cancelled')
+            out = job.to_dict()
+        self.save(job)
+        return out
+
+    def finish(self, job: Job, status: str, *args, result: Any = None, error: str = None,
+                **kwargs) -> None:
+        """Call with self.lock."""
+        job.status, job.result, job.error, job.finished = status, result, error, time.time()
+        if job.started is not None:
+            job.stages['run'] = job.finished - job.started
+            self.timings.append({k: job.stages.get(k) for k in self.timings.columns})
+        self.counts[status] += 1
+        self.changed.notify_all()
+
+    def work(self, *args, **kwargs) -> None:
+        while True:
+            with self.lock:
+                while not self.queue and not self.stopping:
+                    self.changed.wait()
+                if self.stopping:
+                    return
+                job = self.queue.popleft()
+                job.status, job.started = 'running', time.time()
+                job.stages['wait'] = job.started - job.created
+            self.save(job)
+            self.run(job)
+            self.save(job)
+
+    def run(self, job: Job) -> None:
+        """Runs job in this worker thread and records its stages."""
+        try:
+            with logs_timeit.collect() as stages:
+                module = importlib.import_module(job.module)
+                # job options, the apis set stream themselves
+                payload = dict(job.payload)
+                streamed = payload.pop('stream', True)
+                payload.pop('stream_fmt', None)
+                if hasattr(module, 'stream') and streamed:
+                    result = self.follow_stream(job, module.stream(**payload))
+                else:
+                    result = module.main(**payload)
+        except Exception as e:
+            with self.lock:
+                job.stages.update(stages)
+                self.finish(job, 'failed', error=f"{type(e).__name__}: {e}")
+            return
+        with self.lock:
+            job.stages.update(stages)
+            if job.cancelled.is_set():
+                self.finish(job, 'cancelled')
+            else:
+                self.finish(job, 'done', result=result)
+
+    def follow_stream(self, job: Job, items: Iterator[dict]) -> Any:
+        """Keeps the chunks of a stream generator as partial output, returns the last item."""
+        result = None
+        try:
+            for item in items:
+                if job.cancelled.is_set():
+                    break
+                if item.get('done'):
+                    result = {k: v for k, v in item.items() if k != 'done'}
+                    if result.get('error'):
+                        raise RuntimeError(result['error'])
+                    continue
+                with self.lock:
+                    if not job.chunks:
+                        job.stages['first_chunk'] = time.time() - job.started
+                    job.chunks.append(item)
+                    self.changed.notify_all()
+        finally:
+            # a cancelled stream is closed, the model call behind it stops
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+        return result
+
+    def follow(self, job_id: str, *args, offset: int = 0, **kwargs) -> Iterator[dict]:
+        """
+        Yields the chunks of job_id from offset on, while they are generated, and
+        finally {'done': True, 'status': ..., 'result': ..., 'error': ...}.
+        """
+        timeout = self.params['follow_timeout']
+        while True:
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    return
+                deadline = time.time() + timeout
+                while len(job.chunks) <= offset and job.status not in final_states:
+                    if time.time() >= deadline:
+                        break
+                    self.changed.wait(deadline - time.time())
+                items, finished = job.chunks[offset:], job.status in final_states
+                last = dict(job.to_dict(result=True), done=True)
+            offset += len(items)
+            yield from items
+            if finished:
+                yield last
+                return
+            if not items:
+                yield dict(last, done=False, error='follow timeout')
+                return
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        """Queue depth, jobs per status and wait, first chunk and run time percentiles."""
+        with self.lock:
+            states = {}
+            for job in self.jobs.values():
+                states[job.status] = states.get(job.status, 0) + 1
+            out = dict(self.counts, queue_depth=len(self.queue), states=states,
+                        workers=len(self.workers), persist=self.store is not None)
+            for col in self.timings.columns:
+                values = self.timings.column(col)
+                values = values[~np.isnan(values)]
+                for p in (50, 90):
+                    out[f"{col}_p{p}"] = round(float(np.percentile(values, p)), 3) \
+                                                                    if len(values) else None
+        return out
+
+
+jobs = lazy_instance(JobManager)
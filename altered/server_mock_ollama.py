@@ -0,0 +1,456 @@
+"""
+server_mock_ollama.py
+Local stand-in for an Ollama host, so the client stack can be tested and benchmarked
+without a GPU. It answers
+
+    POST /api/generate, /api/chat           text, streamed as ndjson if stream is not False
+    POST /api/embed, /api/embeddings       deterministic unit vectors
+    GET  /api/ps                           the loaded models
+    POST /api/get_generates, /api/get_embeddings   like server_ollama_endpoint.py
+    GET  /ping
+
+Every request is timed like a real host: a model that is not loaded costs load_time
+seconds, the prompt tokens (model_tokens.py) cost prefill_tps, the generated tokens cost
+decode_tps. Tokens shared with the previous prompt of the model are not prefilled again,
+like the ollama KV cache. At most num_parallel requests per model run at once
+(OLLAMA_NUM_PARALLEL), more than max_queue waiting requests get 503, and
+max_loaded_models models stay loaded (OLLAMA_MAX_LOADED_MODELS). hang_rate of the
+requests stall for hang_time seconds, error_rate of them fail with 500.
+time_scale multiplies all simulated durations, i.e. 0.01 for fast unit tests.
+
+Defaults:   models_servers.yml -> params.mock_ollama, per model under models.<name>
+Shell:      python -m altered.server_mock_ollama --port 11435 --decode_tps 40
+            then use the mock server, i.e. alter thought -a l3.2_mock
+Import: from altered.server_mock_ollama import MockOllama
+    with MockOllama(num_parallel=2, time_scale=0.01) as mock:
+        ollama.Client(mock.url).generate(model='llama3.2:3b', prompt='Ping!')
+"""
+
+import argparse, hashlib, json, math, random, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from colorama import Fore
+
+import altered.model_params as msts
+from altered.model_tokens import tokens
+
+
+class Busy(Exception):
+    """More requests are waiting than the host queues, ollama answers 503."""
+
+
+class MockOllama:
+    defaults = {
+                'port': 11435,
+                # simulated speed, tokens per second
+                'prefill_tps': 2000.0,
+                'decode_tps': 50.0,
+                # seconds to load a model that is not loaded
+                'load_time': 2.0,
+                # generated tokens if the request has no options.num_predict
+                'num_predict': 32,
+                # OLLAMA_NUM_PARALLEL, OLLAMA_MAX_QUEUE, OLLAMA_MAX_LOADED_MODELS
+                'num_parallel': 1,
+                'max_queue': 512,
+                'max_loaded_models': 2,
+                'keep_alive': 300,
+                # fraction of requests that stall for hang_time seconds or fail
+                'hang_rate': 0.0,
+                'hang_time': 600.0,
+                'error_rate': 0.0,
+                'embed_dim': 8,
+                # multiplies every simulated duration
+                'time_scale': 1.0,
+                'seed': None,
+                # per model overwrites of the values above, i.e. {'qwq:32b': {'decode_tps': 8}}
+                'models': {},
+    }
+    ns = 1e9
+
+    def __init__(self, *args, host: str = '127.0.0.1', port: int = None, **kwargs) -> None:
+        self.params = dict(self.defaults, **(msts.config.params.get('mock_ollama') or {}))
+        self.params.update({k: v for k, v in kwargs.items() if k in self.defaults})
+        self.host = host
+        self.port = self.params['port'] if port is None else port
+        self.lock = threading.Lock()
+        self.rd = random.Random(self.params['seed'])
+        # model -> expiry time stamp (None: never) and time stamp of the last use
+        self.loaded: Dict[str, Optional[float]] = {}
+        self.used: Dict[str, float] = {}
+        self.load_locks: Dict[str, threading.Lock] = {}
+        self.slots: Dict[str, threading.Semaphore] = {}
+        self.last_prompt: Dict[str, str] = {}
+        self.waiting = 0
+        self.counts = {'requests': 0, 'loads': 0, 'evictions': 0, 'rejected': 0,
+                       'hangs': 0, 'errors': 0, 'max_running': 0}
+        self.running: Dict[str, int] = {}
+        self.httpd: Optional[ThreadingHTTPServer] = None
+
+    # ─── server ───────────────────────────────────────────────────────────
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def bind(self) -> ThreadingHTTPServer:
+        """Creates the http server, port 0 picks a free port."""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.port = self.httpd.server_port
+        return self.httpd
+
+    def start(self) -> 'MockOllama':
+        """Serves in a daemon thread."""
+        threading.Thread(target=self.bind().serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self) -> 'MockOllama':
+        return self.start() if self.httpd is None else self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    # ─── simulation ───────────────────────────────────────────────────────
+    def model_params(self, model: str) -> Dict[str, Any]:
+        return dict(self.params, **(self.params['models'].get(model) or {}))
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds * self.params['time_scale'])
+
+    def duration(self, start: float) -> int:
+        """Simulated nanoseconds since start, time_scale taken out."""
+        return int((time.time() - start) / (self.params['time_scale'] or 1) * self.ns)
+
+    @staticmethod
+    def keep_alive_seconds(keep_alive: Any, default: float) -> Optional[float]:
+        """ollama keep_alive: seconds or '5m' like durations, negative keeps forever."""
+        if keep_alive is None:
+            return default
+        if isinstance(keep_alive, str):
+            units = {'s': 1, 'm': 60, 'h': 3600}
+            if keep_alive[-1:] in units:
+                return float(keep_alive[:-1]) * units[keep_alive[-1]]
+            keep_alive = float(keep_alive)
+        return None if keep_alive < 0 else float(keep_alive)
+
+    def expire(self) -> None:
+        """Unloads models whose keep_alive ran out, call with self.lock."""
+        now = time.time()
+        for model, expires in list(self.loaded.items()):
+            if expires is not None and expires <= now and not self.running.get(model):
+                del self.loaded[model]
+
+    def load(self, model: str, keep_alive: Any) -> float:
+        """Loads model if needed, returns the seconds that took."""
+        with self.lock:
+            lock = self.load_locks.setdefault(model, threading.Lock())
+        with lock:
+            with self.lock:
+                self.expire()
+                is_loaded = model in self.loaded
+                if not is_loaded:
+                    idle = sorted((m for m in self.loaded if not self.running.get(m)),
+                                                                    key=self.used.get)
+                    while len(self.loaded) >= self.params['max_loaded_models'] and idle:
+                        self.loaded.pop(idle.pop(0))
+                        self.counts['evictions'] += 1
+            load_time = 0.0 if is_loaded else self.model_params(model)['load_time']
+            self.sleep(load_time)
+            with self.lock:
+                seconds = self.keep_alive_seconds(keep_alive, self.params['keep_alive'])
+                self.loaded[model] = None if seconds is None else time.time() + seconds
+                self.used[model] = time.time()
+                self.counts['loads'] += int(not is_loaded)
+        return load_time
+
+    def slot(self, model: str) -> threading.Semaphore:
+        with self.lock:
+            if model not in self.slots:
+                self.slots[model] = threading.Semaphore(self.model_params(model)['num_parallel'])
+            return self.slots[model]
+
+    def admit(self, model: str) -> None:
+        """Waits for a slot of model, raises Busy if the queue is full."""
+        with self.lock:
+            self.counts['requests'] += 1
+            if self.waiting >= self.params['max_queue']:
+                self.counts['rejected'] += 1
+                raise Busy('server busy, please try again.  maximum pending requests exceeded')
+            self.waiting += 1
+        try:
+            self.slot(model).acquire()
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        with self.lock:
+            self.running[model] = self.running.get(model, 0) + 1
+            self.counts['max_running'] = max(self.counts['max_running'], self.running[model])
+
+    def leave(self, model: str) -> None:
+        with self.lock:
+            self.running[model] -= 1
+        self.slot(model).release()
+
+    def mishap(self, model: str) -> None:
+        """Simulated hangs and failures, the slot stays taken meanwhile."""
+        p = self.model_params(model)
+        with self.lock:
+            hang, error = self.rd.random() < p['hang_rate'], self.rd.random() < p['error_rate']
+            self.counts['hangs'] += int(hang)
+            self.counts['errors'] += int(error)
+        if hang:
+            self.sleep(p['hang_time'])
+        if error:
+            raise RuntimeError(f"mock failure of {model}")
+
+    def prefill(self, model: str, prompt: str) -> int:
+        """Prompt tokens to evaluate, the prefix shared with the last prompt is cached."""
+        with self.lock:
+            previous, self.last_prompt[model] = self.last_prompt.get(model, ''), prompt
+        shared = 0
+        for a, b in zip(previous, prompt):
+            if a != b:
+                break
+            shared += 1
+        return max(tokens.count(prompt[shared:]), 1) if prompt else 0
+
+    def run(self, model: str, prompt: str, body: dict) -> Iterator[Dict[str, Any]]:
+        """
+        Simulates one generation, yields one chunk per generated token and a final chunk
+        with the ollama timings.
+        """
+        p, options = self.model_params(model), body.get('options') or {}
+        self.admit(model)
+        try:
+            start = time.time()
+            load_time = self.load(model, body.get('keep_alive'))
+            self.mishap(model)
+            prompt_tokens = self.prefill(model, prompt)
+            self.sleep(prompt_tokens / p['prefill_tps'])
+            num_predict = options.get('num_predict') or p['num_predict']
+            num_predict = num_predict if num_predict > 0 else p['num_predict']
+            words = self.reply(model, num_predict, body.get('format'))
+            for word in words[:-1]:
+                self.sleep(1 / p['decode_tps'])
+                yield {'text': word, 'done': False}
+            self.sleep(1 / p['decode_tps'])
+            yield {'text': words[-1], 'done': True, 'timings': {
+                    'total_duration': self.duration(start),
+                    'load_duration': int(load_time * self.ns),
+                    'prompt_eval_count': prompt_tokens,
+                    'prompt_eval_duration': int(prompt_tokens / p['prefill_tps'] * self.ns),
+                    'eval_count': len(words),
+                    'eval_duration': int(len(words) / p['decode_tps'] * self.ns),
+            }}
+        finally:
+            self.leave(model)
+
+    @staticmethod
+    def reply(model: str, num_predict: int, fmt: Any) -> List[str]:
+        if fmt == 'json' or isinstance(fmt, dict):
+            return [json.dumps({'response': f"mock answer of {model}"})]
+        return [f"mock{' ' if i < num_predict - 1 else '.'}" for i in range(num_predict)]
+
+    def vector(self, text: str) -> List[float]:
+        """Deterministic unit vector, equal texts get equal vectors."""
+        digest = hashlib.sha256(text.encode('utf-8', errors='replace')).digest()
+        values = [digest[i % len(digest)] - 127.5 for i in range(self.params['embed_dim'])]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    # ─── endpoints ────────────────────────────────────────────────────────
+    def generate(self, body: dict) -> Iterator[Dict[str, Any]]:
+        for chunk in self.run(body['model'], body.get('prompt') or '', body):
+            yield self.mk_chunk(body['model'], chunk, {'response': chunk['text']})
+
+    def chat(self, body: dict) -> Iterator[Dict[str, Any]]:
+        prompt = ''.join(str(m.get('content') or '') for m in body.get('messages') or [])
+        for chunk in self.run(body['model'], prompt, body):
+            message = {'role': 'assistant', 'content': chunk['text']}
+            yield self.mk_chunk(body['model'], chunk, {'message': message})
+
+    def mk_chunk(self, model: str, chunk: dict, data: dict) -> Dict[str, Any]:
+        out = dict(model=model, created_at=dt.now(timezone.utc).isoformat(),
+                   done=chunk['done'], **data)
+        if chunk['done']:
+            out.update(done_reason='stop', **chunk['timings'])
+        return out
+
+    def embed(self, body: dict) -> Dict[str, Any]:
+        inputs = body.get('input') or []
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        model, p = body['model'], self.model_params(body['model'])
+        self.admit(model)
+        try:
+            start = time.time()
+            load_time = self.load(model, body.get('keep_alive'))
+            self.mishap(model)
+            prompt_tokens = sum(tokens.count(text) for text in inputs)
+            self.sleep(prompt_tokens / p['prefill_tps'])
+        finally:
+            self.leave(model)
+        return {'model': model, 'embeddings': [self.vector(text) for text in inputs],
+                'total_duration': self.duration(start),
+                'load_duration': int(load_time * self.ns),
+                'prompt_eval_count': prompt_tokens}
+
+    def embeddings(self, body: dict) -> Dict[str, Any]:
+        """The legacy endpoint, one prompt and one vector."""
+        r = self.embed(dict(body, input=[body.get('prompt') or '']))
+        return {'embedding': r['embeddings'][0]}
+
+    def ps(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            self.expire()
+            loaded = dict(self.loaded)
+        models = []
+        for model, expires in loaded.items():
+            expires = dt.fromtimestamp(expires, timezone.utc) if expires is not None \
+                                    else dt.now(timezone.utc) + timedelta(days=365)
+            models.append({'name': model, 'model': model, 'size': 0, 'size_vram': 0,
+                           'expires_at': expires.isoformat()})
+        return {'models': models}
+
+    def get_generates(self, body: dict) -> Dict[str, Any]:
+        """The altered endpoint protocol, see server_ollama_endpoint.Endpoints."""
+        repeats = (body.get('repeats') or {}).get('num', 1)
+        prompts = [prompt for prompt in body.get('prompts') or [] for _ in range(repeats)]
+        params = {k: v for k, v in body.items() if k in {'options', 'keep_alive', 'format'}}
+
+        def once(prompt: str) -> Dict[str, Any]:
+            try:
+                *_, last = self.generate(dict(params, model=body['model'], prompt=prompt))
+                return last
+            except (Busy, RuntimeError) as e:
+                return {'error': f"{type(e).__name__}: {e}"}
+        return self.fan_out(once, prompts, body)
+
+    def get_embeddings(self, body: dict) -> Dict[str, Any]:
+        def once(prompt: str) -> Dict[str, Any]:
+            try:
+                return self.embeddings({'model': body['model'], 'prompt': prompt,
+                                        'keep_alive': body.get('keep_alive')})
+            except (Busy, RuntimeError) as e:
+                return {'error': f"{type(e).__name__}: {e}"}
+        return self.fan_out(once, body.get('prompts') or [], body)
+
+    def fan_out(self, once, prompts: list, body: dict) -> Dict[str, Any]:
+        start = time.time()
+        if len(prompts) <= 1:
+            responses = [once(prompt) for prompt in prompts]
+        else:
+            with ThreadPoolExecutor(max_workers=len(prompts)) as ex:
+                responses = list(ex.map(once, prompts))
+        out = {'responses': responses}
+        if body.get('network_up_time') is not None:
+            out.update(network_up_time=max(start - body['network_up_time'], 0.0),
+                       server_time=time.time() - start, network_down_time=time.time())
+        return out
+
+    def stats(self, *args, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.counts, waiting=self.waiting, loaded=sorted(self.loaded))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    streams = {'/api/generate': 'generate', '/api/chat': 'chat'}
+    posts = {'/api/embed': 'embed', '/api/embeddings': 'embeddings',
+             '/api/get_generates': 'get_generates', '/api/get_embeddings': 'get_embeddings'}
+
+    @property
+    def mock(self) -> MockOllama:
+        return self.server.mock
+
+    def do_GET(self, *args, **kwargs):
+        if self.path == '/api/ps':
+            self.send_json(self.mock.ps())
+        elif self.path == '/ping':
+            self.send_json({'status': 'pong', 'mock': self.mock.stats()})
+        else:
+            self.send_json({'error': f"Not a valid endpoint: '{self.path}'"}, 404)
+
+    def do_POST(self, *args, **kwargs):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        try:
+            if self.path in self.streams:
+                chunks = getattr(self.mock, self.streams[self.path])(body)
+                if body.get('stream', True):
+                    self.send_stream(chunks)
+                else:
+                    self.send_json(self.join(chunks))
+            elif self.path in self.posts:
+                self.send_json(getattr(self.mock, self.posts[self.path])(body))
+            else:
+                self.send_json({'error': f"Not a valid endpoint: '{self.path}'"}, 404)
+        except Busy as e:
+            self.send_json({'error': str(e)}, 503)
+        except (RuntimeError, KeyError) as e:
+            self.send_json({'error': str(e)}, 500)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up, i.e. timed out on a hang
+            pass
+
+    @staticmethod
+    def join(chunks: Iterator[dict]) -> dict:
+        """The single answer of stream=False holds the whole text."""
+        texts, last = [], None
+        for last in chunks:
+            texts.append(last['message']['content'] if 'message' in last else last['response'])
+        if 'message' in last:
+            return dict(last, message=dict(last['message'], content=''.join(texts)))
+        return dict(last, response=''.join(texts))
+
+    def send_json(self, data: dict, status: int = 200) -> None:
+        raw = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def send_stream(self, chunks: Iterator[dict]) -> None:
+        """ndjson in chunked transfer encoding, one line per token."""
+        first = next(chunks)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.write_chunk(first)
+        for chunk in chunks:
+            self.write_chunk(chunk)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, chunk: dict) -> None:
+        raw = json.dumps(chunk).encode('utf-8') + b'\n'
+        self.wfile.write(f"{len(raw):x}\r\n".encode('ascii') + raw + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+def run(*args, port: int = None, **kwargs) -> None:
+    mock = MockOllama(*args, host='', port=port, **kwargs)
+    httpd = mock.bind()
+    print(f"{Fore.GREEN}Mock ollama serving on port {mock.port}{Fore.RESET}, "
+          f"{ {k: v for k, v in mock.params.items() if k != 'models'} }")
+    httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local mock ollama server.')
+    parser.add_argument('--port', type=int, default=None)
+    for name, value in MockOllama.defaults.items():
+        if isinstance(value, (int, float)) and name != 'port':
+            parser.add_argument(f"--{name}", type=type(value), default=None)
+    run(**{k: v for k, v in vars(parser.parse_args()).items() if v is not None})
@@ -1,12 +1,16 @@
-import json, os, time, yaml
+import gzip, json, os, signal, threading, time, yaml
 from collections import defaultdict
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from colorama import Fore, Style
 from ollama import Client
 import random as rd
 import socket
 
 from altered.server_ollama_server import OllamaCall
+from altered.server_batcher import MicroBatcher
+from altered.model_ollama_connect import OllamaConnect
 import altered.model_params as msts
 import altered.settings as sts
 
@@ -19,30 +23,101 @@ class Endpoints:
         """
         self.ep_mapps = {
             'get_generates': 'generate',
-            'get_embeddings': 'embeddings',
+            'get_embeddings': 'embed',
         }
         # Used to filter the kwargs for the ollama client
         self.ollama_params = {'prompt', 'options', 'keep_alive', 'stream', 'model'}
+        self.embed_params = {'options', 'keep_alive', 'model', 'truncate', 'dimensions'}
         self.ollama_formats = {'json', }
         self.api_counter = defaultdict(int)
+        self.lock = threading.Lock()
+        # requests are served by concurrent threads, each counts its own prompts
+        self.local = threading.local()
         self.ollama_call = OllamaCall(*args, **kwargs)
+        self.num_parallel = self.get_num_parallel(*args, **kwargs)
+        # concurrent requests of the same model and params are merged, see server_batcher.py
+        self.batcher = MicroBatcher(*args, **kwargs)
+
+    @property
+    def prompt_counter(self) -> defaultdict:
+        """Prompts processed for the request of the calling thread."""
+        if not hasattr(self.local, 'prompt_counter'):
+            self.local.prompt_counter = defaultdict(int)
+        return self.local.prompt_counter
+
+    @prompt_counter.setter
+    def prompt_counter(self, counter: defaultdict) -> None:
+        self.local.prompt_counter = counter
+
+    def count_api(self, ep: str) -> dict:
+        """Counts a request to ep, returns a snapshot of all counts for the response."""
+        with self.lock:
+            self.api_counter[ep] += 1
+            return dict(self.api_counter)
+
+    @staticmethod
+    def get_num_parallel(*args, **kwargs) -> int:
+        """
+        Parallel request slots of the local Ollama host. OLLAMA_NUM_PARALLEL is the
+        setting Ollama itself uses, models_servers.yml is the fallback.
+        """
+        num_parallel = os.environ.get('OLLAMA_NUM_PARALLEL')
+        if num_parallel and num_parallel.isdigit():
+            return max(int(num_parallel), 1)
+        return msts.config.get_num_parallel(msts.config.params.get('ollama_host', ''))
+
+    def fan_out(self, ep: str, prompts: list, params: dict) -> list:
+        """
+        Runs one ollama call per prompt with at most num_parallel calls in flight.
+        The responses keep the order of prompts. A prompt can be a batch (list) of
+        inputs for endpoints like embed.
+        """
+        func = self.ep_mapps.get(ep)
+        if len(prompts) <= 1 or self.num_parallel <= 1:
+            responses = [self.ollama_call.execute(func, prompt, params) for prompt in prompts]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(prompts), self.num_parallel)) as ex:
+                responses = list(ex.map(lambda p: self.ollama_call.execute(func, p, params),
+                                        prompts))
+        return responses
+
+    def batched(self, ep: str, prompts: list, params: dict, run) -> list:
+        """
+        Runs prompts together with the ones of concurrent requests for the same
+        model and params, returns the responses of prompts.
+        """
+        key = (ep, params.get('model'), json.dumps(params, sort_keys=True, default=str))
+        return self.batcher.submit(key, prompts, lambda items: run(ep, items, params))
+
+    def embed_all(self, ep: str, prompts: list, params: dict) -> list:
+        """
+        The prompts are sent in batches to the ollama embed endpoint,
+        each prompt gets its own response.
+        """
+        batches = OllamaConnect.mk_batches(prompts)
+        responses = []
+        for batch, r in zip(batches, self.fan_out(ep, batches, params)):
+            if 'error' in r:
+                responses.extend({'error': r['error']} for _ in batch)
+            else:
+                responses.extend({'embedding': list(vec)} for vec in r['embeddings'])
+        return responses
 
     def get_embeddings(self, ep, *args, prompts: list, **kwargs) -> dict:
         """
-        Retrieves embeddings for the provided prompts.
+        Retrieves embeddings for the provided prompts. The prompts are sent in batches
+        to the ollama embed endpoint, each prompt gets its own response.
 
         Args:
             ep (str): The endpoint name.
             prompts (list): List of prompts to send to the Ollama server.
 
         Returns:
-            dict: The server's responses containing embeddings.
+            dict: The server's responses containing one embedding per prompt.
         """
-        responses = []
-        for prompt in prompts:
-            params = {k: v for k, v in kwargs.items() if k in self.ollama_params}
-            responses.append(self.ollama_call.execute(self.ep_mapps.get(ep), prompt, params))
-            self.prompt_counter[ep] += 1
+        params = {k: v for k, v in kwargs.items() if k in self.embed_params}
+        responses = self.batched(ep, prompts, params, self.embed_all)
+        self.prompt_counter[ep] += len(responses)
         return {'responses': responses}
 
     def get_generates(self, ep: str, *args, prompts: list, repeats: int = sts.repeats, **kwargs) -> dict:
@@ -57,12 +132,11 @@ class Endpoints:
         Returns:
             dict: The server's responses containing generated texts.
         """
-        responses = []
-        for i, prompt in enumerate(prompts):
-            for repeat in range(repeats['num']):
-                params = {k: v for k, v in kwargs.items() if k in self.ollama_params}
-                responses.append(self.ollama_call.execute(self.ep_mapps.get(ep), prompt, params))
-                self.prompt_counter[ep] += 1
+        params = {k: v for k, v in kwargs.items() if k in self.ollama_params}
+        # every prompt is repeated repeats['num'] times, prompt by prompt
+        repeated = [prompt for prompt in prompts for _ in range(repeats['num'])]
+        responses = self.batched(ep, repeated, params, self.fan_out)
+        self.prompt_counter[ep] += len(responses)
         return {'responses': responses}
 
 
@@ -70,20 +144,22 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
     service = None  # This will be set when the server starts
     allowed_endpoints = {'get_generates', 'get_embeddings'}
     notams = {}
+    # persistent connections, every response carries its Content-Length
+    protocol_version = 'HTTP/1.1'
 
     def do_GET(self, *args, **kwargs):
         """
         Handles the GET requests. Specifically checks for /ping endpoint and returns
-        server start time and uptime.
+        server start time and uptime. /ping never waits for a worker.
         """
         if self.path == '/ping':
             payload = {
                 'status': f"running since: {self.server.server_start_time}",
+                'retry': self.service.ollama_call.stats(),
+                'workers': self.server.stats(),
+                'batching': self.service.batcher.stats(),
             }
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(payload).encode('utf-8'))
+            self.send_server_response(payload)
         else:
             self.send_error(404, f"Not a valid endpoint: '{self.path}'")
 
@@ -96,29 +172,40 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         """
         # Update kwargs with the parsed JSON body from the client
         kwargs.update(self.get_kwargs(*args, **kwargs))
-        self.start_timing(*args, **kwargs)
-        ep, payload = self.get_endpoint(*args, **kwargs)
-        # Route the request to the appropriate service ep
-        payload.update(getattr(self.service, ep)(ep, *args, server=self.server, **kwargs))
-        # Update response with timing information and other server statistics
-        payload.update(self.end_timing(ep, *args, **kwargs))
-        # Send the JSON response
-        self.send_server_response(payload, *args, **kwargs)
+        if self.server.draining:
+            self.close_connection = True
+            self.send_server_response({'error': 'server is shutting down'}, status_code=503)
+            return
+        with self.server.working():
+            self.start_timing(*args, **kwargs)
+            ep, payload = self.get_endpoint(*args, **kwargs)
+            if ep is None:
+                return
+            # Route the request to the appropriate service ep
+            payload.update(getattr(self.service, ep)(ep, *args, server=self.server, **kwargs))
+            # Update response with timing information and other server statistics
+            payload.update(self.end_timing(ep, *args, **kwargs))
+            # Send the JSON response
+            self.send_server_response(payload, *args, **kwargs)
 
     def get_kwargs(self, *args, **kwargs) -> dict:
-        return json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        # large prompts can be sent gzip compressed
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return json.loads(body) if body else {}
 
     def get_endpoint(self, *args, **kwargs) -> str:
         ep = self.path.strip('/').replace('api/', '')
         if ep not in self.allowed_endpoints:
             time.sleep(2)
             self.send_error(404, f"Not a valid endpoint: '/{ep}'")
-            return
+            return None, None
         else:
-            self.service.api_counter[ep] += 1
+            api_counter = self.service.count_api(ep)
             self.service.prompt_counter = defaultdict(int)
         return ep, {
-                    'api_counter': self.service.api_counter, 
+                    'api_counter': api_counter,
                     'prompt_counter': self.service.prompt_counter
                     }
 
@@ -171,20 +258,87 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             payload: A dictionary to be sent as JSON.
             status_code: HTTP status code (default is 200).
         """
+        body = json.dumps(payload).encode('utf-8')
+        compress = 'gzip' in (self.headers.get('Accept-Encoding') or '') \
+                                        and len(body) >= self.server.params['gzip_min_size']
+        if compress:
+            body = gzip.compress(body, compresslevel=self.server.params['gzip_level'])
         try:
             self.send_response(status_code)
             self.send_header('Content-Type', 'application/json')
+            if compress:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(json.dumps(payload).encode('utf-8'))
+            self.wfile.write(body)
         except Exception as e:
             print(f"Error sending response: {e}")
             self.send_error(500, str(e), *args, **kwargs)
 
 
-class ServiceHTTPServer(HTTPServer):
+class ServiceHTTPServer(ThreadingHTTPServer):
+    """
+    Serves every connection in its own thread, so a long generation does not block
+    other clients or /ping. At most max_workers POST requests are processed at once,
+    further ones wait. drain() stops accepting requests and waits for the ones in flight.
+    """
+    defaults = {
+                'max_workers': 16,
+                # seconds an idle keep-alive connection stays open
+                'keep_alive_timeout': 60,
+                # responses of at least this many bytes are gzipped if the client accepts it
+                'gzip_min_size': 1024,
+                'gzip_level': 5,
+                # seconds drain() waits for in-flight requests
+                'drain_timeout': 120,
+    }
+    daemon_threads = True
+
     def __init__(self, *args, **kwargs):
+        self.params = dict(self.defaults, **(msts.config.params.get('endpoint') or {}))
         super().__init__(*args, **kwargs)
         self.RequestHandlerClass.service = Endpoints(*args, **kwargs)
+        self.RequestHandlerClass.timeout = self.params['keep_alive_timeout']
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.workers = threading.BoundedSemaphore(self.params['max_workers'])
+        self.in_flight, self.served, self.draining = 0, 0, False
+        self.drained = threading.Event()
+
+    @contextmanager
+    def working(self):
+        """Holds a worker slot, requests waiting for one count as in flight."""
+        with self.lock:
+            self.in_flight += 1
+        try:
+            with self.workers:
+                yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.served += 1
+                self.idle.notify_all()
+
+    def drain(self, *args, timeout: float = None, **kwargs) -> bool:
+        """
+        Graceful shutdown: new requests get 503, the ones in flight finish within
+        timeout seconds. Call from another thread than serve_forever.
+        Returns False if requests were still running at the timeout.
+        """
+        timeout = self.params['drain_timeout'] if timeout is None else timeout
+        with self.lock:
+            self.draining = True
+        self.shutdown()
+        with self.lock:
+            drained = self.idle.wait_for(lambda: self.in_flight == 0, timeout=timeout)
+        self.server_close()
+        self.drained.set()
+        return drained
+
+    def stats(self, *args, **kwargs) -> dict:
+        with self.lock:
+            return {'in_flight': self.in_flight, 'served': self.served,
+                    'max_workers': self.params['max_workers'], 'draining': self.draining}
 
 
 def run(server_class=ServiceHTTPServer, handler_class=SimpleHTTPRequestHandler, port=None, 
@@ -196,9 +350,18 @@ def run(server_class=ServiceHTTPServer, handler_class=SimpleHTTPRequestHandler,
     print(f"{server_address = }")
     httpd = server_class(server_address, handler_class)
     httpd.server_start_time = sts.run_time_start
+    # SIGTERM and Ctrl+C drain the in-flight generations before the server stops
+    if threading.current_thread() is threading.main_thread():
+        def on_signal(signum, frame):
+            print(f"{Fore.YELLOW}Draining {httpd.stats()['in_flight']} requests...{Fore.RESET}")
+            threading.Thread(target=httpd.drain, daemon=True).start()
+        signal.signal(signal.SIGTERM, on_signal)
+        signal.signal(signal.SIGINT, on_signal)
     print(f"Starting the HTTP server at {httpd.server_start_time}, on port {port}...")
     print(f"ping me like: curl http://{socket.gethostbyname(socket.gethostname())}:{port}/ping")
     httpd.serve_forever()
+    if httpd.draining:
+        httpd.drained.wait()
 
 
 if __name__ == '__main__':
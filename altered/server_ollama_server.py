@@ -1,83 +1,69 @@
 """
 server_ollama_server.py
-Calls the Ollama server with timeout handling. Retries in case of a timeout.
+Calls the Ollama server through the RetryEngine (model_retry.py). Every attempt is bounded
+by the http timeout of the pooled client, so no hung threads are left behind.
 """
 
 import subprocess
-import threading
-from ollama import Client
 from colorama import Fore, Style
 
 import altered.model_params as msts
+from altered.model_client_pool import clients
+from altered.model_retry import RetryEngine
 import altered.settings as sts
 
 
 class OllamaCall:
 
-    timeout: int = msts.config.params.get('timeout') # ollama server hangup timeout
-    max_retries: int = msts.config.params.get('max_retries') # retries after hangup
+    # per attempt deadline in seconds and attempts per call, None: models_servers.yml params
+    timeout: int = None
+    max_retries: int = None
     prc_name = 'ollama_llama_server.exe'
+    # client functions that do not take a prompt, i.e. embed(input=[...])
+    input_keys = {'embed': 'input'}
 
     def __init__(self, *args, **kwargs):
         """
-        Initializes the OllamaCall class with the Ollama client.
+        Initializes the OllamaCall class with the Ollama client and its retry engine.
+        params.retry.kill_on_open restarts a hung Ollama process once its breaker opens.
         """
-        self.client = Client(host=msts.config.params.get('ollama_host'))
+        self.host = msts.config.params.get('ollama_host')
+        if self.timeout is None:
+            self.timeout = msts.config.params.get('timeout')
+        if self.max_retries is None:
+            self.max_retries = msts.config.params.get('max_retries')
+        self.client = clients.get(self.host, timeout=self.timeout)
+        retry = dict(msts.config.params.get('retry') or {})
+        kill_on_open = retry.pop('kill_on_open', False)
+        self.retry = RetryEngine(   max_retries=self.max_retries, **retry,
+                                    on_open=self.execute_timeout if kill_on_open else None,
+                    )
 
     def execute(self, func: str, prompt: str, params: dict) -> dict:
         """
-        Executes the function call to the Ollama server with timeout handling.
+        Executes the function call to the Ollama server with retries and backoff.
 
         Args:
             func (str): The function to call on the Ollama client.
-            prompt (str): The prompt to be sent to Ollama.
+            prompt (str): The prompt (or list of inputs for embed) to be sent to Ollama.
             params (dict): Additional parameters for the Ollama call.
 
         Returns:
-            dict: The response from the Ollama server or an error response if timed out.
+            dict: The response from the Ollama server or an error response.
         """
         response = {}
-        attempts = 1
-        while attempts <= self.max_retries:
-            thread = threading.Thread(
-                target=self._call_ollama_server, 
-                args=(func, prompt, params, response)
-            )
-            thread.start()
-            thread.join(timeout=self.timeout)
-            if thread.is_alive():
-                print(
-                        f"{Fore.YELLOW}Ollama server is unresponsive. "
-                        f"Executing timeout handling...{Fore.RESET}"
-                )
-                self.execute_timeout()
-                attempts += 1
-                print(f"{Fore.YELLOW}Retrying {attempts}/{self.max_retries}{Fore.RESET}")
-            else:
-                break
-        if attempts > self.max_retries:
-            response['error'] = (
-                f"Request timed out after {self.timeout * self.max_retries} seconds"
-            )
-        return response
-
-    def _call_ollama_server(self, func: str, prompt: str, params: dict, response: dict):
-        """
-        Calls the specified function on the Ollama client.
-
-        Args:
-            func (str): The function to call on the Ollama client.
-            prompt (str): The prompt to be sent to Ollama.
-            params (dict): Additional parameters for the Ollama call.
-            response (dict): A reference dictionary to store the server response.
-        """
         try:
-            response_data = getattr(self.client, func)(prompt=prompt, **params)
-            response.update(response_data)
+            prompt = {self.input_keys.get(func, 'prompt'): prompt}
+            response.update(self.retry.call(self.host, getattr(self.client, func),
+                                                                    **prompt, **params))
         except Exception as e:
-            response['error'] = str(e)
+            response['error'] = f"{type(e).__name__}: {e}"
+        return response
+
+    def stats(self, *args, **kwargs) -> dict:
+        return self.retry.stats()
 
-    def execute_timeout(self):
+    def execute_timeout(self, *args, **kwargs):
         """
         Executes the timeout handling by running a kill command for the Ollama process.
         """
@@ -54,6 +54,11 @@ init_event_logger(event_logs_path, event_logs_name)
 
 # name of table data when stored to disk
 data_dir = os.path.join(resources_dir, "data")
+# on-disk model response cache (see model_cache.py)
+cache_dir = os.path.join(resources_dir, "cache")
+model_cache_path = os.path.join(cache_dir, "model_responses.sqlite")
+# model request history for adaptive keep_alive (see model_residency.py)
+model_residency_path = os.path.join(cache_dir, "model_residency.json")
 max_files, data_file_exts = 100, {'csv', 'npy'}
 time_stamp_regex = r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}"
 data_regex = rf"^{time_stamp_regex}\.[a-z]{3,4}$"
@@ -0,0 +1,99 @@
+# test_api_profile_imports.py
+
+import subprocess, sys
+import unittest
+from unittest import mock
+# test package imports
+import altered.settings as sts
+from altered.api_profile_imports import parse_importtime, profile, get_targets
+from altered.hlp_lazy import lazy_import, lazy_instance
+
+
+class Test_ProfileImports(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   _io\n"
+            "import time:      2000 |       2000 |     yaml.error\n"
+            "import time:     23000 |      25000 |   yaml\n"
+            "import time:      5000 |      30000 | altered.model_params\n"
+        )
+
+    def test_parse_importtime(self, *args, **kwargs):
+        rows = parse_importtime(self.stderr)
+        self.assertEqual([row['module'] for row in rows],
+                         ['_io', 'yaml.error', 'yaml', 'altered.model_params'])
+        self.assertEqual([row['depth'] for row in rows], [1, 2, 1, 0])
+        self.assertEqual((rows[2]['self'], rows[2]['cumulative']), (0.023, 0.025))
+
+    def test_profile(self, *args, **kwargs):
+        r = profile('altered.hlp_lazy')
+        if self.verbose:
+            print(r['packages'])
+        self.assertIsNone(r['error'])
+        self.assertIn('altered', r['packages'])
+        self.assertGreater(r['total'], 0)
+        self.assertEqual(profile('altered.no_such_api')['error'],
+                         "ModuleNotFoundError: No module named 'altered.no_such_api'")
+        targets = get_targets(file_match_regex='profile_imports')
+        self.assertEqual(targets, ['altered.__main__', 'altered.api_profile_imports'])
+
+    def test_lazy_import(self, *args, **kwargs):
+        # a module that is not imported yet runs at its first attribute access
+        name = 'altered.test.test_ut.test_api_profile_imports_lazy'
+        sys.modules.pop(name, None)
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import(name)
+        csv = sys.modules.pop('csv', None)
+        try:
+            lazy = lazy_import('csv')
+            self.assertIs(sys.modules['csv'], lazy)
+            self.assertEqual(type(lazy).__name__, '_LazyModule')
+            self.assertTrue(callable(lazy.reader))
+            self.assertIs(type(lazy), type(unittest))
+        finally:
+            if csv is not None:
+                sys.modules['csv'] = csv
+        # imported modules are returned as they are
+        self.assertIs(lazy_import('unittest'), unittest)
+
+    def test_lazy_startup(self, *args, **kwargs):
+        # the entry point reads no config and imports no heavy packages
+        r = profile('altered.__main__')
+        self.assertIsNone(r['error'])
+        for package in ('pandas', 'openai', 'playwright', 'jinja2', 'numpy'):
+            self.assertNotIn(package, r['packages'])
+        r = profile('altered.model_connect')
+        for package in ('pandas', 'openai'):
+            self.assertNotIn(package, r['packages'])
+        # nor does any module on the model call or memory path read models_servers.yml
+        modules = ('altered.api_quick', 'altered.model_connect', 'altered.model_openai_connect',
+                   'altered.data_memory', 'altered.data_stm', 'altered.data_mtm',
+                   'altered.server_ollama_server')
+        code = (f"import {', '.join(modules)}, altered.model_params as msts; "
+                f"print('config' in vars(msts))")
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                              cwd=sts.project_dir)
+        self.assertEqual(proc.stdout.strip(), 'False', proc.stderr)
+
+    def test_lazy_instance(self, *args, **kwargs):
+        built = []
+
+        class Counter:
+            def __init__(self, start: int = 0):
+                built.append(start)
+                self.value = start
+
+        counter = lazy_instance(Counter, start=3)
+        self.assertEqual(built, [])
+        self.assertEqual(counter.value, 3)
+        counter.value += 1
+        with mock.patch.object(counter, 'value', 10):
+            self.assertEqual(counter.value, 10)
+        self.assertEqual((counter.value, built), (4, [3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+# test_model_balancer.py
+
+import json, threading, time
+import unittest
+from collections import Counter
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+# test package imports
+import altered.model_params as msts
+from altered.model_balancer import LoadBalancer
+
+
+class PsHandler(BaseHTTPRequestHandler):
+    """Answers /api/ps like ollama, with one loaded model."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path != '/api/ps':
+            self.send_error(404)
+            return
+        body = json.dumps({'models': [{'name': 'llama3.2:3b'}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+class Test_LoadBalancer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PsHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.servers = {
+                        'up': {'model_address': 'http://127.0.0.1',
+                                'generate_port': cls.server.server_port},
+                        # nothing listens on port 9
+                        'down': {'model_address': 'http://127.0.0.1', 'generate_port': 9},
+                        'other': {'model_address': 'http://127.0.0.1', 'generate_port': 9},
+        }
+
+    @classmethod
+    def tearDownClass(cls, *args, **kwargs):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def mk_balancer(self, policy: str, **kwargs) -> LoadBalancer:
+        pools = {'gpus': {'policy': policy, 'servers': ['up', 'down', 'other']}}
+        return LoadBalancer(self.servers, pools, {'probe_interval': 0, 'probe_timeout': 1},
+                                **kwargs)
+
+    def test_round_robin(self, *args, **kwargs):
+        lb = self.mk_balancer('round_robin')
+        picks = [lb.pick('gpus') for _ in range(6)]
+        self.assertEqual(picks, ['up', 'down', 'other'] * 2)
+        # non pool names pass through unchanged
+        self.assertEqual(lb.pick('while-ai_0'), 'while-ai_0')
+
+    def test_least_outstanding(self, *args, **kwargs):
+        lb = self.mk_balancer('least_outstanding')
+        with lb.track('up'), lb.track('down'):
+            self.assertEqual(lb.pick('gpus'), 'other')
+        self.assertEqual(lb.stats()['up']['outstanding'], 0)
+
+    def test_latency_ewma(self, *args, **kwargs):
+        lb = self.mk_balancer('latency_ewma')
+        for name, elapsed in (('up', 0.5), ('down', 0.1), ('other', 0.3)):
+            lb.end(name, elapsed, ok=True)
+        self.assertEqual(lb.pick('gpus'), 'down')
+        lb.state('down').outstanding = 5
+        self.assertEqual(lb.pick('gpus'), 'other')
+
+    def test_ejection(self, *args, **kwargs):
+        lb = self.mk_balancer('round_robin', max_failures=2, eject_time=0.2)
+        for _ in range(2):
+            with lb.track('down') as tracked:
+                tracked['ok'] = False
+        self.assertFalse(lb.stats()['down']['healthy'])
+        self.assertNotIn('down', Counter(lb.pick('gpus') for _ in range(6)))
+        # after eject_time the server gets a trial request and a success readmits it
+        time.sleep(0.25)
+        self.assertIn('down', [lb.pick('gpus') for _ in range(3)])
+        lb.end('down', 0.1, ok=True)
+        self.assertTrue(lb.stats()['down']['healthy'])
+        self.assertEqual(lb.stats()['down']['readmissions'], 1)
+
+    def test_probe_all(self, *args, **kwargs):
+        lb = self.mk_balancer('round_robin', max_failures=1)
+        probed = lb.probe_all()
+        if self.verbose:
+            print(f"{probed = }, {lb.stats() = }")
+        self.assertEqual(probed, {'down': False, 'other': False, 'up': True})
+        self.assertEqual(lb.stats()['up']['loaded_models'], ['llama3.2:3b'])
+        self.assertEqual({lb.pick('gpus') for _ in range(3)}, {'up'})
+
+    def test_probe_errors(self, *args, **kwargs):
+        lb = self.mk_balancer('round_robin', max_failures=1)
+        # a 200 answer that is no ollama json is a failed probe
+        def get(url: str, *args, **kwargs) -> httpx.Response:
+            if not url.endswith('/api/ps'):
+                raise httpx.ConnectError('refused')
+            return httpx.Response(200, text='<html>502 Bad Gateway</html>')
+        with mock.patch.object(httpx, 'get', get):
+            self.assertEqual(lb.probe('up'), False)
+        self.assertFalse(lb.stats()['up']['healthy'])
+        # an unexpected error does not end the probe thread
+        lb.params['probe_interval'], passes = 0.01, []
+        second = threading.Event()
+        def probe_all():
+            passes.append(1)
+            if len(passes) == 1:
+                raise RuntimeError('probe broke')
+            second.set()
+        with mock.patch.object(lb, 'probe_all', probe_all), mock.patch('builtins.print'):
+            threading.Thread(target=lb._probe_loop, daemon=True).start()
+            self.assertTrue(second.wait(5))
+
+    def test_alternate(self, *args, **kwargs):
+        lb = self.mk_balancer('least_outstanding')
+        lb.state('other').loaded_models = ['llama3.2:3b']
+        # pool peers with the model loaded are preferred, non members have no peers
+        self.assertEqual(lb.alternate('up', model='llama3.2:3b'), 'other')
+        self.assertEqual(lb.alternate('up', model='qwq:32b'), 'down')
+        self.assertIsNone(lb.alternate('while-ai_7'))
+        # a cancelled request is neither a success nor a failure
+        with self.assertRaises(KeyboardInterrupt), lb.track('down'):
+            raise KeyboardInterrupt
+        self.assertEqual(lb.stats()['down']['requests'], 0)
+        self.assertEqual(lb.stats()['down']['outstanding'], 0)
+
+    def test_start_probes(self, *args, **kwargs):
+        # concurrent first picks start one probe thread
+        pools = {'gpus': {'servers': ['up', 'down']}}
+        lb = LoadBalancer(self.servers, pools, {'probe_interval': 60})
+        barrier, started = threading.Barrier(8), []
+        def pick():
+            barrier.wait()
+            lb.start_probes()
+        with mock.patch.object(lb, '_probe_loop', lambda: started.append(1)):
+            threads = [threading.Thread(target=pick) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            lb.prober.join()
+        self.assertEqual(started, [1])
+
+    def test_server_by_host(self, *args, **kwargs):
+        # addresses match exactly, not by prefix
+        servers = {'while-ai_1': {'model_address': 'http://192.168.0.1', 'generate_port': 11434},
+                   'while-ai_10': {'model_address': 'http://192.168.0.10'},
+                   'while-ai_11': {'model_address': 'http://192.168.0.10', 'generate_port': 5000}}
+        with mock.patch.dict(msts.config.servers, servers, clear=True):
+            get = msts.config.get_server_by_host
+            self.assertEqual(get('http://192.168.0.10:11434/api/generate'), 'while-ai_10')
+            self.assertEqual(get('http://192.168.0.1:11434'), 'while-ai_1')
+            self.assertIsNone(get('http://192.168.0.1:5000'))
+            self.assertIsNone(get('http://192.168.0.100:11434'))
+
+    def test_unpack_alias(self, *args, **kwargs):
+        model_name, server_name = msts.config.unpack_alias(alias='l3.2_gpus')
+        self.assertEqual(model_name, 'llama3.2:3b')
+        self.assertIn(server_name, msts.config.pools['gpus']['servers'])
+
+
+if __name__ == "__main__":
+    unittest.main()
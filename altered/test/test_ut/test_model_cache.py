@@ -0,0 +1,101 @@
+# test_model_cache.py
+
+import os, shutil, time
+import unittest
+# test package imports
+import altered.settings as sts
+from altered.model_cache import ResponseCache
+
+
+class Test_ResponseCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.temp_dir = os.path.join(sts.test_data_dir, 'test_model_cache')
+        os.makedirs(cls.temp_dir, exist_ok=True)
+        cls.ctx = {
+                    'model': 'llama3.2:3b',
+                    'prompts': ['Why is the sky blue?'],
+                    'options': {'temperature': 0, 'num_ctx': 2000},
+                    'network_up_time': time.time(),
+                    'verbose': 0,
+        }
+        cls.response = {'responses': [{'response': 'Rayleigh scattering.', 'tool_call': None}]}
+
+    @classmethod
+    def tearDownClass(cls, *args, **kwargs):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def mk_cache(self, name: str, **kwargs) -> ResponseCache:
+        db_path = os.path.join(self.temp_dir, f"{name}.sqlite")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        return ResponseCache(db_path=db_path, enabled=True, **kwargs)
+
+    def test_lookup(self, *args, **kwargs):
+        cache = self.mk_cache('lookup')
+        key, response = cache.lookup(self.ctx)
+        self.assertIsNone(response)
+        cache.put(key, self.response, model=self.ctx['model'])
+        # timings and verbosity do not change the key
+        ctx = dict(self.ctx, network_up_time=time.time() + 1, verbose=2)
+        self.assertEqual(cache.lookup(ctx)[1], self.response)
+        # a fresh instance finds the entry on disk
+        disk_cache = ResponseCache(db_path=cache.db_path, enabled=True)
+        self.assertEqual(disk_cache.lookup(ctx)[1], self.response)
+        self.assertEqual(disk_cache.stats()['disk_hits'], 1)
+        # bypass flags
+        self.assertEqual(cache.lookup(ctx, use_cache=False), (None, None))
+        self.assertIsNone(cache.lookup(ctx, refresh_cache=True)[1])
+        stats = cache.stats()
+        if self.verbose:
+            print(f"{stats = }")
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_is_deterministic(self, *args, **kwargs):
+        cache = self.mk_cache('deterministic')
+        ctx = dict(self.ctx, options={'temperature': 0.3, 'num_ctx': 2000})
+        self.assertEqual(cache.lookup(ctx), (None, None))
+        self.assertEqual(cache.stats()['skipped'], 1)
+        ctx['options'] = {'temperature': 0.3, 'num_ctx': 2000, 'seed': 42}
+        self.assertIsNotNone(cache.lookup(ctx)[0])
+
+    def test_eviction(self, *args, **kwargs):
+        cache = self.mk_cache('eviction', max_memory_entries=2, max_disk_entries=3, ttl=60)
+        keys = []
+        for i in range(5):
+            key = cache.lookup(dict(self.ctx, prompts=[f"question {i}"]))[0]
+            cache.put(key, self.response)
+            keys.append(key)
+        self.assertEqual(len(cache.memory), 2)
+        count = cache.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.assertEqual(count, 3)
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[-1]))
+
+    def test_ttl(self, *args, **kwargs):
+        cache = self.mk_cache('ttl', ttl=0.1)
+        key = cache.lookup(self.ctx)[0]
+        cache.put(key, self.response)
+        time.sleep(0.2)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()['expired'], 1)
+
+    def test_errors_not_cached(self, *args, **kwargs):
+        cache = self.mk_cache('errors')
+        key = cache.lookup(self.ctx)[0]
+        cache.put(key, {'responses': [{'error': 'timed out'}]})
+        self.assertIsNone(cache.get(key))
+
+    def test_timings_not_cached(self, *args, **kwargs):
+        # a hit must not report the timings of the original call or the entry age
+        cache = self.mk_cache('timings')
+        key = cache.lookup(self.ctx)[0]
+        cache.put(key, dict(self.response, network_down_time=time.time(), server_time=2.5,
+                                            wall_time=3.1, ttft=0.4))
+        self.assertEqual(cache.get(key), self.response)
+
+
+if __name__ == "__main__":
+    unittest.main()
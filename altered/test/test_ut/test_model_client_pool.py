@@ -0,0 +1,77 @@
+# test_model_client_pool.py
+
+import asyncio, json, threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+# test package imports
+import altered.settings as sts
+from altered.model_client_pool import ClientPool
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'status': 'pong'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+class Test_ClientPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/api/get_generates"
+
+    @classmethod
+    def tearDownClass(cls, *args, **kwargs):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_get(self, *args, **kwargs):
+        pool = ClientPool()
+        client = pool.get(self.url, timeout=10)
+        self.assertIs(client, pool.get(self.url.replace('get_generates', 'embed'), timeout=10))
+        self.assertIsNot(client, pool.get(self.url, timeout=20))
+        pool.close()
+
+    def test_aget(self, *args, **kwargs):
+        pool = ClientPool()
+
+        async def get_twice():
+            aclient = pool.aget(self.url, timeout=10)
+            for _ in range(3):
+                await aclient._client.get('/ping')
+            same = aclient is pool.aget(self.url, timeout=10)
+            await pool.aclose()
+            return same
+        self.assertTrue(asyncio.run(get_twice()))
+        stats = pool.stats()[f"{pool.host_of(self.url)}|10"]
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['connections'], 1)
+
+    def test_stats(self, *args, **kwargs):
+        pool = ClientPool()
+        client = pool.get(self.url, timeout=10)
+        for _ in range(5):
+            client._client.get('/ping')
+        stats = pool.stats()[f"{pool.host_of(self.url)}|10"]
+        if self.verbose:
+            print(f"{stats = }")
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['reused'], 4)
+        pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+# test_model_coalesce.py
+
+import asyncio, threading, time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+# test package imports
+from altered.model_coalesce import SingleFlight
+from altered.model_connect import RmConnect
+
+
+class Test_SingleFlight(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.ctx = {
+                    'model': 'llama3.2:3b',
+                    'prompts': ['Why is the sky blue?'],
+                    'options': {'temperature': 0.31, 'num_ctx': 2048},
+                    'network_up_time': time.time(),
+        }
+
+    def mk_slow(self, calls: list, delay: float = 0.2):
+        def slow(prompt: str) -> dict:
+            calls.append(prompt)
+            time.sleep(delay)
+            return {'responses': [{'response': prompt.upper(), 'tool_call': None}]}
+        return slow
+
+    def test_mk_key(self, *args, **kwargs):
+        sf = SingleFlight()
+        other = dict(self.ctx, options={'temperature': 0.42, 'num_ctx': 2048},
+                                                            network_up_time=time.time() + 1)
+        # timings are noise, the sampling parameters are part of the key
+        self.assertEqual(sf.mk_key(self.ctx), sf.mk_key(dict(other, options=self.ctx['options'])))
+        self.assertNotEqual(sf.mk_key(self.ctx), sf.mk_key(other))
+        self.assertNotEqual(sf.mk_key(self.ctx), sf.mk_key(dict(self.ctx, prompts=['Why?'])))
+        # only deterministic requests are coalesced
+        self.assertFalse(sf.is_enabled(ctx=self.ctx))
+        self.assertTrue(sf.is_enabled(ctx=dict(self.ctx, options={'temperature': 0})))
+        self.assertTrue(sf.is_enabled(ctx=dict(self.ctx, options={'temperature': 0.3,
+                                                                            'seed': 42})))
+        # a request pinned to a server is not joined with one for another server
+        self.assertNotEqual(sf.mk_key(self.ctx, server='while-ai_0'),
+                            sf.mk_key(self.ctx, server='while-ai_1'))
+        self.assertNotEqual(sf.mk_key(self.ctx, server='while-ai_0'), sf.mk_key(self.ctx))
+        self.assertEqual(sf.mk_key(self.ctx, server=None), sf.mk_key(self.ctx))
+
+    def test_do(self, *args, **kwargs):
+        sf, calls = SingleFlight(), []
+        slow = self.mk_slow(calls)
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            rs = list(executor.map(lambda _: sf.do('k', slow, 'hi'), range(5)))
+        stats = sf.stats()
+        if self.verbose:
+            print(f"{stats = }")
+        self.assertEqual(calls, ['hi'])
+        self.assertEqual({r['responses'][0]['response'] for r in rs}, {'HI'})
+        self.assertEqual(sum(bool(r.get('coalesced')) for r in rs), 4)
+        # followers get copies, changing one response does not change the others
+        rs[0]['responses'][0]['response'] = 'changed'
+        self.assertEqual(rs[1]['responses'][0]['response'], 'HI')
+        self.assertEqual((stats['leaders'], stats['followers'], stats['in_flight']), (1, 4, 0))
+        # once landed, the next call is a new request
+        sf.do('k', slow, 'hi')
+        self.assertEqual(len(calls), 2)
+
+    def test_do_error(self, *args, **kwargs):
+        sf = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise ConnectionError('server down')
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(sf.do, 'k', fail) for _ in range(3)]
+        for future in futures:
+            self.assertIsInstance(future.exception(), ConnectionError)
+        self.assertEqual(sf.stats()['errors'], 1)
+
+    def test_ado(self, *args, **kwargs):
+        sf, calls = SingleFlight(), []
+
+        async def slow(prompt: str) -> dict:
+            calls.append(prompt)
+            await asyncio.sleep(0.1)
+            return {'responses': [{'response': prompt.upper(), 'tool_call': None}]}
+
+        async def run_all():
+            return await asyncio.gather(*[sf.ado('k', slow, 'hi') for _ in range(4)])
+
+        rs = asyncio.run(run_all())
+        self.assertEqual(calls, ['hi'])
+        self.assertEqual(sum(bool(r.get('coalesced')) for r in rs), 3)
+
+    def test_leader_cancelled(self, *args, **kwargs):
+        sf, calls = SingleFlight(), []
+
+        async def slow(prompt: str) -> dict:
+            calls.append(prompt)
+            await asyncio.sleep(0.1)
+            return {'responses': [{'response': prompt.upper(), 'tool_call': None}]}
+
+        async def run_all():
+            leader = asyncio.create_task(sf.ado('k', slow, 'hi'))
+            await asyncio.sleep(0.01)
+            followers = [asyncio.create_task(sf.ado('k', slow, 'hi')) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(leader, *followers, return_exceptions=True)
+
+        rs = asyncio.run(run_all())
+        # the cancellation stays with the leader, one follower calls again for the others
+        self.assertIsInstance(rs[0], asyncio.CancelledError)
+        self.assertEqual([r['responses'][0]['response'] for r in rs[1:]], ['HI'] * 3)
+        self.assertEqual(sum(bool(r.get('coalesced')) for r in rs[1:]), 2)
+        self.assertEqual((len(calls), sf.stats()['cancelled'], sf.stats()['errors']), (2, 1, 0))
+
+        # the same for threads, i.e. a KeyboardInterrupt in the leader
+        def interrupted(prompt: str) -> dict:
+            calls.append(prompt)
+            time.sleep(0.1)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return {'responses': [{'response': prompt.upper(), 'tool_call': None}]}
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(sf.do, 'k', interrupted, 'hi')]
+            time.sleep(0.01)
+            futures += [executor.submit(sf.do, 'k', interrupted, 'hi') for _ in range(2)]
+        self.assertIsInstance(futures[0].exception(), KeyboardInterrupt)
+        self.assertEqual([f.result()['responses'][0]['response'] for f in futures[1:]],
+                                                                                ['HI'] * 2)
+        self.assertEqual(len(calls), 4)
+
+    def test_rm_connect(self, *args, **kwargs):
+        calls = []
+
+        def fake_ollama(*args, ctx: dict, **kwargs) -> dict:
+            calls.append(ctx)
+            time.sleep(0.2)
+            return {'responses': [{'response': 'Rayleigh scattering.', 'tool_call': None}]}
+
+        def post(coalesce: bool = None, temperature: float = 0) -> dict:
+            return RmConnect()(['Why is the sky blue?'], func='_ollama', name='llama3.2:3b',
+                                        url='http://localhost:11434/api/get_generates',
+                                        coalesce=coalesce, temperature=temperature,
+                                        verbose=self.verbose)
+
+        with mock.patch.object(RmConnect, '_ollama', side_effect=fake_ollama):
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                list(executor.map(lambda _: post(), range(3)))
+            self.assertEqual(len(calls), 1)
+            # per call opt out
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                list(executor.map(lambda _: post(coalesce=False), range(3)))
+            self.assertEqual(len(calls), 4)
+            # randomized samples are independent answers
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                list(executor.map(lambda _: post(temperature=None), range(3)))
+            self.assertEqual(len(calls), 7)
+            # requests for different servers are all sent
+            def post_to(server: str) -> dict:
+                return RmConnect()(['Why is the sky blue?'], func='_ollama', name='llama3.2:3b',
+                                        url='http://localhost:11434/api/get_generates',
+                                        server=server, temperature=0, verbose=self.verbose)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(post_to, ['while-ai_0', 'while-ai_1']))
+            self.assertEqual(len(calls), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,16 @@
 # test_model_connect.py
 import sys
+import asyncio
 import os, re, shutil, sys, time, yaml
 import unittest
+from unittest import mock
 from tabulate import tabulate as tb
 # test package imports
 import altered.settings as sts
 
-from altered.model_connect import SingleModelConnect
+from altered.model_connect import SingleModelConnect, RmConnect
+from altered.model_metrics import metrics
+from altered.model_tokens import tokens
 
 class Test_ModelConnect(unittest.TestCase):
     @classmethod
@@ -64,6 +68,124 @@ class Test_ModelConnect(unittest.TestCase):
         # tests and asserts
         # self.assertEqual(self.msg, expected)
 
+    def test_apost(self, *args, **kwargs):
+        prompts = ['Why is the sky blue?', 'Why is the sky not green?']
+        spans = []
+
+        async def fake_acall(*args, **kwargs):
+            start = time.time()
+            await asyncio.sleep(0.2)
+            spans.append((start, time.time()))
+            return {'responses': [{'response': f"{args[0][0]} Rayleigh scattering.",
+                                                                        'tool_call': None}]}
+
+        async def post_all():
+            return await asyncio.gather(*[
+                                self.m_con.apost(   [prompt],
+                                                    alias='l3.2_0',
+                                                    num_predict = 100,
+                                                    service_endpoint='get_generates',
+                                                    verbose=self.verbose,
+                                )
+                                for prompt in prompts])
+        with mock.patch.object(RmConnect, 'acall', side_effect=fake_acall):
+            rs = asyncio.run(post_all())
+        self.assertEqual(len(rs), len(prompts))
+        for prompt, r in zip(prompts, rs):
+            self.assertEqual(r['model'], 'llama3.2:3b')
+            self.assertEqual(r['responses'][0]['response'], f"{prompt} Rayleigh scattering.")
+        # both posts were in flight at the same time
+        (start_0, end_0), (start_1, end_1) = sorted(spans)
+        self.assertLess(start_1, end_0)
+
+    def test_stream(self, *args, **kwargs):
+        chunks = ['The sky ', 'is blue ', 'because of Rayleigh scattering.']
+
+        def fake_stream(*args, **kwargs):
+            time.sleep(0.05)
+            for i, chunk in enumerate(chunks):
+                yield {'response': chunk, 'done': i == len(chunks) - 1}
+
+        with mock.patch.object(RmConnect, 'stream', side_effect=fake_stream):
+            items = list(self.m_con.stream(['Why is the sky blue?'], alias='l3.2_0',
+                                                                    verbose=self.verbose))
+        self.assertEqual([item['chunk'] for item in items[:-1]], chunks)
+        self.assertTrue(items[-1]['done'])
+        r = items[-1]['response']
+        self.assertEqual(r['responses'][0]['response'], ''.join(chunks))
+        self.assertGreaterEqual(r['ttft'], 0.05)
+        self.assertEqual(self.m_con.stats.last['ttft'], r['ttft'])
+        ttfts = self.m_con.stats.summary(model='llama3.2:3b', server=r['server'])
+        self.assertGreaterEqual(ttfts[f"llama3.2:3b|{r['server']}"]['ttft']['p50'], 0.05)
+
+    def test_throughput(self, *args, **kwargs):
+        # counters like ollama reports them, durations in nanoseconds
+        timings = { 'prompt_eval_count': 400, 'prompt_eval_duration': 200_000_000,
+                    'eval_count': 100, 'eval_duration': 2_000_000_000,
+                    'load_duration': 3_000_000_000, 'total_duration': 5_300_000_000}
+
+        def fake_call(*args, **kwargs):
+            return {'responses': [{'response': 'Rayleigh scattering.', 'tool_call': None,
+                                    **timings}]}
+
+        with mock.patch.object(RmConnect, '__call__', side_effect=fake_call):
+            r = self.m_con.post(['Why is the sky blue?'], alias='l3.2_0', verbose=self.verbose)
+        self.assertEqual((r['prefill_tps'], r['decode_tps']), (2000.0, 50.0))
+        self.assertEqual(r['load_time'], 3.0)
+        self.assertTrue(r['reloaded'])
+        self.assertAlmostEqual(r['server_time'], 5.3)
+        stats = self.m_con.stats.throughput_stats()[f"llama3.2:3b|{r['server']}"]
+        if self.verbose:
+            print(f"{stats = }")
+        self.assertGreaterEqual(stats['reloads'], 1)
+        self.assertEqual(stats['decode_tps'], 50.0)
+
+    def test_explicit_server(self, *args, **kwargs):
+        # a server kwarg is passed on once, the resolved server of m_params wins
+        calls = []
+
+        def fake_call(*args, **kwargs):
+            calls.append(kwargs)
+            return {'responses': [{'response': 'Rayleigh scattering.', 'tool_call': None}]}
+
+        m_params = {'model_file': {'host': 'ollama', 'name': 'llama3.2:3b'},
+                    'url': 'http://localhost:11434', 'server': 'while-ai_1'}
+        params = SingleModelConnect.mk_connect_params(m_params, server='while-ai_0', num_predict=9)
+        self.assertEqual((params['server'], params['num_predict']), ('while-ai_1', 9))
+        with mock.patch.object(RmConnect, '__call__', side_effect=fake_call):
+            r = self.m_con.send(m_params, ['Why is the sky blue?'], server='while-ai_0')
+        self.assertEqual(r['responses'][0]['response'], 'Rayleigh scattering.')
+        self.assertEqual(calls[0]['server'], 'while-ai_1')
+
+    def test_replay_not_recorded(self, *args, **kwargs):
+        # cached and coalesced responses add no latency samples
+        def fake_call(*args, **kwargs):
+            return {'responses': [{'response': 'Rayleigh scattering.', 'tool_call': None,
+                                    'total_duration': 2_000_000_000}], 'cached': True}
+
+        with mock.patch.object(metrics, 'record') as record:
+            with mock.patch.object(RmConnect, '__call__', side_effect=fake_call):
+                r = self.m_con.post(['Why is the sky blue?'], alias='l3.2_0',
+                                                                verbose=self.verbose)
+        self.assertEqual(r['responses'][0]['response'], 'Rayleigh scattering.')
+        record.assert_not_called()
+        self.assertNotIn('total_time', r)
+
+    def test_calibrate_tokens(self, *args, **kwargs):
+        # the prompt tokens ollama counted tune the num_ctx estimate
+        prompt = 'Why is the sky blue? ' * 20
+
+        def fake_call(*args, **kwargs):
+            return {'responses': [{'response': 'Rayleigh scattering.', 'tool_call': None,
+                                    'prompt_eval_count': len(prompt) // 5}]}
+
+        with mock.patch.dict(tokens.params, {'counter': 'heuristic', 'chars_per_token': 3.0}), \
+                mock.patch.object(tokens, 'counter', tokens.counter), \
+                mock.patch.object(tokens, 'counter_ratio', tokens.counter_ratio):
+            with mock.patch.object(RmConnect, '__call__', side_effect=fake_call):
+                self.m_con.post([prompt], alias='l3.2_0', verbose=self.verbose)
+            self.assertGreater(tokens.params['chars_per_token'], 3.0)
+
     # def test_while_ai(self, *args, **kwargs):
     #     expected = False
     #     # initialize test class
@@ -0,0 +1,127 @@
+# test_model_hedge.py
+
+import asyncio, time
+import unittest
+from unittest import mock
+# test package imports
+import altered.model_params as msts
+from altered.model_balancer import LoadBalancer
+from altered.model_connect import ModelConnect, RmConnect
+from altered.model_hedge import Hedger, hedger
+from altered.model_metrics import metrics
+
+
+class Test_Hedger(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+
+    def mk_hedger(self, **kwargs) -> Hedger:
+        h = Hedger(**dict({'budget': 1.0, 'min_delay': 0.05, 'min_samples': 3}, **kwargs))
+        # every race is preceded by one delay lookup
+        h.counts['requests'] = 10
+        return h
+
+    @staticmethod
+    def mk_leg(name: str, delay: float, calls: list):
+        def leg():
+            calls.append(name)
+            time.sleep(delay)
+            return name
+        return leg
+
+    def test_run(self, *args, **kwargs):
+        h, calls = self.mk_hedger(), []
+        # fast primary, no backup request is sent
+        r = h.run(self.mk_leg('primary', 0.0, calls), self.mk_leg('backup', 0.0, calls), 0.2)
+        self.assertEqual((r, calls), (('primary', 0), ['primary']))
+        # slow primary, the backup wins
+        r = h.run(self.mk_leg('primary', 1.0, calls), self.mk_leg('backup', 0.0, calls), 0.05)
+        self.assertEqual(r, ('backup', 1))
+        self.assertEqual(h.stats()['backup_wins'], 1)
+
+    def test_run_failed_backup(self, *args, **kwargs):
+        h = self.mk_hedger()
+
+        def backup():
+            raise ConnectionError('server down')
+
+        r = h.run(self.mk_leg('primary', 0.2, []), backup, 0.05)
+        self.assertEqual(r, ('primary', 0))
+
+    def test_budget(self, *args, **kwargs):
+        h, calls = self.mk_hedger(budget=0.1), []
+        legs = self.mk_leg('primary', 0.1, calls), self.mk_leg('backup', 0.0, calls)
+        rs = [h.run(*legs, 0.01)[1] for _ in range(3)]
+        # 10 requests and a budget of 0.1 allow one hedge
+        self.assertEqual(rs, [1, 0, 0])
+        self.assertEqual(h.stats()['over_budget'], 2)
+
+    def test_arun(self, *args, **kwargs):
+        h, cancelled = self.mk_hedger(), []
+
+        async def primary():
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                cancelled.append('primary')
+                raise
+            return 'primary'
+
+        async def backup():
+            return 'backup'
+
+        async def race():
+            r = await h.arun(primary, backup, 0.05)
+            await asyncio.sleep(0)
+            return r
+
+        self.assertEqual(asyncio.run(race()), ('backup', 1))
+        self.assertEqual(cancelled, ['primary'])
+
+    def test_delay(self, *args, **kwargs):
+        h = self.mk_hedger(min_samples=3)
+        stats = ModelConnect().stats
+        model, server = 'test_hedge_model', 'while-ai_0'
+        self.assertIsNone(h.delay(stats, model, server))
+        for t in (0.1, 0.2, 0.3, 0.4, 5.0):
+            metrics.record(model, server, {'total_time': t})
+        # failed calls do not count
+        metrics.record(model, server, {'total_time': 60.0}, ok=False)
+        self.assertAlmostEqual(h.delay(stats, model, server), 3.16)
+        self.assertEqual(h.stats()['no_history'], 1)
+
+    def test_post(self, *args, **kwargs):
+        cancelled = []
+
+        async def fake_acall(*args, url: str, **kwargs) -> dict:
+            # while-ai_0 hangs, while-ai_1 answers right away
+            try:
+                await asyncio.sleep(1.0 if '192.168.0.235' in url else 0.0)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+            return {'responses': [{'response': url, 'tool_call': None}]}
+
+        for _ in range(5):
+            metrics.record('llama3.2:3b', 'while-ai_0', {'total_time': 0.05})
+        balancer = LoadBalancer(msts.config.servers, msts.config.pools, {'probe_interval': 0})
+        start = time.time()
+        with mock.patch.object(RmConnect, 'acall', side_effect=fake_acall), \
+             mock.patch.object(msts.config, 'balancer', balancer), \
+             mock.patch.dict(hedger.params, {'min_samples': 3, 'min_delay': 0.05,
+                                                                            'budget': 1.0}):
+            r = ModelConnect().post(['Why is the sky blue?'], alias='l3.2_0', hedge=True,
+                                                                        verbose=self.verbose)
+        if self.verbose:
+            print(f"{hedger.stats() = }")
+        self.assertEqual((r['server'], r['hedged']), ('while-ai_1', 'backup'))
+        self.assertIn('192.168.0.245', r['responses'][0]['response'])
+        # the hung primary was cancelled, not left to finish in the background
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(len(cancelled), 1)
+        self.assertIn('192.168.0.235', cancelled[0])
+        self.assertEqual(balancer.stats()['while-ai_0']['outstanding'], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# test_model_metrics.py
+
+import time
+import unittest
+import numpy as np
+# test package imports
+from altered.model_metrics import MetricsRegistry, RingBuffer
+
+
+class Test_MetricsRegistry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+
+    def test_ring_buffer(self, *args, **kwargs):
+        rb = RingBuffer(['a', 'b'], capacity=3)
+        for i in range(5):
+            rb.append({'a': i, 'b': None if i % 2 else i * 10})
+        self.assertEqual(len(rb), 3)
+        # the oldest rows were overwritten, order is kept
+        np.testing.assert_array_equal(rb.column('a'), [2, 3, 4])
+        self.assertTrue(np.isnan(rb.column('b')[1]))
+
+    def test_summary(self, *args, **kwargs):
+        reg = MetricsRegistry(capacity=100)
+        for i in range(1, 101):
+            reg.record('llama3.2:3b', 'while-ai_0', {'total_time': i / 100, 'eval_count': 10},
+                                                                            ok=i % 10 != 0)
+            time.sleep(0.001)
+        reg.record('llama3.2:3b', 'while-ai_1', {'total_time': 5.0})
+        s = reg.summary(server='while-ai_0')
+        if self.verbose:
+            print(f"{s = }")
+        s = s['llama3.2:3b|while-ai_0']
+        self.assertEqual(s['requests'], 100)
+        self.assertEqual(s['error_rate'], 0.1)
+        self.assertAlmostEqual(s['total_time']['p50'], 0.505, places=2)
+        self.assertAlmostEqual(s['total_time']['p99'], 0.99, places=2)
+        self.assertNotIn('ttft', s)
+        self.assertGreater(s['requests_per_sec'], 0)
+        self.assertGreater(s['tokens_per_sec'], s['requests_per_sec'])
+        self.assertEqual(len(reg.summary()), 2)
+
+    def test_constant_cost(self, *args, **kwargs):
+        reg = MetricsRegistry(capacity=64)
+        for _ in range(1000):
+            reg.record('m', 's', {'total_time': 1.0})
+        self.assertEqual(reg.summary()['m|s']['requests'], 64)
+        self.assertEqual(reg.buffers[('m', 's')].data.shape[0], 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
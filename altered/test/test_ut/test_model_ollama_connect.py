@@ -0,0 +1,82 @@
+# test_model_ollama_connect.py
+
+import asyncio
+import unittest
+# test package imports
+from altered.model_ollama_connect import OllamaConnect
+
+
+class EmbedClient:
+    """Replaces the pooled ollama client, embed returns one vector per input."""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed(self, *args, model: str, input: list, **kwargs) -> dict:
+        self.batches.append(list(input))
+        return {'embeddings': [[float(len(text)), 1.0] for text in input]}
+
+
+class AsyncEmbedClient(EmbedClient):
+
+    async def embed(self, *args, **kwargs) -> dict:
+        return EmbedClient.embed(self, *args, **kwargs)
+
+
+class Test_OllamaConnect(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.url = 'http://localhost:11434/api/get_embeddings'
+        cls.prompts = ['a' * i for i in range(1, 41)]
+        cls.ctx = {
+                    'model': 'nomic-embed-text',
+                    'prompts': cls.prompts,
+                    'service_endpoint': 'get_embeddings',
+                    'tools': [{'type': 'function'}],
+        }
+
+    def test_mk_batches(self, *args, **kwargs):
+        batches = OllamaConnect.mk_batches(['a', 'b', 'c'], max_batch_size=2)
+        self.assertEqual(batches, [['a', 'b'], ['c']])
+        # 30 characters are estimated as 10 tokens
+        texts = ['x' * 30] * 5
+        batches = OllamaConnect.mk_batches(texts, max_batch_size=32, max_batch_tokens=25)
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+        # oversized texts are not dropped
+        batches = OllamaConnect.mk_batches(['x' * 300, 'y'], max_batch_tokens=10)
+        self.assertEqual(batches, [['x' * 300], ['y']])
+
+    def test_embeddings(self, *args, **kwargs):
+        oc = OllamaConnect(url=self.url)
+        oc.client = EmbedClient()
+        r = oc(ctx=self.ctx)
+        if self.verbose:
+            print(f"{oc.client.batches = }")
+        # embeddings route despite tools, one vector per prompt in prompt order
+        self.assertEqual([resp['embedding'][0] for resp in r['responses']],
+                                                    [float(len(p)) for p in self.prompts])
+        self.assertEqual(len(oc.client.batches), 2)
+
+    def test_generate_timings(self, *args, **kwargs):
+        class GenerateClient:
+            def generate(self, *args, **kwargs) -> dict:
+                return {'response': 'Hi', 'eval_count': 3, 'eval_duration': 10, 'context': [1]}
+
+        oc = OllamaConnect(url=self.url.replace('get_embeddings', 'get_generates'))
+        oc.client = GenerateClient()
+        r = oc(ctx={'model': 'llama3.2:3b', 'prompts': ['Hi'], 'repeats': {'num': 2}})
+        self.assertEqual(r['responses'][0], {'response': 'Hi', 'tool_call': None,
+                                                'eval_count': 3, 'eval_duration': 10})
+        self.assertEqual(r['num_results'], 2)
+
+    def test_aembeddings(self, *args, **kwargs):
+        oc = OllamaConnect(url=self.url)
+        oc.aclient = AsyncEmbedClient()
+        r = asyncio.run(oc._aembeddings(self.ctx))
+        self.assertEqual(r['num_results'], len(self.prompts))
+        self.assertEqual(r['responses'][-1]['embedding'][0], float(len(self.prompts[-1])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# test_model_openai_connect.py
+
+import asyncio, json, threading, time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+# test package imports
+from altered.model_openai_connect import OpenAIConnect
+
+
+class Handler(BaseHTTPRequestHandler):
+    """OpenAI compatible stand-in, the first request fails with 503."""
+    lock = threading.Lock()
+    requests, active, max_active = 0, 0, 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            cls = type(self)
+            cls.requests += 1
+            num, cls.active = cls.requests, cls.active + 1
+            cls.max_active = max(cls.max_active, cls.active)
+        time.sleep(0.1)
+        with self.lock:
+            type(self).active -= 1
+        if num == 1:
+            return self.answer(503, {'error': {'message': 'busy'}})
+        self.answer(200, {
+            'id': f"chatcmpl-{num}", 'object': 'chat.completion', 'created': 0,
+            'model': body['model'],
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant',
+                                     'content': f"max_tokens {body.get('max_tokens')}"}}],
+        })
+
+    def answer(self, status: int, data: dict):
+        raw = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+class Test_OpenAIConnect(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/v1"
+        cls.ctx = {
+                    'model': 'gpt-4o',
+                    'messages': [{'role': 'user', 'content': 'Hi'}],
+                    'repeats': {'num': 4},
+                    'num_predict': 7,
+                    'keep_alive': '10m',
+        }
+        OpenAIConnect().retry.params['base_delay'] = 0.01
+
+    @classmethod
+    def tearDownClass(cls, *args, **kwargs):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self, *args, **kwargs):
+        Handler.requests, Handler.active, Handler.max_active = 0, 0, 0
+
+    def mk_connect(self, *args, **kwargs):
+        oc = OpenAIConnect(api_key='test', base_url=self.base_url, timeout=5)
+        oc.num_parallel = 4
+        return oc
+
+    def test_client_cache(self, *args, **kwargs):
+        self.assertIs(self.mk_connect().client, self.mk_connect().client)
+
+    def test_oai_params(self, *args, **kwargs):
+        params = OpenAIConnect._oai_params(self.ctx)
+        self.assertEqual(params['max_tokens'], 7)
+        self.assertNotIn('keep_alive', params)
+        self.assertNotIn('repeats', params)
+
+    def test_call(self, *args, **kwargs):
+        r = self.mk_connect()(ctx=self.ctx)
+        if self.verbose:
+            print(f"{r = }, {Handler.max_active = }")
+        self.assertEqual(r['num_results'], 4)
+        self.assertEqual(r['responses'][0], {'response': 'max_tokens 7', 'tool_call': None})
+        # one 503 is retried, the repeats run concurrently
+        self.assertEqual(Handler.requests, 5)
+        self.assertGreater(Handler.max_active, 1)
+
+    def test_acall(self, *args, **kwargs):
+        r = asyncio.run(self.mk_connect().__acall__(ctx=self.ctx))
+        self.assertEqual(r['num_results'], 4)
+        self.assertEqual(Handler.requests, 5)
+        self.assertGreater(Handler.max_active, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
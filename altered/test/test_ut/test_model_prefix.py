@@ -0,0 +1,76 @@
+# test_model_prefix.py
+
+import unittest
+# test package imports
+from altered.model_prefix import PrefixTracker
+from altered.renderer import Render
+
+
+class Test_PrefixTracker(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.instructs = {
+                'inputs': '<user_comment>',
+                'assi_role': 'You are a careful reviewer.',
+                'intro': 'Answer the user comment.',
+                'strats': {
+                            'name': 'review', 'description': 'Review the text.',
+                            'objective': 'Find errors.', 'your_task': 'List the errors.',
+                            'expected_words': [0, 0], 'inputs_header': 'Inputs',
+                            'inputs_intro': 'Review these inputs.', 'inputs_tag': 'inputs',
+                            'strat_input_data': None,
+                },
+        }
+
+    def mk_context(self, turn: int) -> dict:
+        """Consecutive prompts of one chat, history and comment change every turn."""
+        instructs = dict(self.instructs,
+                            strats=dict(self.instructs['strats'],
+                                        strat_input_data=f"data of turn {turn}"))
+        history = [{'role': 'user', 'content': f"question {i}"} for i in range(turn)]
+        return {
+                'prompt_title': 'thought',
+                'context': {'chat_history': history,
+                            'init_prompt': {'role': 'user', 'content': 'question 0'}},
+                'user_comment': {'user_prompt': f"question {turn}"},
+                'instructs': instructs,
+        }
+
+    def render(self, turn: int, **kwargs) -> str:
+        return Render().render(template_name='prompt.md', context=self.mk_context(turn),
+                                **kwargs)
+
+    def test_observe(self, *args, **kwargs):
+        pt = PrefixTracker()
+        self.assertEqual(pt.observe('m', 's', {'prompts': ['abcdef']}), {})
+        row = pt.observe('m', 's', {'prompts': ['abcxyz']})
+        self.assertEqual((row['shared_prefix'], row['prefix_ratio']), (3, 0.5))
+        # messages are joined, every (model, server) has its own previous prompt
+        self.assertEqual(pt.observe('m', 't', {'messages': [{'content': 'abc'}]}), {})
+        stats = pt.stats()
+        self.assertEqual(list(stats), ['m|s'])
+        self.assertEqual(stats['m|s']['prefix_ratio']['p50'], 0.5)
+
+    def test_prefix_stable(self, *args, **kwargs):
+        default, stable = PrefixTracker(), PrefixTracker()
+        for turn in range(1, 4):
+            default.observe('m', 's', {'prompts': [self.render(turn)]})
+            stable.observe('m', 's', {'prompts': [self.render(turn, prefix_stable=True)]})
+        prompt = self.render(2, prefix_stable=True)
+        if self.verbose:
+            print(prompt, default.stats(), stable.stats())
+        # instructions lead, the volatile input data follows the context
+        self.assertLess(prompt.index('Task Objective'), prompt.index('question 1'))
+        self.assertLess(prompt.index('question 1'), prompt.index('data of turn 2'))
+        self.assertGreater(stable.stats()['m|s']['shared_prefix']['mean'],
+                            default.stats()['m|s']['shared_prefix']['mean'])
+        # templates without a stable variant render unchanged
+        self.assertEqual(Render().render(template_name='i_instructs.md',
+                                            context=self.mk_context(2), prefix_stable=True),
+                         Render().render(template_name='i_instructs.md',
+                                            context=self.mk_context(2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+# test_model_residency.py
+
+import json, os, shutil, threading, time
+import unittest
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+# test package imports
+import altered.model_params as msts
+import altered.settings as sts
+from altered.model_connect import RmConnect
+from altered.model_residency import ResidencyManager, residency
+
+
+class OllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/ps with the loaded models and loads models on /api/generate."""
+    loaded = ['llama3.2:3b']
+
+    def do_GET(self):
+        self.answer({'models': [{'name': name} for name in self.loaded]})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        type(self).loaded = self.loaded + [body['model']]
+        self.answer({'model': body['model'], 'response': '', 'done': True})
+
+    def answer(self, data: dict):
+        raw = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+class Test_ResidencyManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.temp_dir = os.path.join(sts.test_data_dir, 'test_model_residency')
+        os.makedirs(cls.temp_dir, exist_ok=True)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), OllamaHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.servers = {'local': {'model_address': 'http://127.0.0.1',
+                                 'generate_port': cls.server.server_port,
+                                 'max_loaded_models': 2}}
+
+    @classmethod
+    def tearDownClass(cls, *args, **kwargs):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def setUp(self, *args, **kwargs):
+        OllamaHandler.loaded = ['llama3.2:3b']
+
+    def mk_manager(self, name: str, **kwargs) -> ResidencyManager:
+        path = os.path.join(self.temp_dir, f"{name}.json")
+        if os.path.exists(path):
+            os.remove(path)
+        return ResidencyManager(path=path, **kwargs)
+
+    def fill(self, rm: ResidencyManager, model: str, gap: float, num: int = 5,
+                    server: str = 'local') -> None:
+        now = time.time()
+        rm.history[(model, server)] = deque([now - gap * i for i in range(num, 0, -1)])
+
+    def test_keep_alive(self, *args, **kwargs):
+        rm = self.mk_manager('keep_alive', min_keep_alive=60, max_keep_alive=3600)
+        with mock.patch.dict(msts.config.servers, self.servers):
+            self.assertEqual(rm.keep_alive('llama3.2:3b', 'local'),
+                                                            rm.params['default_keep_alive'])
+            # keep_alive only reads the cached /api/ps answer
+            rm.loaded('local')
+            # hot model: three times its median gap, within the limits
+            self.fill(rm, 'llama3.2:3b', gap=100)
+            self.assertEqual(rm.keep_alive('llama3.2:3b', 'local'), 300)
+            self.fill(rm, 'llama3.2:3b', gap=5000)
+            self.assertEqual(rm.keep_alive('llama3.2:3b', 'local'), 3600)
+            # a cold model on a full host must not pin VRAM
+            OllamaHandler.loaded = ['llama3.2:3b', 'qwq:32b']
+            rm.refresh('local')
+            self.fill(rm, 'llama3.1:8b', gap=100)
+            self.assertEqual(rm.keep_alive('llama3.1:8b', 'local'), 60)
+
+    def test_persistence(self, *args, **kwargs):
+        rm = self.mk_manager('persistence')
+        rm.record('llama3.2:3b', 'local')
+        rm.save()
+        other = ResidencyManager(path=rm.path)
+        self.assertEqual(len(other.history[('llama3.2:3b', 'local')]), 1)
+
+    def test_preload(self, *args, **kwargs):
+        rm = self.mk_manager('preload', preload=3)
+        self.fill(rm, 'qwq:32b', gap=10, num=8)
+        self.fill(rm, 'nomic-embed-text', gap=10, num=2)
+        self.fill(rm, 'llama3.2:3b', gap=10, num=20)
+        self.assertEqual(rm.ranking('local'), ['llama3.2:3b', 'qwq:32b', 'nomic-embed-text'])
+        with mock.patch.dict(msts.config.servers, self.servers):
+            loaded = rm.preload()
+        if self.verbose:
+            print(f"{loaded = }")
+        # llama3.2:3b is loaded already and the host holds two models
+        self.assertEqual(loaded, {'local': ['qwq:32b']})
+        self.assertEqual(OllamaHandler.loaded, ['llama3.2:3b', 'qwq:32b'])
+
+    def test_disabled(self, *args, **kwargs):
+        # no history, no json file, no /api/ps probe and the fixed keep_alive
+        rm = self.mk_manager('disabled', enabled=False)
+        rm.record('llama3.2:3b', 'local')
+        rm.save()
+        self.assertEqual(rm.history, {})
+        self.assertFalse(os.path.exists(rm.path))
+        with mock.patch.dict(msts.config.servers, self.servers):
+            with mock.patch.object(rm, 'refresh') as refresh:
+                self.assertIsNone(rm.loaded('local'))
+                self.assertIsNone(rm.keep_alive('llama3.2:3b', 'local'))
+            refresh.assert_not_called()
+            self.assertEqual(rm.preload(servers=['local']), {})
+        # requests keep the OllamaConnect.keep_alive fallback
+        ctx = {}
+        with mock.patch.dict(residency.params, {'enabled': False}):
+            RmConnect.set_keep_alive('_ollama', 'llama3.2:3b', 'local', ctx)
+        self.assertNotIn('keep_alive', ctx)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+# test_model_retry.py
+
+import asyncio, threading, time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+# test package imports
+from altered.model_retry import RetryEngine, CircuitOpenError
+from altered.server_ollama_server import OllamaCall
+
+
+class HangingHandler(BaseHTTPRequestHandler):
+    """Simulates a hung Ollama host, answers only after the client gave up."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        time.sleep(1)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+class Flaky:
+    """Fails fails times with err, then returns 'ok'."""
+
+    def __init__(self, fails: int, err: Exception = None):
+        self.fails, self.calls = fails, 0
+        self.err = err or httpx.ConnectError('connection refused')
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls <= self.fails:
+            raise self.err
+        return 'ok'
+
+
+class Test_RetryEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.params = {'base_delay': 0.01, 'max_delay': 0.05, 'jitter': 0.5}
+
+    def test_backoff(self, *args, **kwargs):
+        engine = RetryEngine(base_delay=1, max_delay=4, jitter=0)
+        self.assertEqual([engine.backoff(a) for a in range(1, 5)], [1, 2, 4, 4])
+        engine = RetryEngine(base_delay=1, max_delay=4, jitter=0.5)
+        self.assertTrue(all(0.5 <= engine.backoff(1) <= 1.5 for _ in range(20)))
+
+    def test_call(self, *args, **kwargs):
+        engine = RetryEngine(max_retries=3, **self.params)
+        self.assertEqual(engine.call('srv', Flaky(2)), 'ok')
+        stats = engine.stats()['srv']
+        self.assertEqual((stats['attempts'], stats['retries'], stats['successes']), (3, 2, 1))
+        # retries are used up
+        with self.assertRaises(httpx.ConnectError):
+            engine.call('srv', Flaky(3))
+        # non transient errors are raised at once
+        flaky = Flaky(1, ValueError('bad request'))
+        with self.assertRaises(ValueError):
+            engine.call('srv', flaky)
+        self.assertEqual(flaky.calls, 1)
+        # max_retries 0 still makes one attempt
+        engine = RetryEngine(max_retries=0, **self.params)
+        self.assertEqual(engine.call('srv', Flaky(0)), 'ok')
+        with self.assertRaises(httpx.ConnectError):
+            engine.call('srv', Flaky(1))
+        self.assertEqual(engine.stats()['srv']['attempts'], 2)
+
+    def test_breaker(self, *args, **kwargs):
+        engine = RetryEngine(max_retries=1, failure_threshold=2, reset_timeout=0.2,
+                                **self.params)
+        for _ in range(2):
+            with self.assertRaises(httpx.ConnectError):
+                engine.call('srv', Flaky(1))
+        self.assertEqual(engine.stats()['srv']['state'], 'open')
+        flaky = Flaky(0)
+        with self.assertRaises(CircuitOpenError):
+            engine.call('srv', flaky)
+        self.assertEqual(flaky.calls, 0)
+        # a failing trial request opens the breaker again, a successful one closes it
+        time.sleep(0.25)
+        with self.assertRaises(httpx.ConnectError):
+            engine.call('srv', Flaky(1))
+        self.assertEqual(engine.stats()['srv']['state'], 'open')
+        # a cancelled trial request leaves the next one its trial
+        time.sleep(0.25)
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(engine.acall('srv', cancelled))
+        self.assertEqual(engine.stats()['srv']['state'], 'half_open')
+        self.assertEqual(engine.call('srv', flaky), 'ok')
+        self.assertEqual(engine.stats()['srv']['state'], 'closed')
+
+    def test_deadline(self, *args, **kwargs):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), HangingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = httpx.Client(base_url=f"http://127.0.0.1:{server.server_port}", timeout=0.2)
+        engine = RetryEngine(max_retries=2, **self.params)
+        num_threads = threading.active_count()
+        start = time.time()
+        with self.assertRaises(httpx.TimeoutException):
+            engine.call('hung', client.post, '/api/generate')
+        elapsed = time.time() - start
+        if self.verbose:
+            print(f"{elapsed = }, {engine.stats() = }")
+        # two attempts of 0.2s, no thread is left behind on the client side
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual(engine.stats()['hung']['timeouts'], 2)
+        self.assertLessEqual(threading.active_count(), num_threads + 2)
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+    def test_ollama_call(self, *args, **kwargs):
+        oc = OllamaCall()
+        oc.retry = RetryEngine(max_retries=2, **self.params)
+        generate = Flaky(1, httpx.ReadTimeout('timed out'))
+
+        class Client:
+            def generate(self, *args, prompt: str, **kwargs) -> dict:
+                return {'response': generate() + prompt}
+
+            def embed(self, *args, input: list, **kwargs) -> dict:
+                return {'embeddings': [[1.0]] * len(input)}
+
+        oc.client = Client()
+        self.assertEqual(oc.execute('generate', 'Hi', {}), {'response': 'okHi'})
+        self.assertEqual(len(oc.execute('embed', ['a', 'b'], {})['embeddings']), 2)
+        # errors are returned, not raised
+        generate.fails, generate.calls = 2, 0
+        self.assertIn('ReadTimeout', oc.execute('generate', 'Hi', {})['error'])
+
+
+if __name__ == "__main__":
+    unittest.main()
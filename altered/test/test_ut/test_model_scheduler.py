@@ -0,0 +1,121 @@
+# test_model_scheduler.py
+
+import asyncio, threading, time
+import unittest
+# test package imports
+from altered.model_scheduler import Lane, Scheduler, Waiter
+
+
+class Test_Scheduler(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+
+    def mk_scheduler(self, slots: int, **kwargs) -> Scheduler:
+        sc = Scheduler(**dict({'enabled': True}, **kwargs))
+        sc.lanes['gpu'] = Lane('gpu', slots)
+        return sc
+
+    def queue(self, sc: Scheduler, priority: str, order: list) -> threading.Thread:
+        def run():
+            with sc.slot('gpu', priority=priority):
+                order.append(priority)
+        thread = threading.Thread(target=run)
+        thread.start()
+        # wait until the request is queued
+        while not any(w.priority == priority for w in sc.lanes['gpu'].waiters):
+            time.sleep(0.001)
+        return thread
+
+    def test_priority_order(self, *args, **kwargs):
+        sc, order = self.mk_scheduler(1), []
+        with sc.slot('gpu', priority='background'):
+            threads = [self.queue(sc, p, order) for p in ('background', 'normal', 'interactive')]
+            self.assertEqual(sc.stats()['background']['queued'], 1)
+        for thread in threads:
+            thread.join()
+        stats = sc.stats()
+        if self.verbose:
+            print(f"{stats = }")
+        self.assertEqual(order, ['interactive', 'normal', 'background'])
+        self.assertEqual([stats[p]['served'] for p in ('interactive', 'normal', 'background')],
+                         [1, 1, 2])
+        # unrounded waits, the queued background request waited for all others
+        waits = {p: sc.waits[p].column('wait').max() for p in ('interactive', 'background')}
+        self.assertGreater(waits['background'], waits['interactive'])
+
+    def test_reserve_interactive(self, *args, **kwargs):
+        sc, order = self.mk_scheduler(2), []
+        with sc.slot('gpu', priority='background'):
+            # the second slot is kept free for user facing requests
+            thread = self.queue(sc, 'background', order)
+            with sc.slot('gpu', priority='interactive'):
+                self.assertEqual(sc.stats()['interactive']['running'], 1)
+            self.assertEqual(order, [])
+        thread.join()
+        self.assertEqual(order, ['background'])
+
+    def test_aging(self, *args, **kwargs):
+        sc, order = self.mk_scheduler(1, aging=0.01), []
+        with sc.slot('gpu', priority='normal'):
+            threads = [self.queue(sc, 'background', order)]
+            time.sleep(0.05)
+            threads.append(self.queue(sc, 'normal', order))
+        for thread in threads:
+            thread.join()
+        # the background request waited 5 aging intervals and overtakes
+        self.assertEqual(order, ['background', 'normal'])
+        # but it ranks no better than a newer interactive request
+        background, interactive = Waiter('background', 2, None), Waiter('interactive', 0, None)
+        background.enqueued -= 3600
+        now = time.time()
+        self.assertEqual(background.aged_rank(now, 10.0)[0], interactive.aged_rank(now, 10.0)[0])
+        self.assertLess(interactive.aged_rank(now, 10.0), background.aged_rank(now, 10.0))
+
+    def test_aged_backlog(self, *args, **kwargs):
+        # a backlog of aged background work does not delay a late user facing prompt
+        sc, order = self.mk_scheduler(1, aging=0.01), []
+        with sc.slot('gpu', priority='background'):
+            threads = []
+            for _ in range(5):
+                threads.append(self.queue(sc, 'background', order))
+                # queue returns once any background request waits, wait for this one
+                while len(sc.lanes['gpu'].waiters) < len(threads):
+                    time.sleep(0.001)
+            time.sleep(0.05)
+            threads.append(self.queue(sc, 'interactive', order))
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ['interactive'] + ['background'] * 5)
+
+    def test_aslot(self, *args, **kwargs):
+        sc = self.mk_scheduler(1)
+
+        async def run():
+            async with sc.aslot('gpu', priority='normal'):
+                waiting = asyncio.ensure_future(self.hold(sc))
+                await asyncio.sleep(0.01)
+                # a cancelled request leaves the queue
+                waiting.cancel()
+                await asyncio.sleep(0.01)
+                self.assertEqual(sc.lanes['gpu'].waiters, [])
+            async with sc.aslot('gpu', priority='interactive'):
+                return sc.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats['interactive']['running'], 1)
+        self.assertEqual(sc.lanes['gpu'].busy(), 0)
+
+    @staticmethod
+    async def hold(sc: Scheduler):
+        async with sc.aslot('gpu', priority='background'):
+            await asyncio.sleep(1)
+
+    def test_unknown_priority(self, *args, **kwargs):
+        with self.assertRaises(ValueError):
+            with self.mk_scheduler(1).slot('gpu', priority='urgent'):
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# test_model_tokens.py
+
+import unittest
+from unittest import mock
+# test package imports
+from altered.model_tokens import TokenCounter, register_counter
+
+
+class Test_TokenCounter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.buckets = [2048, 4096, 8192, 16384]
+
+    def test_count(self, *args, **kwargs):
+        tc = TokenCounter(counter='heuristic', chars_per_token=3.0)
+        self.assertEqual(tc.count('x' * 300), 100)
+        self.assertEqual(tc.count('x' * 300), 100)
+        self.assertEqual(tc.stats()['hits'], 1)
+        # unknown counters fall back to the heuristic
+        self.assertEqual(TokenCounter(counter='not_a_counter').params['counter'], 'heuristic')
+
+    def test_register_counter(self, *args, **kwargs):
+        register_counter('words', lambda *args, **kwargs: lambda text: len(text.split()))
+        tc = TokenCounter(counter='words')
+        self.assertEqual(tc.count('Why is the sky blue?'), 5)
+
+    def test_num_ctx(self, *args, **kwargs):
+        tc = TokenCounter(counter='heuristic', chars_per_token=3.0, ctx_buckets=self.buckets)
+        # prompts of different size map to the same bucket, so the model is not reloaded
+        sizes = [tc.num_ctx(['x' * n], context_length=32000) for n in (300, 3000, 9000)]
+        self.assertEqual(sizes, [2048, 2048, 4096])
+        self.assertEqual(tc.num_ctx([{'content': 'x' * 9000}], context_length=32000), 4096)
+        self.assertEqual(tc.num_ctx(['x' * 9000], context_length=32000, num_predict=2000),
+                                                                                        8192)
+        # context_length caps the bucket
+        self.assertEqual(tc.num_ctx(['x' * 60000], context_length=8000), 8000)
+
+    def test_calibrate(self, *args, **kwargs):
+        tc = TokenCounter(counter='heuristic', chars_per_token=3.0)
+        tc.count('x' * 400)
+        for _ in range(30):
+            tc.calibrate('x' * 400, 100)
+        self.assertAlmostEqual(tc.params['chars_per_token'], 4.0, places=1)
+        self.assertAlmostEqual(tc.count('x' * 400), 100, delta=100 * 0.05)
+        # a prompt prefix served from the KV cache reports too few tokens
+        self.assertEqual(tc.calibrate('x' * 400, 10), tc.params['chars_per_token'])
+        # a settled estimate keeps the memo, calibrating after every call costs no hits
+        hits = tc.counts['hits']
+        for _ in range(10):
+            tc.count('Why is the sky blue?')
+            tc.calibrate('x' * 400, 100)
+        self.assertEqual(tc.counts['hits'], hits + 9)
+
+    def test_largest_bucket(self, *args, **kwargs):
+        tc = TokenCounter(counter='heuristic', chars_per_token=1.0, ctx_buckets=[2048, 4096])
+        with mock.patch('builtins.print') as warn:
+            self.assertEqual(tc.to_bucket(5000), 4096)
+            warn.assert_called_once()
+            self.assertIn('largest ctx_bucket', warn.call_args[0][0])
+            # below the largest bucket context_length caps silently
+            self.assertEqual(tc.to_bucket(5000, context_length=3000), 3000)
+            warn.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+# test_pipeline_pool.py
+
+import importlib.util, time
+import unittest
+# test package imports
+import altered.settings as sts
+from altered.pipeline_pool import PipelinePool
+from altered.prompt_context_package_data import ContextPackageData
+
+
+class Pipeline:
+    """Stands in for Thought, construction is slow, requests leave state behind."""
+    built = 0
+
+    def __init__(self, name: str, *args, **kwargs):
+        time.sleep(0.01)
+        Pipeline.built += 1
+        self.name, self.data = name, None
+
+    def __call__(self, user_prompt: str, *args, **kwargs):
+        self.data = f"{self.name}: {user_prompt}"
+        return self
+
+    def reset(self, *args, **kwargs):
+        self.data = None
+
+
+class Test_PipelinePool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.pg_kwargs = {
+                            'package_info': True, 'is_package': True, 'pg_imports': True,
+                            'work_dir': sts.package_dir, 'work_file_name': 'info_files.py',
+        }
+
+    def test_borrow(self, *args, **kwargs):
+        pool, built = PipelinePool(max_idle=2), Pipeline.built
+        for i in range(5):
+            with pool.borrow(Pipeline, 'thought', kwargs_defaults='fast') as p:
+                self.assertIsNone(p.data)
+                data = p(f"question {i}").data
+        stats = pool.stats()['Pipeline']
+        if self.verbose:
+            print(f"{stats = }")
+        self.assertEqual(data, 'thought: question 4')
+        self.assertEqual(Pipeline.built - built, 1)
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (4, 1, 0.8))
+        self.assertEqual((stats['idle'], stats['in_use']), (1, 0))
+        self.assertGreaterEqual(stats['build_p50'], 0.01)
+
+    def test_profiles(self, *args, **kwargs):
+        pool = PipelinePool()
+        # concurrent requests of one profile get their own instances
+        with pool.borrow(Pipeline, 'thought', kwargs_defaults='fast') as p1:
+            with pool.borrow(Pipeline, 'thought', kwargs_defaults='fast') as p2:
+                self.assertIsNot(p1, p2)
+        with pool.borrow(Pipeline, 'thought', kwargs_defaults='fast') as p3:
+            self.assertIn(p3, (p1, p2))
+        # other profiles and constructor kwargs do not share instances
+        with pool.borrow(Pipeline, 'thought', kwargs_defaults='basic') as p4:
+            self.assertNotIn(p4, (p1, p2))
+        with pool.borrow(Pipeline, 'thought', kwargs_defaults='fast', verbose=3) as p5:
+            self.assertNotIn(p5, (p1, p2))
+        self.assertEqual(pool.stats()['Pipeline']['profiles'], 3)
+
+    def test_drop(self, *args, **kwargs):
+        pool = PipelinePool(max_uses=2)
+        # an instance whose request failed may be broken and is not reused
+        with self.assertRaises(ValueError):
+            with pool.borrow(Pipeline, 'thought') as p1:
+                raise ValueError('request failed')
+        with pool.borrow(Pipeline, 'thought') as p2:
+            self.assertIsNot(p1, p2)
+        with pool.borrow(Pipeline, 'thought') as p3:
+            self.assertIs(p2, p3)
+        # max_uses reached
+        with pool.borrow(Pipeline, 'thought') as p4:
+            self.assertIsNot(p3, p4)
+        self.assertEqual(pool.stats()['Pipeline']['dropped'], 2)
+        # a disabled pool builds every time
+        disabled = PipelinePool(enabled=False)
+        with disabled.borrow(Pipeline, 'thought') as p5:
+            with disabled.borrow(Pipeline, 'thought') as p6:
+                self.assertIsNot(p5, p6)
+        self.assertEqual(disabled.stats(), {})
+
+    def test_reset_package_data(self, *args, **kwargs):
+        # a reset instance builds the import graph again instead of extending the old one
+        pooled = ContextPackageData(**self.pg_kwargs)
+        pooled.mk_context(**self.pg_kwargs)
+        pooled.tree.matched_files.add('settings.py')
+        pooled.reset()
+        self.assertEqual((pooled.context, pooled.data.visited_files,
+                          pooled.data.incoming_edges, pooled.tree.matched_files),
+                         ({}, set(), {}, set()))
+        fresh = ContextPackageData(**self.pg_kwargs)
+        self.assertEqual(pooled.mk_context(**self.pg_kwargs), fresh.mk_context(**self.pg_kwargs))
+        # the package root is read by the constructor, so it is part of the profile
+        pool = PipelinePool()
+        self.assertNotEqual(pool.profile(ContextPackageData, 'prompt', self.pg_kwargs),
+                            pool.profile(ContextPackageData, 'prompt',
+                                         dict(self.pg_kwargs, work_dir=sts.test_data_dir)))
+
+    @unittest.skipUnless(importlib.util.find_spec('playwright'), 'prompt.py needs playwright')
+    def test_pooled_prompt(self, *args, **kwargs):
+        from altered.prompt import Prompt
+        pool = PipelinePool()
+        first = dict(self.pg_kwargs, user_prompt='What are list comprehensions?', fmt='json')
+        second = dict(first, user_prompt='How do I read a yaml file?')
+        with pool.borrow(Prompt, 'ut_Test_PipelinePool', **first) as p1:
+            p1(**first)
+        with pool.borrow(Prompt, 'ut_Test_PipelinePool', **second) as p2:
+            pooled = p2(**second).data
+        self.assertIs(p1, p2)
+        fresh = Prompt('ut_Test_PipelinePool', **second)(**second).data
+        if self.verbose:
+            print(pooled)
+        self.assertEqual(pooled, fresh)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,11 +2,13 @@
 
 import os, re, shutil, sys, time, yaml
 import unittest
+from unittest import mock
 
 # test package imports
 import altered.settings as sts
 import altered.hlp_printing as hlpp
 from altered.prompt import Prompt
+from altered.renderer import Render
 
 class Test_Prompt(unittest.TestCase):
     @classmethod
@@ -39,6 +41,16 @@ class Test_Prompt(unittest.TestCase):
                             alias=self.alias)(**self.test_data, fmt='json', alias=self.alias)
         hlpp.pretty_prompt(prompt.data, *args, verbose=2, **kwargs)
 
+    def test_prefix_stable(self, *args, **kwargs):
+        # the switch reaches the renderer, the config default applies otherwise
+        for prefix_stable in (True, None):
+            with mock.patch.object(Render, 'render', return_value='prompt') as render:
+                pr = Prompt(name='ut_Test_Prompt', *args, verbose=0, alias=self.alias)
+                pr(user_prompt='What are list comprehensions?', fmt='json',
+                                            alias=self.alias, prefix_stable=prefix_stable)
+            expected = pr.params['prefix_stable'] if prefix_stable is None else prefix_stable
+            self.assertEqual(render.call_args.kwargs['prefix_stable'], expected)
+
 
 
 if __name__ == "__main__":
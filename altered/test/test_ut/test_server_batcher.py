@@ -0,0 +1,71 @@
+# test_server_batcher.py
+
+import threading, time
+import unittest
+# test package imports
+from altered.server_batcher import MicroBatcher
+
+
+class Test_MicroBatcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+
+    def setUp(self, *args, **kwargs):
+        self.runs = []
+
+    def run_batch(self, items: list) -> list:
+        self.runs.append(list(items))
+        return [item.upper() for item in items]
+
+    def submit_all(self, mb: MicroBatcher, requests: list, key: tuple = ('ep', 'm')) -> list:
+        results = [None] * len(requests)
+
+        def submit(i: int) -> None:
+            results[i] = mb.submit(key, requests[i], self.run_batch)
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_merge(self, *args, **kwargs):
+        mb = MicroBatcher(enabled=True, max_wait=0.2, max_batch_size=100)
+        results = self.submit_all(mb, [['a', 'b'], ['c'], ['d', 'e', 'f']])
+        if self.verbose:
+            print(f"{self.runs = }, {mb.stats() = }")
+        # every caller gets its own slice, all ran as one batch
+        self.assertEqual(results, [['A', 'B'], ['C'], ['D', 'E', 'F']])
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(mb.stats()['merged'], 2)
+
+    def test_max_batch_size(self, *args, **kwargs):
+        mb = MicroBatcher(enabled=True, max_wait=5.0, max_batch_size=3)
+        start = time.time()
+        results = self.submit_all(mb, [['a', 'b'], ['c', 'd']])
+        # a full batch does not wait for max_wait
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(sorted(sum(results, [])), ['A', 'B', 'C', 'D'])
+        self.assertEqual(mb.stats()['max_batch'], 4)
+
+    def test_per_model_queues(self, *args, **kwargs):
+        mb = MicroBatcher(enabled=True, max_wait=0.1, models={'slow': {'max_wait': 0.0}})
+        self.submit_all(mb, [['a']], key=('ep', 'slow'))
+        self.submit_all(mb, [['b']], key=('ep', 'm'))
+        self.assertEqual(self.runs, [['a'], ['b']])
+        self.assertEqual(mb.limits(('ep', 'slow'))['max_wait'], 0.0)
+
+    def test_errors(self, *args, **kwargs):
+        mb = MicroBatcher(enabled=True, max_wait=0.01)
+        with self.assertRaises(ZeroDivisionError):
+            mb.submit(('ep', 'm'), ['a'], lambda items: 1 / 0)
+        # disabled batching runs every request on its own
+        mb = MicroBatcher(enabled=False)
+        self.submit_all(mb, [['a'], ['b']])
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(mb.stats()['batches'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
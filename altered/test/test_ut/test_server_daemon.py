@@ -0,0 +1,113 @@
+# test_server_daemon.py
+
+import io, os, socket, stat, tempfile, threading, time
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+# test package imports
+from altered.server_daemon import Daemon, forward, is_private, socket_path
+
+
+class EchoDaemon(Daemon):
+    """Runs a stand-in api instead of importing altered.api_<api>."""
+
+    def run(self, *args, api: str, user_prompt: str = None, work_dir: str = None, **kwargs):
+        if api == 'fail':
+            raise ValueError('model gone')
+        if api == 'slow':
+            time.sleep(0.5)
+        print(f"thinking about {user_prompt}")
+        return {'response': user_prompt.upper(), 'work_dir': work_dir, 'api': api}
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'needs Unix sockets')
+class Test_Daemon(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+
+    def mk_daemon(self) -> Daemon:
+        path = os.path.join(tempfile.mkdtemp(), 'altered.sock')
+        daemon = EchoDaemon(socket_path=path, preload=[])
+        thread = threading.Thread(target=daemon.serve, daemon=True)
+        with redirect_stdout(io.StringIO()):
+            thread.start()
+            while not os.path.exists(path):
+                time.sleep(0.01)
+        def stop():
+            daemon.shutdown()
+            thread.join(5)
+        self.addCleanup(stop)
+        return daemon
+
+    def test_forward(self, *args, **kwargs):
+        daemon = self.mk_daemon()
+        out = io.StringIO()
+        start = time.time()
+        with redirect_stdout(out):
+            served, result = forward({'api': 'thought', 'user_prompt': 'sky'}, path=daemon.path)
+        elapsed = time.time() - start
+        if self.verbose:
+            print(f"{elapsed = }, {result = }")
+        self.assertTrue(served)
+        self.assertEqual(result['response'], 'SKY')
+        # the api prints to the client, the working directory is the caller's
+        self.assertEqual(out.getvalue(), 'thinking about sky\n')
+        self.assertEqual(result['work_dir'], os.getcwd())
+        self.assertLess(elapsed, 0.5)
+        with self.assertRaises(RuntimeError) as e:
+            forward({'api': 'fail', 'user_prompt': 'sky'}, path=daemon.path)
+        self.assertIn('model gone', str(e.exception))
+        self.assertEqual((daemon.stats()['served'], daemon.stats()['errors']), (1, 1))
+        # the client gives up on a daemon that stays silent
+        with self.assertRaises(TimeoutError):
+            forward({'api': 'slow', 'user_prompt': 'sky'}, path=daemon.path, timeout=0.1)
+        # a second daemon does not take over the socket
+        with self.assertRaises(OSError):
+            EchoDaemon(socket_path=daemon.path, preload=[])
+
+    def test_fallback(self, *args, **kwargs):
+        daemon = self.mk_daemon()
+        kwargs = {'api': 'thought', 'user_prompt': 'sky'}
+        self.assertEqual(forward(kwargs, path=daemon.path + '.missing'), (False, None))
+        # some apis always run in the calling process
+        self.assertEqual(forward({'api': 'profile-imports'}, path=daemon.path), (False, None))
+        # the api would ask for the prompt on the daemon stdin
+        for prompt in (None, ''):
+            self.assertEqual(forward({'api': 'thought', 'user_prompt': prompt},
+                                                            path=daemon.path), (False, None))
+        with mock.patch.dict(os.environ, {'ALTERED_DAEMON': '0'}):
+            self.assertEqual(forward(kwargs, path=daemon.path), (False, None))
+        # a stale socket file of a stopped daemon
+        stale = os.path.join(tempfile.mkdtemp(), 'stale.sock')
+        open(stale, 'w').close()
+        os.chmod(stale, 0o600)
+        self.assertEqual(forward(kwargs, path=stale), (False, None))
+
+    def test_private(self, *args, **kwargs):
+        daemon = self.mk_daemon()
+        # the socket is private from the start, bind runs with a restrictive umask
+        self.assertEqual(stat.S_IMODE(os.stat(daemon.path).st_mode), 0o600)
+        self.assertTrue(is_private(daemon.path))
+        kwargs = {'api': 'thought', 'user_prompt': 'sky'}
+        # a socket others may use is not trusted with the prompt
+        os.chmod(daemon.path, 0o666)
+        self.assertEqual(forward(kwargs, path=daemon.path), (False, None))
+        os.chmod(daemon.path, 0o600)
+        with mock.patch.object(os, 'getuid', return_value=os.getuid() + 1):
+            self.assertEqual(forward(kwargs, path=daemon.path), (False, None))
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(forward(kwargs, path=daemon.path)[0])
+        # the daemon does not bind in a directory others can write to
+        shared = tempfile.mkdtemp()
+        os.chmod(shared, 0o777)
+        with self.assertRaises(OSError):
+            EchoDaemon(socket_path=os.path.join(shared, 'altered.sock'), preload=[])
+        # the default socket lives in a per user directory
+        with mock.patch.dict(os.environ, {'XDG_RUNTIME_DIR': '/run/user/1000'}):
+            os.environ.pop('ALTERED_DAEMON_SOCKET', None)
+            self.assertEqual(socket_path(), '/run/user/1000/altered.sock')
+
+
+if __name__ == "__main__":
+    unittest.main()
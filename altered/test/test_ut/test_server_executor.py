@@ -0,0 +1,91 @@
+# test_server_executor.py
+
+import asyncio, os, time
+import unittest
+# test package imports
+from altered.server_executor import ApiExecutor, Saturated, Throttled
+
+# the executor imports this module and calls main like an api module
+module_name = 'altered.test.test_ut.test_server_executor'
+
+
+def main(*args, delay: float = 0.0, **kwargs) -> dict:
+    time.sleep(delay)
+    return {'response': 'done', 'pid': os.getpid()}
+
+
+class Test_ApiExecutor(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+
+    def mk_executor(self, **kwargs) -> ApiExecutor:
+        ex = ApiExecutor(**dict({'process_apis': [], 'apis': {}}, **kwargs))
+        self.addCleanup(ex.shutdown)
+        return ex
+
+    def test_loop_stays_free(self, *args, **kwargs):
+        ex = self.mk_executor()
+
+        async def run():
+            call = asyncio.ensure_future(ex.run('slow', module_name, {'delay': 0.5}))
+            start = time.time()
+            # the loop keeps serving while main blocks its worker thread
+            await asyncio.sleep(0.05)
+            ticked = time.time() - start
+            result, wait = await call
+            return ticked, result, wait
+
+        ticked, result, wait = asyncio.run(run())
+        self.assertLess(ticked, 0.3)
+        self.assertEqual(result['response'], 'done')
+        self.assertLess(wait, 0.1)
+
+    def test_limits(self, *args, **kwargs):
+        ex = self.mk_executor(limit=1, max_queue=1)
+
+        async def run():
+            first = asyncio.ensure_future(ex.run('thought', module_name, {'delay': 0.3}))
+            await asyncio.sleep(0.05)
+            second = asyncio.ensure_future(ex.run('thought', module_name, {}))
+            await asyncio.sleep(0.05)
+            with self.assertRaises(Throttled):
+                await ex.run('thought', module_name, {})
+            # other apis have their own limit
+            other, _ = await ex.run('info', module_name, {})
+            (_, w1), (_, w2) = await first, await second
+            return w1, w2, other
+
+        w1, w2, other = asyncio.run(run())
+        stats = ex.stats()
+        if self.verbose:
+            print(f"{stats = }")
+        self.assertGreater(w2, 0.1)
+        self.assertEqual(other['response'], 'done')
+        self.assertEqual((stats['thought']['served'], stats['thought']['throttled']), (2, 1))
+        self.assertGreater(stats['thought']['wait_p90'], 0.1)
+
+    def test_saturated(self, *args, **kwargs):
+        ex = self.mk_executor(limit=1, queue_timeout=0.1)
+
+        async def run():
+            first = asyncio.ensure_future(ex.run('thought', module_name, {'delay': 0.5}))
+            await asyncio.sleep(0.05)
+            with self.assertRaises(Saturated) as e:
+                await ex.run('thought', module_name, {})
+            await first
+            return e.exception
+
+        e = asyncio.run(run())
+        self.assertEqual(e.status_code, 503)
+        self.assertEqual(ex.stats()['thought']['timeouts'], 1)
+
+    def test_process_pool(self, *args, **kwargs):
+        ex = self.mk_executor(process_apis=['prompt'], process_workers=1)
+        result, _ = asyncio.run(ex.run('prompt', module_name, {}))
+        self.assertNotEqual(result['pid'], os.getpid())
+        self.assertEqual(ex.stats()['prompt']['pool'], 'process')
+
+
+if __name__ == "__main__":
+    unittest.main()
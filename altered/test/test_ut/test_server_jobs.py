@@ -0,0 +1,125 @@
+# test_server_jobs.py
+
+import os, tempfile, threading, time
+import unittest
+# test package imports
+import altered.logs_timeit as logs_timeit
+from altered.server_executor import Saturated
+from altered.server_jobs import JobManager
+
+# jobs import this module and call stream (or main) like an api module
+module_name = 'altered.test.test_ut.test_server_jobs'
+# stream waits for this event before it yields its last chunks
+release = threading.Event()
+
+
+@logs_timeit.timed("test_server_jobs.render")
+def render(*args, **kwargs) -> None:
+    time.sleep(0.01)
+
+
+def stream(*args, **kwargs):
+    # like api_thought.stream, which passes stream=True on to Thought.think
+    yield from generate(*args, stream=True, **kwargs)
+
+
+def generate(*args, stream: bool, chunks: int = 3, hold: bool = False, fail: bool = False,
+                **kwargs):
+    render()
+    for i in range(chunks):
+        if hold and i == 1:
+            release.wait(5)
+        yield {'chunk': f"part {i} ", 'done': False}
+    if fail:
+        raise ValueError('model gone')
+    yield {'done': True, 'response': ''.join(f"part {i} " for i in range(chunks)).strip()}
+
+
+def main(*args, delay: float = 0.0, **kwargs) -> str:
+    time.sleep(delay)
+    return 'main done'
+
+
+class Test_JobManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+
+    def mk_jobs(self, **kwargs) -> JobManager:
+        jm = JobManager(**dict({'workers': 1, 'persist': False, 'follow_timeout': 5.0},
+                                **kwargs))
+        self.addCleanup(jm.shutdown)
+        return jm
+
+    def wait(self, jm: JobManager, job_id: str, status: str) -> dict:
+        for _ in range(500):
+            job = jm.get(job_id, result=True)
+            if job['status'] == status:
+                return job
+            time.sleep(0.01)
+        self.fail(f"job {job_id} is {job['status']}, not {status}")
+
+    def test_submit_and_follow(self, *args, **kwargs):
+        jm = self.mk_jobs()
+        release.clear()
+        job = jm.submit('test', module_name, {'hold': True, 'stream': True, 'stream_fmt': 'sse'})
+        self.assertEqual(job['status'], 'queued')
+        # partial output can be followed while the job runs
+        follow = jm.follow(job['id'])
+        self.assertEqual(next(follow), {'chunk': 'part 0 ', 'done': False})
+        self.assertEqual(jm.get(job['id'])['status'], 'running')
+        release.set()
+        items = list(follow)
+        done = self.wait(jm, job['id'], 'done')
+        if self.verbose:
+            print(f"{done = }\n{jm.stats() = }")
+        self.assertEqual([item['chunk'] for item in items[:-1]], ['part 1 ', 'part 2 '])
+        self.assertEqual(items[-1]['result'], {'response': 'part 0 part 1 part 2'})
+        self.assertTrue(items[-1]['done'])
+        self.assertEqual(done['chunks'], 3)
+        # stage timings, timed stages of the job included
+        for stage in ('wait', 'first_chunk', 'run', 'test_server_jobs.render'):
+            self.assertIn(stage, done['stages'])
+        self.assertGreaterEqual(done['stages']['test_server_jobs.render'], 0.01)
+        # main runs if streaming is not wanted
+        plain = jm.submit('test', module_name, {'stream': False})
+        self.assertEqual(self.wait(jm, plain['id'], 'done')['result'], 'main done')
+        self.assertEqual(jm.stats()['done'], 2)
+
+    def test_queue_and_cancel(self, *args, **kwargs):
+        jm = self.mk_jobs(max_queue=2)
+        release.clear()
+        running = jm.submit('test', module_name, {'hold': True})
+        self.wait(jm, running['id'], 'running')
+        queued = [jm.submit('test', module_name, {}) for _ in range(2)]
+        self.assertEqual(jm.get(queued[1]['id'])['queue_position'], 2)
+        with self.assertRaises(Saturated):
+            jm.submit('test', module_name, {})
+        self.assertEqual(jm.stats()['queue_depth'], 2)
+        # a queued job is cancelled at once, a streamed one at its next chunk
+        self.assertEqual(jm.cancel(queued[0]['id'])['status'], 'cancelled')
+        jm.cancel(running['id'])
+        release.set()
+        self.wait(jm, running['id'], 'cancelled')
+        self.wait(jm, queued[1]['id'], 'done')
+        failed = jm.submit('test', module_name, {'fail': True})
+        self.assertIn('model gone', self.wait(jm, failed['id'], 'failed')['error'])
+        stats = jm.stats()
+        self.assertEqual((stats['rejected'], stats['cancelled'], stats['failed']), (1, 2, 1))
+        self.assertIsNone(jm.get('unknown'))
+
+    def test_persist(self, *args, **kwargs):
+        db_path = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite')
+        jm = self.mk_jobs(persist=True, db_path=db_path, workers=0)
+        job = jm.submit('test', module_name, {'stream': False})
+        jm.shutdown()
+        # the job queued at shutdown runs after the restart, its result survives another
+        restarted = self.mk_jobs(persist=True, db_path=db_path)
+        self.assertEqual(self.wait(restarted, job['id'], 'done')['result'], 'main done')
+        restarted.shutdown()
+        reloaded = self.mk_jobs(persist=True, db_path=db_path, workers=0)
+        self.assertEqual(reloaded.get(job['id'], result=True)['result'], 'main done')
+
+
+if __name__ == "__main__":
+    unittest.main()
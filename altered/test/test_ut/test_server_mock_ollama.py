@@ -0,0 +1,122 @@
+# test_server_mock_ollama.py
+
+import threading, time
+import unittest
+import httpx
+import ollama
+# test package imports
+from altered.model_ollama_connect import OllamaConnect
+from altered.server_mock_ollama import MockOllama
+
+
+class Test_MockOllama(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        # 1 simulated second takes 10 ms
+        cls.params = {'port': 0, 'time_scale': 0.01, 'load_time': 5.0, 'decode_tps': 100.0,
+                      'num_predict': 10, 'seed': 0}
+
+    def mk_mock(self, **kwargs) -> MockOllama:
+        return MockOllama(**dict(self.params, **kwargs))
+
+    def test_generate(self, *args, **kwargs):
+        with self.mk_mock() as mock:
+            client = ollama.Client(mock.url)
+            first = client.generate(model='llama3.2:3b', prompt='Ping!', stream=False)
+            chunks = list(client.generate(model='llama3.2:3b', prompt='Ping!', stream=True))
+            chat = client.chat(model='llama3.2:3b', messages=[{'role': 'user', 'content': 'Hi'}])
+        if self.verbose:
+            print(f"{first = }\n{mock.stats() = }")
+        self.assertEqual(first['eval_count'], 10)
+        self.assertEqual(first['response'], ''.join(c['response'] for c in chunks))
+        # only the first request loads the model
+        self.assertEqual(first['load_duration'], 5 * 10**9)
+        self.assertEqual(chunks[-1]['load_duration'], 0)
+        self.assertTrue(chunks[-1]['done'])
+        self.assertEqual(len(chunks), 10)
+        self.assertTrue(chat['message']['content'].startswith('mock'))
+        self.assertEqual(mock.stats()['loads'], 1)
+
+    def test_prefix_cache(self, *args, **kwargs):
+        prompt = 'You are a careful reviewer. ' * 20
+        with self.mk_mock() as mock:
+            client = ollama.Client(mock.url)
+            cold = client.generate(model='llama3.2:3b', prompt=prompt + 'first question')
+            warm = client.generate(model='llama3.2:3b', prompt=prompt + 'second question')
+        self.assertLess(warm['prompt_eval_count'], cold['prompt_eval_count'] / 10)
+
+    def test_num_parallel(self, *args, **kwargs):
+        with self.mk_mock(num_parallel=2, load_time=0) as mock:
+            # repeats run as get_generates calls, 2 at a time on the host
+            oc = OllamaConnect(url=f"{mock.url}/api/get_generates")
+            ctx = {'model': 'llama3.2:3b', 'prompts': ['Ping!'], 'repeats': {'num': 4}}
+            start = time.time()
+            r = oc(ctx=ctx)
+            elapsed = time.time() - start
+            direct = ollama.Client(mock.url)
+            threads = [threading.Thread(target=direct.generate,
+                                        kwargs={'model': 'llama3.2:3b', 'prompt': 'Pong!'})
+                                                                            for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(r['responses']), 4)
+        self.assertEqual(mock.stats()['max_running'], 2)
+        # 10 tokens at 100 tokens/sec, scaled, at least two rounds of 2
+        self.assertGreaterEqual(elapsed, 2 * 0.1 * 0.01)
+
+    def test_loaded_models(self, *args, **kwargs):
+        with self.mk_mock(max_loaded_models=2, load_time=0) as mock:
+            client = ollama.Client(mock.url)
+            for model in ('llama3.2:3b', 'qwq:32b', 'nomic-embed-text'):
+                client.generate(model=model, prompt='Ping!')
+            loaded = [m['name'] for m in httpx.get(f"{mock.url}/api/ps").json()['models']]
+            client.generate(model='qwq:32b', prompt='Ping!', keep_alive=0)
+            after = [m.model for m in client.ps().models]
+        self.assertEqual(sorted(loaded), ['nomic-embed-text', 'qwq:32b'])
+        self.assertEqual(mock.stats()['evictions'], 1)
+        # keep_alive=0 unloads after the request
+        self.assertEqual(after, ['nomic-embed-text'])
+
+    def test_embed(self, *args, **kwargs):
+        with self.mk_mock(embed_dim=4) as mock:
+            client = ollama.Client(mock.url)
+            vectors = client.embed(model='nomic-embed-text', input=['a', 'b', 'a'])['embeddings']
+            r = httpx.post(f"{mock.url}/api/get_embeddings",
+                           json={'model': 'nomic-embed-text', 'prompts': ['a', 'b']}).json()
+        self.assertEqual(len(vectors[0]), 4)
+        self.assertEqual(vectors[0], vectors[2])
+        self.assertNotEqual(vectors[0], vectors[1])
+        self.assertEqual([resp['embedding'] for resp in r['responses']], vectors[:2])
+
+    def test_hang_and_busy(self, *args, **kwargs):
+        with self.mk_mock(hang_rate=1.0, hang_time=100.0, num_parallel=1,
+                                                        max_queue=1, load_time=0) as mock:
+            # a hung request runs into the client timeout
+            with self.assertRaises(httpx.TimeoutException):
+                ollama.Client(mock.url, timeout=0.2).generate(model='l', prompt='Ping!')
+            # the hung request holds the only slot, one request may queue
+            errors = []
+
+            def queued() -> None:
+                try:
+                    ollama.Client(mock.url, timeout=0.5).generate(model='l', prompt='Ping!')
+                except httpx.TimeoutException as e:
+                    errors.append(e)
+            thread = threading.Thread(target=queued, daemon=True)
+            thread.start()
+            while not mock.stats()['waiting']:
+                time.sleep(0.01)
+            with self.assertRaises(ollama.ResponseError) as e:
+                ollama.Client(mock.url).generate(model='l', prompt='Ping!')
+            # the queued request times out behind the hung one
+            thread.join(5)
+            self.assertEqual([type(error) for error in errors], [httpx.ReadTimeout])
+        self.assertEqual(e.exception.status_code, 503)
+        self.assertEqual(mock.stats()['rejected'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
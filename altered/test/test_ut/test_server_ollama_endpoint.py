@@ -0,0 +1,192 @@
+# test_server_ollama_endpoint.py
+
+import gzip, http.client, json, threading, time
+import unittest
+from collections import defaultdict
+# test package imports
+import altered.settings as sts
+from altered.server_ollama_endpoint import (Endpoints, ServiceHTTPServer,
+                                            SimpleHTTPRequestHandler)
+
+
+class SlowOllamaCall:
+    """Replaces OllamaCall, every call takes delay seconds and echoes the prompt."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = []
+
+    def execute(self, func: str, prompt: str, params: dict) -> dict:
+        self.calls.append(prompt)
+        time.sleep(self.delay)
+        if func == 'embed':
+            # one vector per input, the first value identifies the input
+            return {'embeddings': [[float(p), 0.0] for p in prompt], 'func': func}
+        return {'response': prompt, 'func': func}
+
+    def stats(self) -> dict:
+        return {}
+
+
+class Test_Endpoints(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.delay = 0.2
+
+    def mk_endpoints(self, num_parallel: int, **kwargs) -> Endpoints:
+        ep = Endpoints(**kwargs)
+        ep.ollama_call = SlowOllamaCall(self.delay)
+        ep.num_parallel = num_parallel
+        ep.prompt_counter = defaultdict(int)
+        return ep
+
+    def test_get_generates(self, *args, **kwargs):
+        ep = self.mk_endpoints(num_parallel=4)
+        start = time.time()
+        r = ep.get_generates('get_generates', prompts=['a', 'b'], repeats={'num': 2, 'agg': None},
+                                                model='llama3.2:3b')
+        elapsed = time.time() - start
+        self.assertEqual([resp['response'] for resp in r['responses']], ['a', 'a', 'b', 'b'])
+        self.assertEqual(ep.prompt_counter['get_generates'], 4)
+        # 4 calls on 4 slots run in about the time of a single call
+        self.assertLess(elapsed, 2 * self.delay)
+
+    def test_get_embeddings(self, *args, **kwargs):
+        ep = self.mk_endpoints(num_parallel=1)
+        prompts = [str(i) for i in range(70)]
+        start = time.time()
+        r = ep.get_embeddings('get_embeddings', prompts=prompts, model='nomic-embed-text',
+                                                stream=False)
+        elapsed = time.time() - start
+        self.assertEqual([resp['embedding'][0] for resp in r['responses']],
+                                                            [float(p) for p in prompts])
+        self.assertEqual(ep.prompt_counter['get_embeddings'], 70)
+        # 70 prompts are sent as 3 batches (max_batch_size 32), not as 70 calls
+        self.assertLess(elapsed, 4 * self.delay)
+
+    def test_batched_embeddings(self, *args, **kwargs):
+        ep = self.mk_endpoints(num_parallel=1, max_wait=0.1)
+        requests = [[str(i), str(i + 10)] for i in range(3)]
+        results = [None] * len(requests)
+
+        def request(i: int) -> None:
+            ep.prompt_counter = defaultdict(int)
+            results[i] = ep.get_embeddings('get_embeddings', prompts=requests[i],
+                                            model='nomic-embed-text')
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # three concurrent requests became one embed call
+        self.assertEqual(len(ep.ollama_call.calls), 1)
+        for prompts, r in zip(requests, results):
+            self.assertEqual([resp['embedding'][0] for resp in r['responses']],
+                                                            [float(p) for p in prompts])
+
+    def test_count_api(self, *args, **kwargs):
+        ep = self.mk_endpoints(num_parallel=1)
+        snapshots = []
+
+        def request() -> None:
+            for _ in range(100):
+                snapshots.append(ep.count_api('get_generates'))
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(ep.api_counter['get_generates'], 400)
+        # every response got its own count, later requests do not change it
+        self.assertEqual(sorted(s['get_generates'] for s in snapshots), list(range(1, 401)))
+        self.assertIsNot(snapshots[-1], ep.api_counter)
+
+    def test_fan_out_bounded(self, *args, **kwargs):
+        ep = self.mk_endpoints(num_parallel=2)
+        start = time.time()
+        responses = ep.fan_out('get_generates', ['a', 'b', 'c', 'd'], {})
+        elapsed = time.time() - start
+        self.assertEqual([resp['response'] for resp in responses], ['a', 'b', 'c', 'd'])
+        self.assertGreaterEqual(elapsed, 2 * self.delay)
+
+
+class Test_ServiceHTTPServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        cls.verbose = 0
+        cls.delay = 0.5
+
+    def setUp(self, *args, **kwargs):
+        self.httpd = ServiceHTTPServer(('127.0.0.1', 0), SimpleHTTPRequestHandler)
+        self.httpd.server_start_time = sts.run_time_start
+        self.httpd.params['gzip_min_size'] = 100
+        self.httpd.RequestHandlerClass.service.ollama_call = SlowOllamaCall(self.delay)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def tearDown(self, *args, **kwargs):
+        if not self.httpd.draining:
+            self.httpd.drain(timeout=5)
+
+    def connect(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection('127.0.0.1', self.httpd.server_port, timeout=10)
+
+    def post(self, conn: http.client.HTTPConnection, prompts: list, **headers) -> tuple:
+        body = json.dumps({'prompts': prompts, 'repeats': {'num': 1}, 'model': 'l'}).encode()
+        if headers.get('Content-Encoding') == 'gzip':
+            body = gzip.compress(body)
+        conn.request('POST', '/api/get_generates', body=body, headers=headers)
+        r = conn.getresponse()
+        raw = r.read()
+        if r.getheader('Content-Encoding') == 'gzip':
+            raw = gzip.decompress(raw)
+        return r.status, json.loads(raw)
+
+    def test_ping_while_busy(self, *args, **kwargs):
+        slow = threading.Thread(target=self.post, args=(self.connect(), ['a']))
+        slow.start()
+        while not self.httpd.stats()['in_flight']:
+            time.sleep(0.01)
+        start, conn = time.time(), self.connect()
+        conn.request('GET', '/ping')
+        ping = json.loads(conn.getresponse().read())
+        self.assertLess(time.time() - start, self.delay / 2)
+        self.assertEqual(ping['workers']['in_flight'], 1)
+        slow.join()
+
+    def test_keep_alive_gzip(self, *args, **kwargs):
+        conn = self.connect()
+        status, r = self.post(conn, ['a'])
+        self.assertEqual((status, r['responses'][0]['response']), (200, 'a'))
+        sock = conn.sock
+        prompts = ['Why is the sky blue? ' * 10]
+        status, r = self.post(conn, prompts, **{'Content-Encoding': 'gzip',
+                                                'Accept-Encoding': 'gzip'})
+        # the second request reused the connection, both bodies were compressed
+        self.assertIs(conn.sock, sock)
+        self.assertEqual(r['responses'][0]['response'], prompts[0])
+
+    def test_drain(self, *args, **kwargs):
+        conn = self.connect()
+        conn.request('GET', '/ping')
+        conn.getresponse().read()
+        results = []
+        slow = threading.Thread(target=lambda: results.append(self.post(self.connect(), ['a'])))
+        slow.start()
+        while not self.httpd.stats()['in_flight']:
+            time.sleep(0.01)
+        drained = []
+        threading.Thread(target=lambda: drained.append(self.httpd.drain(timeout=5))).start()
+        while not self.httpd.draining:
+            time.sleep(0.01)
+        # new requests are refused, the one in flight finishes
+        status, r = self.post(conn, ['b'])
+        self.assertEqual(status, 503)
+        slow.join()
+        self.httpd.drained.wait(5)
+        self.assertEqual(results[0][0], 200)
+        self.assertEqual(drained, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
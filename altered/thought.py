@@ -33,8 +33,23 @@ class Thought:
         self.prompt = Prompt(name, *args, **kwargs)
         self.response, self.last_response = Response(name, *args, **kwargs), None
 
+    def reset(self, *args, **kwargs):
+        """
+        Drops the state of the last request, so a pooled instance can serve the next one
+        (see pipeline_pool.py).
+        """
+        self.p, self.r, self.p_cnt, self.last_response = None, None, 0, None
+        self.prompt.reset(*args, **kwargs)
+        self.response.reset(*args, **kwargs)
+
     @sts.logs_timeit.timed("thought.Thought.think")
-    def think(self, *args, **kwargs):
+    def think(self, *args, stream:bool=False, **kwargs):
+        """
+        Prompts the model and returns the validated, filtered response dict.
+        With stream=True a generator is returned instead (see think_stream).
+        """
+        if stream:
+            return self.think_stream(*args, **kwargs)
         # we call the prompt with history since all other context is handled by prompt
         self.p = self.prompt(*args, **kwargs)
         kwargs['num_predict'] = self.p.I.context.get('num_predict', kwargs.get('num_predict'))
@@ -55,6 +70,32 @@ class Thought:
         return filtered
 
 
+    def think_stream(self, *args, **kwargs):
+        """
+        Generator version of think. Yields {'chunk': str, 'done': False} while the model
+        generates and finally {'done': True, 'response': dict} with the filtered response.
+        Streamed text can not be taken back, so unlike think, a response that fails the
+        validations is not re-prompted but ends with {'done': True, 'response': None}.
+        """
+        self.p = self.prompt(*args, **kwargs)
+        kwargs['num_predict'] = self.p.I.context.get('num_predict', kwargs.get('num_predict'))
+        self.p_cnt, self.r = 1, None
+        final_prompts, server_params = self.prep_post(*args, **kwargs)
+        for item in self.assi.stream(final_prompts, *args, **server_params):
+            if not item['done']:
+                yield item
+            else:
+                self.r = self.response(item['response'], *args, **kwargs)
+        if not self.r:
+            self.prompt.log_prompts(['Thought.think: No response.'], 'Response', self.p_cnt, *args, **kwargs)
+            print(  f"{Fore.RED}Thought.think_stream ERROR: {self.p_cnt}{Fore.RESET} "
+                    f"No valid response received!")
+            yield {'done': True, 'response': None}
+            return
+        self.last_response = self.r.get('content')
+        self.prompt.log_prompts([self.last_response], 'Response', self.p_cnt, *args, **kwargs)
+        yield {'done': True, 'response': self.filters(*args, **kwargs)}
+
     def filters(self, *args, r_filters:list=[], verbose:int=0, user_prompt:str=None, **kwargs
         ) -> dict:
         if not r_filters:
@@ -74,13 +115,17 @@ class Thought:
             return r
 
     def post(self, *args, **kwargs):
+        final_prompts, server_params = self.prep_post(*args, **kwargs)
+        # print(f"{Fore.YELLOW}Thought.post: {Fore.RESET}{final_prompts}\n\n{server_params}")
+        return self.assi.post(final_prompts, *args, **server_params)
+
+    def prep_post(self, *args, **kwargs) -> tuple:
         server_params = self.mk_model_params(*args, **kwargs)
         if self.p_cnt >= 2:
             pr = self.modify_prompt(*args, **kwargs)
         final_prompts = [pr if self.p_cnt >= 2 else self.p.data]
         self.prompt.log_prompts(final_prompts, 'Prompt', self.p_cnt, *args, **kwargs)
-        # print(f"{Fore.YELLOW}Thought.post: {Fore.RESET}{final_prompts}\n\n{server_params}")
-        return self.assi.post(final_prompts, *args, **server_params)
+        return final_prompts, server_params
 
     def modify_prompt(self, *args, verbose:int=0, **kwargs):
         """